@@ -0,0 +1,103 @@
+import os
+import shutil
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from .. import db
+from ..services import analytics, generations, index_rebuild, jobs, snapshot, vectorstore
+from ..config import settings
+
+router = APIRouter(prefix="/admin")
+
+def _resolve(name: str) -> str:
+    path = snapshot.snapshot_path(name)
+    if path is None:
+        raise HTTPException(status_code=400, detail="Invalid snapshot name.")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Snapshot not found.")
+    return path
+
+def _restore(path: str, allow_model_mismatch: bool):
+    try:
+        manifest = snapshot.import_snapshot(path, allow_model_mismatch=allow_model_mismatch)
+    except snapshot.SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", "chunks": manifest["chunks"], "uploads": manifest["uploads"]}
+
+@router.post("/snapshots", status_code=201, tags=["Admin"])
+def create_snapshot():
+    """Exports uploads, chunk texts/metadata and embeddings to a new snapshot in SNAPSHOT_DIR."""
+    name = snapshot.new_snapshot_name()
+    manifest = snapshot.export_snapshot(os.path.join(settings.SNAPSHOT_DIR, name))
+    return {"name": name, "manifest": manifest}
+
+@router.get("/snapshots", tags=["Admin"])
+def list_snapshots():
+    return snapshot.list_snapshots()
+
+@router.get("/snapshots/{name}", tags=["Admin"])
+def download_snapshot(name: str):
+    return FileResponse(_resolve(name), media_type="application/zip", filename=name)
+
+@router.post("/snapshots/{name}/restore", tags=["Admin"])
+def restore_snapshot(name: str, allow_model_mismatch: bool = False):
+    """Replaces the knowledge base with a stored snapshot, after verifying its checksums."""
+    return _restore(_resolve(name), allow_model_mismatch)
+
+@router.post("/snapshots/import", tags=["Admin"])
+def import_snapshot(file: UploadFile = File(...), allow_model_mismatch: bool = False):
+    """Uploads a snapshot file into SNAPSHOT_DIR and restores it."""
+    os.makedirs(settings.SNAPSHOT_DIR, exist_ok=True)
+    name = snapshot.new_snapshot_name()
+    path = os.path.join(settings.SNAPSHOT_DIR, name)
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    try:
+        return dict(_restore(path, allow_model_mismatch), name=name)
+    except HTTPException:
+        os.remove(path)
+        raise
+
+@router.get("/generations", tags=["Admin"])
+def get_generations():
+    """Node role, the published generations and, on replicas, the one being served."""
+    return generations.status()
+
+@router.post("/generations", status_code=201, tags=["Admin"])
+def publish_generation():
+    """Publishes the knowledge base as a new generation now (writer nodes only)."""
+    if generations.role() != "writer":
+        raise HTTPException(status_code=409, detail="Only the writer node publishes generations.")
+    return generations.publish_generation()
+
+@router.post("/audit/archive", tags=["Admin"])
+def archive_audit_log(older_than_days: int = Query(30, ge=0), db_session: Session = Depends(db.get_db)):
+    """
+    Moves raw audit log rows older than `older_than_days` to gzipped JSON Lines
+    files in ANALYTICS_ARCHIVE_DIR, partitioned by day. Analytics rollups are kept.
+    """
+    return analytics.archive_audit_log(db_session, older_than_days)
+
+@router.post("/vectorstore/rebuild", status_code=202, tags=["Admin"])
+def rebuild_vectorstore():
+    """
+    Rebuilds the chunk collection with the configured HNSW parameters and vector
+    representation, from the stored embeddings, as a background job. Queries and
+    writes keep working; the new collection takes over when it is complete.
+    """
+    if vectorstore.rebuild_target is not None:
+        raise HTTPException(status_code=409, detail="An index rebuild is already running.")
+    return jobs.submit("index_rebuild")
+
+@router.post("/retention", status_code=202, tags=["Admin"])
+def run_retention():
+    """Applies UPLOAD_RETENTION_DAYS and AUDIT_LOG_RETENTION_DAYS now, as a background job."""
+    return jobs.submit("retention")
+
+@router.post("/compaction", status_code=202, tags=["Admin"])
+def run_compaction():
+    """
+    Compacts now instead of waiting for an idle period: drops orphaned audit log
+    rows and old jobs, rewrites the quantized index, and runs VACUUM/ANALYZE.
+    """
+    return jobs.submit("compaction")
@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from .. import db
+from ..services import analytics
+
+router = APIRouter(prefix="/analytics")
+
+@router.get("/summary", tags=["Analytics"])
+def get_summary(days: int = Query(7, ge=1, le=366), db_session: Session = Depends(db.get_db)):
+    """Event counts and query latency percentiles over the last `days` days."""
+    return analytics.summary(db_session, days=days)
+
+@router.get("/timeseries", tags=["Analytics"])
+def get_timeseries(
+    period: str = Query("hour", pattern="^(hour|day)$"),
+    event_type: str = "query",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db_session: Session = Depends(db.get_db)
+):
+    """
+    Events per hour or day with mean and p50/p95/p99 latency. Defaults to the
+    last 24 hours (hourly) or 30 days (daily). Buckets are UTC.
+    """
+    return analytics.timeseries(db_session, period=period, event_type=event_type, since=since, until=until)
+
+@router.get("/top-queries", tags=["Analytics"])
+def get_top_queries(
+    days: int = Query(7, ge=1, le=366),
+    limit: int = Query(20, ge=1, le=200),
+    db_session: Session = Depends(db.get_db)
+):
+    """Most frequent questions, normalized (lowercase, punctuation removed)."""
+    return analytics.top_queries(db_session, days=days, limit=limit)
+
+@router.get("/documents", tags=["Analytics"])
+def get_document_hits(
+    days: int = Query(30, ge=1, le=366),
+    limit: int = Query(20, ge=1, le=200),
+    db_session: Session = Depends(db.get_db)
+):
+    """Documents whose chunks were retrieved for the most queries."""
+    return analytics.top_documents(db_session, days=days, limit=limit)
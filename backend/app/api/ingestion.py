@@ -1,94 +1,213 @@
 import uuid
 import os
+import shutil
+from datetime import datetime, timezone
 from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from .. import db
-from ..services import pdf_loader, text_loader, chunking, embeddings, vectorstore
+from ..services import analytics, chunking, dedup, embeddings, loaders, routing, vectorstore, admission
 from ..config import settings
 
 router = APIRouter()
 
 # --- Ingestion Pipeline ---
 
+def _update_upload(upload_id: str, **fields):
+    """Persists ingestion status/stats on the upload row from the background task."""
+    session = db.SessionLocal()
+    try:
+        session.query(db.Upload).filter(db.Upload.id == upload_id).update(fields)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"Error updating stats for upload {upload_id}: {e}")
+    finally:
+        session.close()
+
+UPSERT_BATCH_SIZE = 256
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
 def ingest_document(file_path: str, filename: str, upload_id: str):
     """
     The core ingestion pipeline that runs in the background.
-    1. Reads file content.
-    2. Extracts text.
-    3. Chunks text.
-    4. Computes embeddings.
-    5. Upserts into the vector store.
+    1. Sniffs the file format and picks a loader from the registry.
+    2. Streams text segments (pages, sections, row groups) from the loader.
+    3. Chunks the segments along their section boundaries.
+    4. Computes embeddings and upserts them in batches.
+    5. Records the document stats on the upload row.
     """
 
     try:
         print(f"Starting ingestion for {filename} (upload_id: {upload_id})")
-        
-        with open(file_path, 'rb') as f:
-            file_bytes = f.read()
-
-        # 1. Extract text based on file type
-        if filename.lower().endswith(".pdf"):
-            text = pdf_loader.extract_text_from_pdf(file_bytes)
-        elif filename.lower().endswith(".txt"):
-            text = text_loader.extract_text_from_txt(file_bytes)
-        else:
+        _update_upload(upload_id, status="processing")
+
+        # 1. Identify the format from the file content
+        format_name = loaders.sniff_format(file_path, filename)
+        if format_name is None:
             raise ValueError("Unsupported file type")
-        
-        # 2. Chunk text
-        chunks = chunking.chunk_text(text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
-
-        # 3. Embed and upsert chunks
-        if chunks:
-            vectorstore.upsert_chunks(upload_id, filename, chunks)
-            print(f"Successfully ingested {len(chunks)} chunks for {filename}.")
+
+        stats = {"chars": 0, "pages": 0}
+
+        def counted(segments):
+            for segment in segments:
+                stats["chars"] += len(segment["text"])
+                page = segment.get("metadata", {}).get("page")
+                if isinstance(page, int):
+                    stats["pages"] = max(stats["pages"], page)
+                yield segment
+
+        # 2-3. Stream segments through the chunker
+        segments = counted(loaders.load_segments(file_path, format_name))
+        chunks = chunking.chunk_segments(segments, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
+
+        # 4. Embed and upsert in batches so memory stays flat for large files,
+        # accumulating the document's routing profile along the way. Near-duplicates
+        # of stored chunks are linked to them instead of being embedded.
+        profile = routing.DocumentProfile()
+        deduplicator = dedup.ChunkDeduplicator(upload_id, filename) if settings.DEDUP_ENABLED else None
+        chunk_count = 0
+
+        def upsert(batch):
+            indices = None
+            if deduplicator is not None:
+                batch, indices = deduplicator.filter(batch, chunk_count)
+            profile.add(vectorstore.upsert_chunks(upload_id, filename, batch, start_index=chunk_count, indices=indices))
+            if deduplicator is not None:
+                deduplicator.commit()
+
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= UPSERT_BATCH_SIZE:
+                upsert(batch)
+                chunk_count += len(batch)
+                batch = []
+        if batch:
+            upsert(batch)
+            chunk_count += len(batch)
+        routing.index_document(upload_id, filename, profile, chunk_count=chunk_count)
+        duplicate_count = deduplicator.duplicates if deduplicator is not None else 0
+
+        if chunk_count:
+            print(f"Successfully ingested {chunk_count} chunks for {filename} ({format_name}), "
+                  f"{duplicate_count} linked to near-duplicates.")
         else:
             print(f"No texts chunks extracted from {filename}")
 
+        _update_upload(
+            upload_id,
+            status="ready",
+            byte_size=os.path.getsize(file_path),
+            page_count=stats["pages"] or None,
+            char_count=stats["chars"],
+            chunk_count=chunk_count,
+            duplicate_count=duplicate_count,
+            ingested_at=datetime.now(timezone.utc),
+        )
+
     except Exception as e:
         print(f"Error during ingestion for {filename}: {e}")
+        _update_upload(upload_id, status="failed", error=str(e)[:1000])
 
     finally:
         if os.path.exists(file_path):
             os.remove(file_path)
             print(f"Removed temporary file: {file_path}")
-    
 
-@router.post("/upload", status_code=202, tags=["Ingestion"])
+async def _run_admitted_ingestion(ticket: admission.StageTicket, file_path: str, filename: str, upload_id: str):
+    """
+    Waits for a free ingestion slot on the event loop, then runs the pipeline in
+    the threadpool. An upload that doesn't get a slot within
+    INGESTION_MAX_WAIT_SECONDS is marked failed.
+    """
+    if not await ticket.acquire_async(timeout=settings.INGESTION_MAX_WAIT_SECONDS):
+        print(f"Ingestion of {filename} (upload_id: {upload_id}) timed out waiting for a slot.")
+        await run_in_threadpool(_discard_unadmitted, file_path, upload_id)
+        return
+    try:
+        await run_in_threadpool(ingest_document, file_path, filename, upload_id)
+    finally:
+        ticket.release()
+
+def _discard_unadmitted(file_path: str, upload_id: str):
+    _update_upload(upload_id, status="failed", error="Timed out waiting for an ingestion slot; upload it again.")
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+@router.post(
+    "/upload",
+    status_code=202,
+    tags=["Ingestion"],
+    dependencies=[Depends(admission.rate_limit("upload"))],
+)
 async def upload_file(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db_session: Session = Depends(db.get_db)
 ):
     """
-    Uploads a PDF or TXT file, saves it, and schedules it for background processing.
+    Uploads a document (PDF, DOCX, HTML, Markdown, CSV, JSONL or plain text), saves
+    it, and schedules it for background processing. The format is detected from
+    the file content, not just its extension.
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file name provided.")
     
-    if not file.filename.lower().endswith((".pdf", ".txt")):
-        raise HTTPException(status_code=400, detail="Unsupported file type. Please upload a .pdf or .txt file.")
-    
+    # Reserve a place in the bounded ingestion queue before accepting the body
+    ticket = admission.gates["ingestion"].reserve()
+
     upload_id = str(uuid.uuid4())
  
-    # Save file temporarily to disk for processing
-    storage_path = "./storage"
-    file_path = os.path.join(storage_path, f"{upload_id}_{file.filename}")
+    # Save file temporarily to disk for processing; the body is copied in blocks
+    # (large multipart files are already spooled to disk), never read whole
+    file_path = storage_path(upload_id, file.filename)
+    try:
+        with open(file_path, 'wb') as buffer:
+            await run_in_threadpool(shutil.copyfileobj, file.file, buffer, COPY_BUFFER_SIZE)
+    except Exception:
+        ticket.release()
+        raise
 
-    with open(file_path, 'wb') as buffer:
-        buffer.write(await file.read()) 
+    return accept_upload(db_session, background_tasks, ticket, upload_id, file_path, file.filename)
 
-    # Record the upload in the database
-    new_upload = db.Upload(id=upload_id, filename=file.filename)
-    db_session.add(new_upload)
 
-    audit_log = db.AuditLog(upload_id=upload_id, event_type="upload")
-    db_session.add(audit_log)
+def storage_path(upload_id: str, filename: str) -> str:
+    return os.path.join("./storage", f"{upload_id}_{filename}")
 
-    db_session.commit()
-    db_session.refresh(new_upload)
 
-    # Schedule the background task
-    background_tasks.add_task(ingest_document, file_path, file.filename, upload_id)
+def accept_upload(db_session: Session, background_tasks: BackgroundTasks, ticket: admission.StageTicket,
+                  upload_id: str, file_path: str, filename: str) -> dict:
+    """
+    Records a file saved at `file_path` as a new upload and schedules its
+    ingestion. Used by `/upload` and by completed resumable uploads.
+    """
+    try:
+        if loaders.sniff_format(file_path, filename) is None:
+            os.remove(file_path)
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file type. Supported: {', '.join(loaders.supported_extensions())}",
+            )
+
+        # Record the upload in the database
+        new_upload = db.Upload(id=upload_id, filename=filename, status="pending", byte_size=os.path.getsize(file_path))
+        db_session.add(new_upload)
+
+        audit_log = db.AuditLog(upload_id=upload_id, event_type="upload")
+        db_session.add(audit_log)
+        analytics.record_event(db_session, "upload")
+
+        db_session.commit()
+        db_session.refresh(new_upload)
+    except Exception:
+        ticket.release()
+        raise
+
+    # Schedule the background task; it waits for a free ingestion slot
+    background_tasks.add_task(_run_admitted_ingestion, ticket, file_path, filename, upload_id)
 
 
     # Note: We can't get chunk_count here as it's processed in the background.
@@ -113,13 +232,16 @@ async def reindex_file(
     if not upload:
         raise HTTPException(status_code=404, detail="Upload ID not found.")
     
-    # 1. Delete existing vectors for this upload_id
-    vectorstore.delete_by_upload_id(upload_id)
-
-    # 2. Find the original file
-    audit_log = db.AuditLog(upload_id, event_type="reindex")
-    db_session.add(audit_log)
-    db_session.commit()
+    # 1. Delete existing vectors for this upload_id (together, see `maintenance.delete_uploads`)
+    with vectorstore.write_lock:
+        dedup.release_upload(db_session, upload_id)
+        vectorstore.delete_by_upload_id(upload_id)
+
+        # 2. Find the original file
+        audit_log = db.AuditLog(upload_id=upload_id, event_type="reindex")
+        db_session.add(audit_log)
+        analytics.record_event(db_session, "reindex")
+        db_session.commit()
 
     raise HTTPException(
         status_code=501,
@@ -0,0 +1,22 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from ..services import jobs
+
+router = APIRouter(prefix="/jobs")
+
+@router.get("", tags=["Jobs"])
+def list_jobs(
+    limit: int = Query(50, ge=1, le=500),
+    kind: Optional[str] = None,
+    status: Optional[str] = None
+):
+    """Recent background jobs (deletes, retention, compaction), newest first."""
+    return jobs.list_jobs(limit=limit, kind=kind, status=status)
+
+@router.get("/{job_id}", tags=["Jobs"])
+def get_job(job_id: str):
+    """Status, progress and result of one job."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
@@ -1,22 +1,124 @@
+import asyncio
+import json
+import time
+from typing import Optional, Set
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from .. import db
-from ..services import retrieval, generation
+from ..services import retrieval, generation, admission, sessions, analytics
 
 router = APIRouter()
 
+NO_RESULTS_ANSWER = "I couldn't find any relevant information in the uploaded document."
+# Streamed answers being generated; holds their tasks until they finish
+_producers: Set[asyncio.Task] = set()
+
 class QueryRequest(BaseModel):
     question: str
     k: int = 7
+    session_id: Optional[str] = None
+    # HNSW search breadth for this query, above the collection's ef_search (recall vs latency)
+    ef: Optional[int] = Field(None, ge=1, le=2000)
 
 class QueryResponse(BaseModel):
     query: str
     answer: str
     sources: list[dict]
     audit_id: int
+    session_id: Optional[str] = None
+    standalone_query: Optional[str] = None
+
+def _retrieve_for_session(session: sessions.ChatSession, question: str, k: int, ef: Optional[int] = None):
+    """
+    Condenses the conversation into a standalone query and retrieves for it,
+    reusing the session's cached chunks where possible. Follow-ups also keep the
+    chunks of the previous turn as candidates.
+    """
+    standalone_query = session.condense(question)
+    docs = session.cached_chunks(standalone_query)
+    if docs is None:
+        docs = retrieval.retrieve_relevant_chunks(standalone_query, k=k, ef=ef)
+
+    if sessions.is_follow_up(question):
+        seen = {doc.metadata.get("chunk_id") for doc in docs}
+        for doc in session.previous_chunks():
+            if len(docs) >= k:
+                break
+            if doc.metadata.get("chunk_id") not in seen:
+                docs.append(doc)
+    return standalone_query, docs[:k]
+
+def _open_session(session_id: Optional[str]) -> Optional[sessions.ChatSession]:
+    if not session_id:
+        return None
+    session = sessions.store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    return session
+
+def _retrieve_blocking(request: QueryRequest, session: Optional[sessions.ChatSession]):
+    if session is not None:
+        with session.lock:
+            return _retrieve_for_session(session, request.question, request.k, request.ef)
+    return request.question, retrieval.retrieve_relevant_chunks(request.question, k=request.k, ef=request.ef)
+
+async def _retrieve(request: QueryRequest, session: Optional[sessions.ChatSession]):
+    """
+    Returns the standalone query and the retrieved chunks. The retrieval slot is
+    awaited on the event loop; only the retrieval itself takes a pool thread.
+    """
+    async with admission.stage("retrieval"):
+        return await run_in_threadpool(_retrieve_blocking, request, session)
 
-@router.post("/query", response_model=QueryResponse, tags=["Query"])
+def _sources(retrieved_docs) -> list:
+    all_sources = [
+        {
+            "filename": doc.metadata.get("filename"),
+            "chunk_index": doc.metadata.get("chunk_index"),
+            "snippet": doc.page_content,
+            "char_start": doc.metadata.get("char_start"),
+            "char_end": doc.metadata.get("char_end"),
+            # Near-duplicate copies of this chunk in other files (or elsewhere in this one)
+            "duplicates": doc.metadata.get("duplicates", []),
+        } for doc in retrieved_docs
+    ]
+
+    # Only return the top 3 sources to the frontend to avoid clutter
+    return all_sources[:3]
+
+def _record(db_session: Session, request: QueryRequest, session: Optional[sessions.ChatSession],
+            standalone_query: str, answer: str, retrieved_docs, started: float) -> int:
+    """Records the turn on the chat session and the query in the audit log. Returns the audit id."""
+    if session is not None:
+        with session.lock:
+            session.record_turn(request.question, standalone_query, answer, retrieved_docs)
+        sessions.store.touch(session)
+
+    latency_ms = (time.perf_counter() - started) * 1000
+    audit_log = db.AuditLog(
+        event_type="query",
+        query_text=request.question,
+        response_text=answer,
+        latency_ms=latency_ms
+    )
+    db_session.add(audit_log)
+    analytics.record_event(
+        db_session, "query", latency_ms=latency_ms, query_text=request.question,
+        upload_ids=[doc.metadata.get("upload_id") for doc in retrieved_docs]
+    )
+    db_session.commit()
+    db_session.refresh(audit_log)
+    return audit_log.id
+
+@router.post(
+    "/query",
+    response_model=QueryResponse,
+    tags=["Query"],
+    dependencies=[Depends(admission.rate_limit("query"))],
+)
 async def query_document(
     request: QueryRequest,
     db_session: Session = Depends(db.get_db)
@@ -24,50 +126,138 @@ async def query_document(
     """
     Asks a question about the uploaded documents.
     Retrieves relevant text chunks and generates a cited answer.
+
+    Queued queries wait for their retrieval and generation slots on the event
+    loop, so a full queue holds no threadpool threads. Embedding and generation
+    block, so they run in the threadpool, where concurrent queries can still be
+    batched by the local generation engine.
     """
     if not request.question:
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    started = time.perf_counter()
+    session = _open_session(request.session_id)
     
     try:
         # Retrieve relevant chunks from the vector store
-        retrieved_docs = retrieval.retrieve_relevant_chunks(request.question, k=request.k)
+        standalone_query, retrieved_docs = await _retrieve(request, session)
 
         if not retrieved_docs:
-            answer = "I couldn't find any relevant information in the uploaded document."
+            answer = NO_RESULTS_ANSWER
             sources = []
         else:
             # 2. Generate an answer usign the retrieved context
-            answer = generation.generate_answer(request.question, retrieved_docs)
-            all_sources = [
-                {
-                    "filename": doc.metadata.get("filename"),
-                    "chunk_index": doc.metadata.get("chunk_index"),
-                    "snippet": doc.page_content,
-                    "char_start": doc.metadata.get("char_start"),
-                    "char_end": doc.metadata.get("char_end")
-                } for doc in retrieved_docs
-            ]
-
-            # Only return the top 3 sources to the frontend to avoid clutter
-            sources = all_sources[:3]
-
-        
+            async with admission.stage("generation"):
+                answer = await run_in_threadpool(generation.generate_answer, standalone_query, retrieved_docs)
+            sources = _sources(retrieved_docs)
+
         # 3. Long the query and response to the audit log
-        audit_log = db.AuditLog(
-            event_type="query",
-            query_text=request.question,
-            response_text=answer
-        )
-        db_session.add(audit_log)
-        db_session.commit()
-        db_session.refresh(audit_log)
+        audit_id = await run_in_threadpool(
+            _record, db_session, request, session, standalone_query, answer, retrieved_docs, started)
 
         return QueryResponse(
             query=request.question,
             answer=answer,
             sources=sources,
-            audit_id=audit_log.id
+            audit_id=audit_id,
+            session_id=request.session_id,
+            standalone_query=standalone_query if session is not None else None
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error during query processing: {e}")
+        raise HTTPException(status_code=500, detail=f"An internal error occured: {e}")
+
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+@router.post(
+    "/query/stream",
+    tags=["Query"],
+    dependencies=[Depends(admission.rate_limit("query"))],
+)
+async def query_document_stream(
+    request: QueryRequest,
+    db_session: Session = Depends(db.get_db)
+):
+    """
+    Same as `/query`, but the answer is streamed as server-sent events while it
+    is generated. Each event is a `data:` line with a JSON object:
+
+    - `{"type": "sources", "sources": [...], "standalone_query": ...}` first,
+    - `{"type": "token", "text": ...}` for each piece of the answer,
+    - `{"type": "done", "answer": ..., "audit_id": ...}` last. Its `answer` is
+      the full answer, which replaces the streamed text if a provider failed
+      midway and the next one answered,
+    - `{"type": "error", "detail": ...}` instead of `done` if generation failed.
+
+    Retrieval runs before the response starts, so its errors (and a full
+    generation queue) are still plain HTTP errors.
+    """
+    if not request.question:
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    started = time.perf_counter()
+    session = _open_session(request.session_id)
+    try:
+        standalone_query, retrieved_docs = await _retrieve(request, session)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error during query processing: {e}")
-        raise HTTPException(status_code=500, detail=f"An internal error occured: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An internal error occured: {e}")
+    ticket = admission.gates["generation"].reserve() if retrieved_docs else None
+
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Optional[dict]]" = asyncio.Queue()
+
+    def emit_token(text: str):
+        # Called from the generation thread
+        loop.call_soon_threadsafe(events.put_nowait, {"type": "token", "text": text})
+
+    def record(answer: str) -> int:
+        record_session = db.SessionLocal()
+        try:
+            return _record(record_session, request, session, standalone_query, answer, retrieved_docs, started)
+        finally:
+            record_session.close()
+
+    async def produce():
+        # Runs to the end even if the client goes away, so the turn is recorded
+        try:
+            if ticket is None:
+                answer = NO_RESULTS_ANSWER
+                events.put_nowait({"type": "token", "text": answer})
+            else:
+                try:
+                    if not await ticket.acquire_async(timeout=admission.gates["generation"].max_wait):
+                        raise admission.AdmissionRejected(503, "Server busy: timed out waiting for generation.",
+                                                          admission.gates["generation"].retry_after())
+                    answer = await run_in_threadpool(
+                        generation.generate_answer, standalone_query, retrieved_docs, on_token=emit_token)
+                finally:
+                    ticket.release()
+            audit_id = await run_in_threadpool(record, answer)
+            events.put_nowait({"type": "done", "answer": answer, "audit_id": audit_id, "session_id": request.session_id})
+        except Exception as e:
+            print(f"Error during streamed query processing: {e}")
+            events.put_nowait({"type": "error", "detail": getattr(e, "detail", None) or str(e)})
+        finally:
+            events.put_nowait(None)
+
+    producer = asyncio.create_task(produce())
+    _producers.add(producer)
+    producer.add_done_callback(_producers.discard)
+
+    # Reads the queue on the event loop, so an open stream holds no threadpool thread
+    async def stream():
+        yield _sse({"type": "sources", "sources": _sources(retrieved_docs),
+                    "standalone_query": standalone_query if session is not None else None})
+        while True:
+            event = await events.get()
+            if event is None:
+                return
+            yield _sse(event)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
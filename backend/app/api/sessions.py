@@ -0,0 +1,25 @@
+from fastapi import APIRouter, HTTPException
+from ..services import sessions
+
+router = APIRouter()
+
+@router.post("/sessions", status_code=201, tags=["Query"])
+def create_session():
+    """Starts a server-side conversation. Pass the returned id as `session_id` to /query."""
+    session = sessions.store.create()
+    return {"session_id": session.id}
+
+@router.get("/sessions/{session_id}", tags=["Query"])
+def get_session(session_id: str):
+    """Returns the condensed history kept for a conversation."""
+    session = sessions.store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    return session.to_dict()
+
+@router.delete("/sessions/{session_id}", tags=["Query"])
+def delete_session(session_id: str):
+    """Ends a conversation and frees its state."""
+    if not sessions.store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    return {"status": "ok"}
@@ -0,0 +1,86 @@
+import os
+import uuid
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+from .. import db
+from ..services import admission, uploads
+from .ingestion import accept_upload, storage_path
+
+router = APIRouter(prefix="/uploads")
+
+
+class CreateUploadRequest(BaseModel):
+    filename: str
+    size: int = Field(..., ge=1)
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")  # of the whole file
+
+
+@router.post("", status_code=201, tags=["Ingestion"], dependencies=[Depends(admission.rate_limit("upload"))])
+def create_upload(request: CreateUploadRequest, db_session: Session = Depends(db.get_db)):
+    """
+    Starts a resumable upload. PUT the file in `part_size` parts to
+    `/uploads/{upload_id}/parts?offset=...`, then POST `/uploads/{upload_id}/complete`.
+    """
+    filename = os.path.basename(request.filename.replace("\\", "/"))
+    if not filename:
+        raise HTTPException(status_code=400, detail="No file name provided.")
+    upload_session = uploads.create_session(db_session, str(uuid.uuid4()), filename, request.size, request.sha256)
+    return uploads.describe(db_session, upload_session)
+
+
+@router.get("/{upload_id}", tags=["Ingestion"])
+def get_upload(upload_id: str, db_session: Session = Depends(db.get_db)):
+    """Received byte ranges and the offsets of the parts still missing."""
+    return uploads.describe(db_session, uploads.get_session(db_session, upload_id))
+
+
+@router.put("/{upload_id}/parts", tags=["Ingestion"])
+async def put_part(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    x_content_sha256: Optional[str] = Header(None),
+    db_session: Session = Depends(db.get_db)
+):
+    """
+    Writes one part (the raw request body) at `offset`. With an `X-Content-SHA256`
+    header the part is only accepted if its checksum matches. Sending a part
+    again replaces it once the new copy checks out.
+    """
+    upload_session = uploads.get_session(db_session, upload_id)
+    return await uploads.write_part(db_session, upload_session, offset, request.stream(), x_content_sha256)
+
+
+@router.post("/{upload_id}/complete", status_code=202, tags=["Ingestion"])
+def complete_upload(upload_id: str, background_tasks: BackgroundTasks, db_session: Session = Depends(db.get_db)):
+    """
+    Assembles the upload once every part arrived and schedules it for ingestion
+    like `/upload`. Completing an already completed upload returns the same result;
+    while another request is completing it, the answer is 409.
+    """
+    upload_session = uploads.get_session(db_session, upload_id)
+    if upload_session.status == "completed":
+        return {"message": "File upload was already completed.", "upload_id": upload_session.id,
+                "filename": upload_session.filename}
+
+    # Reserve a place in the bounded ingestion queue first; if it's full, the parts are kept
+    ticket = admission.gates["ingestion"].reserve()
+    file_path = storage_path(upload_session.id, upload_session.filename)
+    try:
+        uploads.assemble(db_session, upload_session, file_path)
+    except Exception:
+        ticket.release()
+        raise
+
+    uploads.mark_completed(db_session, upload_session)
+    try:
+        return accept_upload(db_session, background_tasks, ticket, upload_session.id, file_path, upload_session.filename)
+    except Exception:
+        # The data file is gone now, so the session can't be completed again
+        db_session.rollback()
+        uploads.discard(db_session, upload_session)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
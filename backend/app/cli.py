@@ -0,0 +1,81 @@
+"""
+Command-line administration. Run from the `backend` directory:
+
+    python -m app.cli snapshot export backup.zip
+    python -m app.cli snapshot import backup.zip
+    python -m app.cli snapshot verify backup.zip
+    python -m app.cli audit archive --older-than-days 30
+    python -m app.cli audit backfill
+"""
+import argparse
+import json
+import sys
+
+
+def _snapshot(args) -> int:
+    from . import db
+    from .services import snapshot, vectorstore
+
+    try:
+        if args.action == "verify":
+            manifest = snapshot.verify_snapshot(args.path)
+            print(f"OK: {manifest['chunks']} chunks, {manifest['uploads']} uploads.")
+            return 0
+        db.init_db()
+        vectorstore.init_vectorstore()
+        if args.action == "export":
+            manifest = snapshot.export_snapshot(args.path)
+        else:
+            manifest = snapshot.import_snapshot(args.path, allow_model_mismatch=args.allow_model_mismatch)
+    except snapshot.SnapshotError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps({key: manifest[key] for key in ("chunks", "uploads", "embedding_model", "created_at")}))
+    return 0
+
+
+def _audit(args) -> int:
+    from . import db
+    from .services import analytics
+
+    db.init_db()
+    session = db.SessionLocal()
+    try:
+        if args.action == "archive":
+            print(json.dumps(analytics.archive_audit_log(session, args.older_than_days, args.directory)))
+        else:
+            try:
+                replayed = analytics.backfill(session)
+            except RuntimeError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                return 1
+            print(f"Replayed {replayed} audit log rows into the analytics rollups.")
+    finally:
+        session.close()
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="KaaS administration.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snapshot_parser = commands.add_parser("snapshot", help="Export, import or verify a knowledge base snapshot.")
+    snapshot_parser.add_argument("action", choices=["export", "import", "verify"])
+    snapshot_parser.add_argument("path", help="Snapshot .zip file.")
+    snapshot_parser.add_argument("--allow-model-mismatch", action="store_true",
+                                 help="Import embeddings made with a different EMBEDDING_MODEL.")
+    snapshot_parser.set_defaults(handler=_snapshot)
+
+    audit_parser = commands.add_parser("audit", help="Archive the raw audit log or backfill analytics rollups.")
+    audit_parser.add_argument("action", choices=["archive", "backfill"])
+    audit_parser.add_argument("--older-than-days", type=int, default=30,
+                              help="Archive rows older than this many days.")
+    audit_parser.add_argument("--directory", default=None, help="Archive directory (default: ANALYTICS_ARCHIVE_DIR).")
+    audit_parser.set_defaults(handler=_audit)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,11 +8,114 @@ class Settings(BaseSettings):
     
     # Vector store settings
     CHROMA_DB_DIR: str = "./chroma_db"
+    # Compressed vectors for new collections: "none", "sq8" (int8) or "pq" (product quantization).
+    # Existing collections keep the representation they were created with.
+    VECTOR_QUANTIZATION: str = "none"
+    PQ_SUBSPACES: int = 16  # bytes per vector with "pq"; must divide the embedding dimension
+    QUANTIZATION_RESCORE_FACTOR: int = 10  # candidates re-scored exactly = k * factor
+    QUANTIZATION_TRAIN_SIZE: int = 20000
+    # HNSW index of new collections (Chroma's defaults). Space, M and construction ef
+    # are fixed when the index is built: change them, then run an online rebuild.
+    # Search ef applies on startup; queries can raise it with "ef".
+    HNSW_SPACE: str = "l2"  # "l2", "cosine" or "ip"
+    HNSW_M: int = 16
+    HNSW_CONSTRUCTION_EF: int = 100
+    HNSW_SEARCH_EF: int = 100
+    SNAPSHOT_DIR: str = "./snapshots"
+
+    # Two-stage retrieval: pick the top-N documents from a per-document index of
+    # centroids and medoids, then search chunks only within them. "auto" routes only
+    # collections with a quantized index, whose search is exhaustive; Chroma's own
+    # HNSW search is already sublinear and gets slower when restricted to ids.
+    DOC_ROUTING: str = "auto"  # "auto", "on" or "off"
+    DOC_ROUTING_TOP_N: int = 10
+    DOC_ROUTING_MEDOIDS: int = 3
+    DOC_ROUTING_SAMPLE_SIZE: int = 256  # chunk vectors sampled per document for the medoids
+    DOC_ROUTING_FALLBACK: bool = True  # global search when the routed documents give fewer than k chunks
+    # Near-duplicate chunks (MinHash estimate of word 3-gram Jaccard similarity at or
+    # above the threshold) are linked to the stored chunk instead of being embedded again
+    DEDUP_ENABLED: bool = True
+    DEDUP_THRESHOLD: float = 0.85
+    # Archived raw audit log rows (gzipped JSON Lines, one partition per day)
+    ANALYTICS_ARCHIVE_DIR: str = "./archive"
+
+    # Resumable uploads: parts are PUT at multiples of UPLOAD_PART_SIZE; sessions
+    # without activity for UPLOAD_SESSION_TTL_HOURS are dropped by maintenance
+    UPLOAD_PART_SIZE: int = 8 * 1024 * 1024
+    UPLOAD_MAX_BYTES: int = 4 * 1024 * 1024 * 1024
+    UPLOAD_SESSION_TTL_HOURS: float = 24
+
+    # Retention (0 keeps forever) and background compaction. Maintenance runs every
+    # MAINTENANCE_INTERVAL_SECONDS; compaction (VACUUM/ANALYZE, vector index
+    # rewrite) waits until no request arrived for COMPACTION_IDLE_SECONDS and at
+    # least COMPACTION_MIN_FREE_RATIO of a database file is reclaimable.
+    UPLOAD_RETENTION_DAYS: int = 0
+    AUDIT_LOG_RETENTION_DAYS: int = 0
+    AUDIT_LOG_RETENTION_ARCHIVE: bool = True  # archive expired rows to ANALYTICS_ARCHIVE_DIR instead of dropping them
+    JOB_RETENTION_DAYS: int = 7
+    MAINTENANCE_INTERVAL_SECONDS: float = 600
+    COMPACTION_IDLE_SECONDS: float = 120
+    COMPACTION_MIN_FREE_RATIO: float = 0.1
+
+    # Deployment role: "standalone" (default), "writer" (ingests and publishes index
+    # generations to GENERATIONS_DIR) or "replica" (serves queries from the newest one)
+    NODE_ROLE: str = "standalone"
+    GENERATIONS_DIR: str = "./generations"
+    GENERATIONS_KEEP: int = 3
+    PUBLISH_INTERVAL_SECONDS: float = 60
+    REPLICA_DATA_DIR: str = "./replica_data"  # local copies of loaded generations
+    REPLICA_POLL_SECONDS: float = 5
     
     # Generation settings
     GROQ_API_KEY: str = ""
     HF_FALLBACK: bool = True
+
+    # Generation provider settings (OpenAI-compatible API, Groq by default)
+    LLM_BASE_URL: str = "https://api.groq.com/openai/v1"
+    LLM_MODEL: str = "llama-3.1-8b-instant"
+    LLM_TIMEOUT_SECONDS: float = 30.0
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_MAX_CONNECTIONS: int = 32
+    LLM_HEDGE_AFTER_MS: int = 0  # start the fallback if no first token by then; 0 disables
+    CIRCUIT_BREAKER_FAILURES: int = 5
+    CIRCUIT_BREAKER_RESET_SECONDS: float = 30.0
+
+    # Local generation engine (used when HF_FALLBACK is enabled)
+    LOCAL_LLM_MODEL: str = "google/flan-t5-base"
+    LOCAL_LLM_MAX_BATCH_SIZE: int = 8
+    LOCAL_LLM_MAX_WAIT_MS: int = 20
+    LOCAL_LLM_MAX_INPUT_TOKENS: int = 512
+    LOCAL_LLM_MAX_NEW_TOKENS: int = 150
+    LOCAL_LLM_THREADS: int = 0  # 0 keeps the torch default
+    LOCAL_LLM_QUANTIZE: bool = False  # int8 dynamic quantization for CPU
+    LOCAL_LLM_TIMEOUT_SECONDS: float = 120.0
+    LOCAL_LLM_MAX_CONCURRENCY: int = 32
     
+    # Admission control: per-client rate limits, keyed by client IP, or by X-API-Key
+    # (plus X-Client-Id, if sent) for the comma-separated keys in RATE_LIMIT_API_KEYS
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_API_KEYS: str = ""
+    QUERY_RATE_PER_MINUTE: float = 60
+    QUERY_BURST: int = 10
+    UPLOAD_RATE_PER_MINUTE: float = 10
+    UPLOAD_BURST: int = 5
+
+    # Admission control: global concurrency caps per expensive stage
+    RETRIEVAL_MAX_CONCURRENCY: int = 8
+    GENERATION_MAX_CONCURRENCY: int = 8
+    INGESTION_MAX_CONCURRENCY: int = 2
+    ADMISSION_MAX_QUEUE: int = 32
+    INGESTION_MAX_QUEUE: int = 16
+    ADMISSION_MAX_WAIT_SECONDS: float = 10.0
+    INGESTION_MAX_WAIT_SECONDS: float = 600.0  # queued uploads older than this are marked failed
+
+    # Chat sessions (server-side conversation state)
+    SESSION_IDLE_TTL_SECONDS: float = 1800
+    SESSION_MAX_MEMORY_MB: int = 64
+    SESSION_MAX_TURNS: int = 10
+    SESSION_CHUNK_CACHE_SIZE: int = 50
+
     # Embedding model
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
     
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Text
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, Column, Float, Integer, LargeBinary, String, DateTime, ForeignKey, Text, Index, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 from sqlalchemy.sql import func
 from .config import settings
@@ -8,14 +9,37 @@ engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread":
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def _utcnow():
+    # Python-side timestamps keep microseconds, which keyset pagination and
+    # listing ETags rely on (SQLite's CURRENT_TIMESTAMP has 1s resolution)
+    return datetime.now(timezone.utc)
+
 class Upload(Base):
     __tablename__ = "uploads"
     id = Column(String, primary_key=True, index=True)
     filename = Column(String, index=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=_utcnow, server_default=func.now())
+
+    # Ingestion stats, written once by the ingestion pipeline
+    status = Column(String, default="pending")  # pending | processing | ready | failed
+    byte_size = Column(Integer, nullable=True)
+    page_count = Column(Integer, nullable=True)
+    char_count = Column(Integer, nullable=True)
+    chunk_count = Column(Integer, nullable=True)
+    duplicate_count = Column(Integer, nullable=True)  # chunks linked to an existing near-duplicate
+    error = Column(Text, nullable=True)
+    ingested_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow)
 
     audit_logs = relationship("AuditLog", back_populates="upload")
 
+    __table_args__ = (
+        # Keyset pagination indexes: (sort column, id) for each sortable column
+        Index("ix_uploads_created_at_id", "created_at", "id"),
+        Index("ix_uploads_filename_id", "filename", "id"),
+        Index("ix_uploads_updated_at", "updated_at"),
+    )
+
 class AuditLog(Base):
     __tablename__ = "audit_log"
     id = Column(Integer, primary_key=True, index=True)
@@ -23,13 +47,173 @@ class AuditLog(Base):
     event_type = Column(String)
     query_text = Column(Text, nullable=True)
     response_text = Column(Text, nullable=True)
+    latency_ms = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     upload = relationship("Upload", back_populates="audit_logs")
 
+    __table_args__ = (
+        # Range scans when archiving old rows
+        Index("ix_audit_log_created_at", "created_at"),
+    )
+
+# --- Near-duplicate chunk detection (see services/dedup.py) ---
+
+class ChunkSignature(Base):
+    """MinHash signature of a stored (canonical) chunk."""
+    __tablename__ = "chunk_signatures"
+    chunk_id = Column(String, primary_key=True)
+    upload_id = Column(String, nullable=False, index=True)
+    signature = Column(LargeBinary, nullable=False)
+
+class LshBucket(Base):
+    """One row per LSH band of a canonical chunk; chunks sharing a bucket are candidates."""
+    __tablename__ = "lsh_buckets"
+    bucket = Column(Integer, primary_key=True)  # 64-bit hash of (band, band rows)
+    chunk_id = Column(String, primary_key=True)
+    upload_id = Column(String, nullable=False, index=True)
+
+class ChunkLink(Base):
+    """A chunk that was not stored because a near-duplicate (the canonical chunk) already was."""
+    __tablename__ = "chunk_links"
+    chunk_id = Column(String, primary_key=True)
+    upload_id = Column(String, nullable=False, index=True)
+    canonical_id = Column(String, nullable=False, index=True)
+    filename = Column(String)
+    chunk_index = Column(Integer)
+    char_start = Column(Integer, nullable=True)
+    char_end = Column(Integer, nullable=True)
+    similarity = Column(Float)
+    text = Column(Text)  # kept so the link can take over if the canonical chunk is deleted
+    extra_metadata = Column(Text, nullable=True)  # JSON: the chunk's own section, page...
+
+class UploadSession(Base):
+    """A resumable upload in progress; parts are written into STORAGE/parts/<id>.data."""
+    __tablename__ = "upload_sessions"
+    id = Column(String, primary_key=True)  # becomes the upload id on completion
+    filename = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    part_size = Column(Integer, nullable=False)
+    sha256 = Column(String, nullable=True)  # of the whole file, checked on completion
+    status = Column(String, nullable=False, default="open")  # open | completed
+    created_at = Column(DateTime(timezone=True), default=_utcnow)
+    updated_at = Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow, index=True)
+
+class UploadPart(Base):
+    __tablename__ = "upload_parts"
+    session_id = Column(String, primary_key=True)
+    offset = Column(Integer, primary_key=True)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String, nullable=False)
+
+class Job(Base):
+    """A background job (bulk delete, retention, compaction); see services/jobs.py."""
+    __tablename__ = "jobs"
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending | running | succeeded | failed
+    params = Column(Text, nullable=True)  # JSON
+    progress = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=True)
+    result = Column(Text, nullable=True)  # JSON
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=_utcnow, index=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+# --- Analytics rollups, updated in the same transaction as the audit log (see services/analytics.py) ---
+# `period` is "hour" or "day"; `bucket` is the UTC start of the period ("2024-05-01T13" or "2024-05-01")
+
+class AnalyticsCount(Base):
+    __tablename__ = "analytics_counts"
+    period = Column(String, primary_key=True)
+    bucket = Column(String, primary_key=True)
+    event_type = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    latency_count = Column(Integer, nullable=False, default=0)
+    latency_sum_ms = Column(Float, nullable=False, default=0.0)
+
+class AnalyticsLatency(Base):
+    """Latency histogram: rows per log-spaced bin, percentiles are read from the cumulative counts."""
+    __tablename__ = "analytics_latency"
+    period = Column(String, primary_key=True)
+    bucket = Column(String, primary_key=True)
+    event_type = Column(String, primary_key=True)
+    bin = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class AnalyticsQuery(Base):
+    __tablename__ = "analytics_queries"
+    day = Column(String, primary_key=True)
+    query = Column(String, primary_key=True)  # normalized query text
+    count = Column(Integer, nullable=False, default=0)
+
+class AnalyticsDocument(Base):
+    """How often each document's chunks were retrieved for a query."""
+    __tablename__ = "analytics_documents"
+    day = Column(String, primary_key=True)
+    upload_id = Column(String, primary_key=True)
+    hits = Column(Integer, nullable=False, default=0)
+
+def _add_missing_columns(table):
+    """
+    Lightweight migration for databases created by older versions: adds columns
+    that exist on the model but not in the table, and creates missing indexes.
+    Returns the names of the columns that were added.
+    """
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    added = []
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+            added.append(column.name)
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+    return added
+
+def _migrate_uploads():
+    added = _add_missing_columns(Upload.__table__)
+    if not added:
+        return
+    with engine.begin() as conn:
+        # Rows from before stats were tracked were already ingested
+        if "status" in added:
+            conn.execute(text("UPDATE uploads SET status = 'ready' WHERE status IS NULL"))
+        if engine.dialect.name == "sqlite":
+            # Normalize second-resolution server timestamps to the microsecond format
+            # SQLAlchemy writes, so string comparisons in keyset pagination are exact
+            conn.execute(text(
+                "UPDATE uploads SET created_at = created_at || '.000000' WHERE length(created_at) = 19"
+            ))
+        if "updated_at" in added:
+            conn.execute(text("UPDATE uploads SET updated_at = created_at WHERE updated_at IS NULL"))
+    print(f"Migrated 'uploads' table, added columns: {', '.join(added)}")
+
 def init_db():
     """Initialize the database and creates tables if they don't exists."""
     Base.metadata.create_all(bind=engine)
+    _migrate_uploads()
+    for table in (AuditLog.__table__, ChunkLink.__table__):
+        added = _add_missing_columns(table)
+        if added:
+            print(f"Migrated '{table.name}' table, added columns: {', '.join(added)}")
+
+# Tables a read replica writes itself; they stay in its own database across generation swaps
+REPLICA_LOCAL_MODELS = (AuditLog, AnalyticsCount, AnalyticsLatency, AnalyticsQuery, AnalyticsDocument)
+
+def use_database(url: str, local_engine=None):
+    """
+    Points the module at another database (read replicas switching generations).
+    With `local_engine`, the REPLICA_LOCAL_MODELS tables stay in that database.
+    Sessions already open keep their connection to the previous one.
+    """
+    global engine, SessionLocal
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    binds = {model: local_engine for model in REPLICA_LOCAL_MODELS} if local_engine is not None else {}
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, binds=binds)
 
 def get_db():
     db = SessionLocal()
@@ -1,29 +1,48 @@
 import os
-from fastapi import FastAPI, Depends, HTTPException
+import json
+import base64
+import hashlib
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, and_, or_
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from .api import ingestion, query
+from .api import admin, analytics, ingestion, jobs, query, sessions, uploads
 from . import db
-from .services import vectorstore
+from .services import analytics as analytics_service, dedup, generations, jobs as jobs_service, maintenance, uploads as uploads_service, routing, vectorstore, local_llm, providers
 from .config import settings
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Starting up...")
     db.init_db()
-    vectorstore.init_vectorstore()
+    if generations.role() != "replica":
+        vectorstore.init_vectorstore()
+        routing.ensure_index()
     
     storage_path = './storage'
     if not os.path.exists(storage_path):
         os.makedirs(storage_path)
+
+    # Writer: start publishing generations; replica: load the newest one and watch for more
+    generations.start()
+    if generations.role() != "replica":
+        # Resume unfinished jobs; schedule retention and idle-time compaction
+        jobs_service.start()
+        maintenance.start()
         
     yield
     print("Shutting down...")
+    maintenance.stop()
+    jobs_service.stop()
+    generations.stop()
+    providers.close_providers()
+    local_llm.shutdown_engine()
 
 app = FastAPI(
     title="KnowledgeOps as a Service (KaaS)",
@@ -43,45 +62,174 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Retry-After"],
 )
 
+# Replicas: keep the generation a request started on until it is done
+app.add_middleware(generations.PinGeneration)
+
+# Replicas serve reads from published generations; writes go to the writer node
+REPLICA_WRITABLE_PREFIXES = ("/query", "/sessions")
+
+@app.middleware("http")
+async def reject_writes_on_replicas(request: Request, call_next):
+    if (request.method not in ("GET", "HEAD", "OPTIONS") and generations.role() == "replica"
+            and not request.url.path.startswith(REPLICA_WRITABLE_PREFIXES)):
+        return JSONResponse(status_code=403, content={"detail": "This node is a read-only replica."})
+    maintenance.note_request()
+    return await call_next(request)
+
 app.include_router(ingestion.router)
+app.include_router(uploads.router)
 app.include_router(query.router)
+app.include_router(sessions.router)
+app.include_router(admin.router)
+app.include_router(analytics.router)
+app.include_router(jobs.router)
 
 # --- Document Listing, Deletion, and Reset Endpoints ---
 class DocumentResponse(BaseModel):
     id: str
     filename: str
     created_at: datetime
+    status: Optional[str] = None
+    byte_size: Optional[int] = None
+    page_count: Optional[int] = None
+    char_count: Optional[int] = None
+    chunk_count: Optional[int] = None
+    duplicate_count: Optional[int] = None
+    error: Optional[str] = None
+    ingested_at: Optional[datetime] = None
     class Config:
         orm_mode = True
 
+SORTABLE_COLUMNS = {
+    "created_at": db.Upload.created_at,
+    "filename": db.Upload.filename,
+}
+
+def _encode_cursor(sort: str, upload: db.Upload) -> str:
+    value = getattr(upload, sort)
+    payload = {"v": value.isoformat() if isinstance(value, datetime) else value, "id": upload.id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def _decode_cursor(sort: str, cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = payload["v"]
+        if sort == "created_at":
+            value = datetime.fromisoformat(value)
+        return value, payload["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+def _listing_etag(db_session: Session, *params) -> str:
+    """
+    Cheap version of the document list: row count plus the latest updated_at,
+    both served from indexes. Any insert, delete or stats update changes it.
+    """
+    count, last_update = db_session.query(func.count(db.Upload.id), func.max(db.Upload.updated_at)).one()
+    raw = json.dumps([count, str(last_update), *params])
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
 @app.get("/documents", tags=["Admin"], response_model=List[DocumentResponse])
-def get_documents(db_session: Session = Depends(db.get_db)):
-    """Lists all uploaded documents from the database."""
-    uploads = db_session.query(db.Upload).order_by(db.Upload.created_at.desc()).all()
+def get_documents(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    sort: str = Query("created_at", pattern="^(created_at|filename)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    prefix: Optional[str] = None,
+    db_session: Session = Depends(db.get_db)
+):
+    """
+    Lists uploaded documents with their ingestion stats, one page at a time.
+    Pages use keyset pagination: pass the `X-Next-Cursor` response header back
+    as `cursor` to get the next page. `prefix` filters by filename prefix.
+    Responses carry an ETag; an unchanged list answers `If-None-Match` with 304.
+    """
+    etag = _listing_etag(db_session, limit, cursor, sort, order, prefix)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    column = SORTABLE_COLUMNS[sort]
+    descending = order == "desc"
+    query = db_session.query(db.Upload)
+    if prefix:
+        # A range instead of LIKE so SQLite can use the filename index
+        query = query.filter(db.Upload.filename >= prefix, db.Upload.filename < prefix + "\U0010ffff")
+    if cursor:
+        value, last_id = _decode_cursor(sort, cursor)
+        if descending:
+            query = query.filter(or_(column < value, and_(column == value, db.Upload.id < last_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, db.Upload.id > last_id)))
+    if descending:
+        query = query.order_by(column.desc(), db.Upload.id.desc())
+    else:
+        query = query.order_by(column.asc(), db.Upload.id.asc())
+
+    uploads = query.limit(limit + 1).all()
+    if len(uploads) > limit:
+        uploads = uploads[:limit]
+        headers["X-Next-Cursor"] = _encode_cursor(sort, uploads[-1])
+    response.headers.update(headers)
     return uploads
 
-@app.delete("/documents/{upload_id}", status_code=200, tags=["Admin"])
+@app.get("/documents/{upload_id}", tags=["Admin"], response_model=DocumentResponse)
+def get_document(upload_id: str, db_session: Session = Depends(db.get_db)):
+    """Returns one document with its ingestion status and stats."""
+    upload = db_session.query(db.Upload).filter(db.Upload.id == upload_id).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload ID not found.")
+    return upload
+
+@app.delete("/documents/{upload_id}", status_code=202, tags=["Admin"])
 def delete_document(upload_id: str, db_session: Session = Depends(db.get_db)):
-    """Deletes a specific document from all databases (SQLite and Chroma)."""
+    """
+    Deletes a specific document from all databases (SQLite and Chroma) in the
+    background. Poll `GET /jobs/{job_id}` for completion.
+    """
     upload = db_session.query(db.Upload).filter(db.Upload.id == upload_id).first()
     if not upload:
         raise HTTPException(status_code=404, detail="Upload ID not found.")
-    
-    try:
-        # Delete from ChromaDB
-        vectorstore.delete_by_upload_id(upload_id)
-        
-        # Delete from SQLite
-        db_session.delete(upload)
-        db_session.commit()
-        
-        return {"status": "ok", "message": f"Document '{upload.filename}' deleted."}
-    except Exception as e:
-        db_session.rollback()
-        print(f"Error during document deletion: {e}")
-        raise HTTPException(status_code=500, detail="Failed to delete document.")
+    if upload.status in maintenance.IN_PROGRESS_STATUSES:
+        raise HTTPException(status_code=409, detail="The document is still being ingested; delete it once it is ready or failed.")
+
+    job = jobs_service.submit("delete", {"upload_ids": [upload_id]})
+    return {"status": "accepted", "message": f"Deleting document '{upload.filename}'.", "job_id": job["id"]}
+
+
+class BulkDeleteRequest(BaseModel):
+    upload_ids: Optional[List[str]] = None
+    filename_pattern: Optional[str] = None  # glob, e.g. "report-2023-*.pdf"
+    older_than_days: Optional[float] = None
+    dry_run: bool = False
+
+@app.post("/documents/delete", status_code=202, tags=["Admin"])
+def bulk_delete_documents(request: BulkDeleteRequest, response: Response, db_session: Session = Depends(db.get_db)):
+    """
+    Deletes every document matching all the given criteria (ids, filename glob,
+    age) in one background job. Documents still being ingested are not matched.
+    With `dry_run`, only lists the matches.
+    """
+    if request.upload_ids is None and not request.filename_pattern and request.older_than_days is None:
+        raise HTTPException(status_code=400, detail="Give upload_ids, filename_pattern or older_than_days.")
+
+    matches = maintenance.select_uploads(
+        db_session, upload_ids=request.upload_ids,
+        filename_pattern=request.filename_pattern, older_than_days=request.older_than_days,
+        include_in_progress=False,
+    )
+    upload_ids = [upload.id for upload in matches]
+    if request.dry_run or not upload_ids:
+        response.status_code = 200
+        return {"matched": len(upload_ids), "upload_ids": upload_ids, "job_id": None}
+
+    job = jobs_service.submit("delete", {"upload_ids": upload_ids})
+    return {"matched": len(upload_ids), "upload_ids": upload_ids, "job_id": job["id"]}
 
 
 @app.post("/reset", status_code=200, tags=["Admin"])
@@ -91,6 +239,9 @@ def reset_system(db_session: Session = Depends(db.get_db)):
         # Delete from SQLite
         db_session.query(db.AuditLog).delete()
         db_session.query(db.Upload).delete()
+        analytics_service.clear(db_session)
+        dedup.clear(db_session)
+        uploads_service.clear(db_session)
         db_session.commit()
         print("All records deleted from SQLite database.")
 
@@ -103,6 +254,11 @@ def reset_system(db_session: Session = Depends(db.get_db)):
         print(f"Error during system reset: {e}")
         raise HTTPException(status_code=500, detail="Failed to reset system.")
 
+@app.get("/vectorstore/stats", tags=["Admin"])
+def get_vectorstore_stats():
+    """Chunk count, vector representation and vector memory footprint."""
+    return vectorstore.stats()
+
 @app.get("/", tags=["Health Check"])
 def read_root():
     """Health check endpoint."""
@@ -0,0 +1,283 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Optional, Set
+
+from fastapi import HTTPException, Request
+
+from ..config import settings
+
+MAX_RETRY_AFTER_SECONDS = 3600
+
+
+class AdmissionRejected(HTTPException):
+    """429/503 raised when a request is over its rate limit or a stage is saturated."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        # A zero rate gives an infinite wait; clamp before rounding
+        self.retry_after = max(1, int(math.ceil(min(retry_after, MAX_RETRY_AFTER_SECONDS))))
+        super().__init__(status_code=status_code, detail=detail,
+                         headers={"Retry-After": str(self.retry_after)})
+
+
+# --- Rate limiting ---
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def try_acquire(self, now: Optional[float] = None) -> float:
+        """Takes one token. Returns 0 on success, else seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class RateLimiter:
+    """Per-client token buckets, with LRU eviction so idle clients don't accumulate."""
+
+    def __init__(self, name: str, per_minute: float, burst: int, max_clients: int = 10000):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client_key: str):
+        with self._lock:
+            bucket = self._buckets.get(client_key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[client_key] = bucket
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client_key)
+            wait = bucket.try_acquire()
+        if wait > 0:
+            raise AdmissionRejected(429, f"Rate limit exceeded for {self.name}.", wait)
+
+
+# --- Concurrency gates ---
+class StageTicket:
+    """
+    A reserved place in a stage's wait queue; `acquire` turns it into a running
+    slot. Async code waits with `acquire_async`, which holds no thread.
+    """
+
+    def __init__(self, gate: "StageGate"):
+        self.gate = gate
+        self.state = "queued"
+        self._wake: Optional[Callable[[], None]] = None
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        return self.gate._acquire(self, timeout)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        return await self.gate._acquire_async(self, timeout)
+
+    def release(self):
+        self.gate._release(self)
+
+
+class StageGate:
+    """
+    Global concurrency cap for one expensive stage, with a bounded wait queue.
+    When both the running slots and the queue are full, new work is rejected
+    with 503 and a Retry-After estimated from recent service times. Waiting
+    tickets get slots in the order they started waiting: a released slot is
+    handed to the head of the queue, never to a late arrival.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.avg_service_seconds = 1.0
+        self._started: Dict[int, float] = {}
+        self._queue: Deque[StageTicket] = deque()
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        backlog = self.waiting + 1
+        return self.avg_service_seconds * backlog / self.max_concurrency
+
+    def reserve(self) -> StageTicket:
+        """Reserves a queue place without blocking, or raises 503 when the stage is full."""
+        with self._lock:
+            if self.active >= self.max_concurrency and self.waiting >= self.max_queue:
+                raise AdmissionRejected(503, f"Server busy: {self.name} queue is full.", self.retry_after())
+            self.waiting += 1
+            return StageTicket(self)
+
+    def _enqueue(self, ticket: StageTicket, wake: Callable[[], None]) -> bool:
+        """Starts the ticket if a slot is free and nobody is queued, else queues it. Caller holds the lock."""
+        if not self._queue and self.active < self.max_concurrency:
+            self._start(ticket)
+            return True
+        ticket._wake = wake
+        self._queue.append(ticket)
+        return False
+
+    def _start(self, ticket: StageTicket):
+        self.waiting -= 1
+        self.active += 1
+        ticket.state = "running"
+        self._started[id(ticket)] = time.monotonic()
+
+    def _give_up(self, ticket: StageTicket) -> bool:
+        """Leaves the queue after a timeout. True if a slot was handed over in the meantime."""
+        with self._lock:
+            if ticket.state == "running":
+                return True
+            self._queue.remove(ticket)
+            self.waiting -= 1
+            ticket.state = "expired"
+            return False
+
+    def _acquire(self, ticket: StageTicket, timeout: Optional[float]) -> bool:
+        woken = threading.Event()
+        with self._lock:
+            if self._enqueue(ticket, woken.set):
+                return True
+        return woken.wait(timeout) or self._give_up(ticket)
+
+    async def _acquire_async(self, ticket: StageTicket, timeout: Optional[float]) -> bool:
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+
+        with self._lock:
+            if self._enqueue(ticket, wake):
+                return True
+        try:
+            await asyncio.wait_for(woken, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._give_up(ticket)
+        except asyncio.CancelledError:
+            # The caller went away; don't leak a slot handed over just now
+            if self._give_up(ticket):
+                self._release(ticket)
+            raise
+
+    def _release(self, ticket: StageTicket):
+        with self._lock:
+            if ticket.state == "running":
+                self.active -= 1
+                elapsed = time.monotonic() - self._started.pop(id(ticket), time.monotonic())
+                # Exponentially weighted average of how long the stage takes
+                self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * elapsed
+                while self._queue and self.active < self.max_concurrency:
+                    waiter = self._queue.popleft()
+                    self._start(waiter)
+                    waiter._wake()
+            elif ticket.state == "queued":
+                self.waiting -= 1
+            ticket.state = "released"
+
+    def slot(self) -> "_StageSlot":
+        """Context manager: reserve, wait up to `max_wait` for a slot, run, release."""
+        return _StageSlot(self)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"active": self.active, "waiting": self.waiting,
+                    "max_concurrency": self.max_concurrency, "max_queue": self.max_queue}
+
+
+class _StageSlot:
+    """Usable with `with` from worker threads and `async with` from the event loop."""
+
+    def __init__(self, gate: StageGate):
+        self.gate = gate
+        self.ticket: Optional[StageTicket] = None
+
+    def _timed_out(self) -> AdmissionRejected:
+        return AdmissionRejected(503, f"Server busy: timed out waiting for {self.gate.name}.", self.gate.retry_after())
+
+    def __enter__(self):
+        self.ticket = self.gate.reserve()
+        if not self.ticket.acquire(timeout=self.gate.max_wait):
+            raise self._timed_out()
+        return self.ticket
+
+    def __exit__(self, exc_type, exc, tb):
+        self.ticket.release()
+        return False
+
+    async def __aenter__(self):
+        self.ticket = self.gate.reserve()
+        if not await self.ticket.acquire_async(timeout=self.gate.max_wait):
+            raise self._timed_out()
+        return self.ticket
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.ticket.release()
+        return False
+
+
+# --- Module-level limiters and gates built from settings ---
+rate_limiters = {
+    "query": RateLimiter("query", settings.QUERY_RATE_PER_MINUTE, settings.QUERY_BURST),
+    "upload": RateLimiter("upload", settings.UPLOAD_RATE_PER_MINUTE, settings.UPLOAD_BURST),
+}
+
+gates = {
+    "retrieval": StageGate("retrieval", settings.RETRIEVAL_MAX_CONCURRENCY,
+                           settings.ADMISSION_MAX_QUEUE, settings.ADMISSION_MAX_WAIT_SECONDS),
+    "generation": StageGate("generation", settings.GENERATION_MAX_CONCURRENCY,
+                            settings.ADMISSION_MAX_QUEUE, settings.ADMISSION_MAX_WAIT_SECONDS),
+    "ingestion": StageGate("ingestion", settings.INGESTION_MAX_CONCURRENCY,
+                           settings.INGESTION_MAX_QUEUE, settings.ADMISSION_MAX_WAIT_SECONDS),
+}
+
+
+def _allowed_api_keys() -> Set[str]:
+    return {key.strip() for key in settings.RATE_LIMIT_API_KEYS.split(",") if key.strip()}
+
+
+def client_key(request: Request) -> str:
+    """
+    Identifies the caller by API key when it is one of RATE_LIMIT_API_KEYS, else
+    by client IP (unknown keys are ignored, so they can't mint fresh buckets).
+    A caller with a known key can act for its own users (a front end serving many
+    people from one IP) by naming them in `X-Client-Id`.
+    """
+    api_key = request.headers.get("x-api-key")
+    if api_key and api_key in _allowed_api_keys():
+        client_id = request.headers.get("x-client-id")
+        return f"key:{api_key}:{client_id}" if client_id else f"key:{api_key}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def rate_limit(name: str):
+    """FastAPI dependency factory enforcing the named per-client rate limit."""
+    limiter = rate_limiters[name]
+
+    def dependency(request: Request):
+        if settings.RATE_LIMIT_ENABLED:
+            limiter.check(client_key(request))
+
+    return dependency
+
+
+def stage(name: str):
+    """Context manager holding a slot in the named stage gate."""
+    return gates[name].slot()
@@ -0,0 +1,256 @@
+"""
+Incremental analytics over the audit log.
+
+Every logged event also updates small rollup tables in the same transaction,
+with SQLite upserts: counts and latency histograms per hour and per day, daily
+counts of normalized queries, and daily retrieval hits per document. The
+`/analytics` endpoints read only these tables, so their cost depends on the
+time window asked for, not on the size of the audit log.
+
+Raw audit rows can be archived to gzipped JSON Lines files partitioned by day
+(`ANALYTICS_ARCHIVE_DIR/audit_log/date=YYYY-MM-DD/part-<first id>.jsonl.gz`)
+and removed from the database; the rollups keep their history.
+"""
+import gzip
+import json
+import math
+import os
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..config import settings
+
+PERIODS = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d"}
+# Latency histogram bins grow by 25%, so percentiles are within ~12% of the exact value
+LATENCY_BIN_BASE = 1.25
+PERCENTILES = (50, 95, 99)
+MAX_QUERY_CHARS = 200
+ARCHIVE_BATCH_SIZE = 5000
+_WORD_RE = re.compile(r"[^\W_][\w.+#-]*")
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase words without punctuation, so trivially different phrasings count together."""
+    words = (word.rstrip(".") for word in _WORD_RE.findall(text.lower()))
+    return " ".join(word for word in words if word)[:MAX_QUERY_CHARS]
+
+
+def latency_bin(latency_ms: float) -> int:
+    return max(0, math.ceil(math.log(max(latency_ms, 1.0), LATENCY_BIN_BASE)))
+
+
+def bin_upper_ms(latency_bin_index: int) -> float:
+    return LATENCY_BIN_BASE ** latency_bin_index
+
+
+def _buckets(at: datetime) -> Dict[str, str]:
+    at = at.astimezone(timezone.utc) if at.tzinfo else at
+    return {period: at.strftime(fmt) for period, fmt in PERIODS.items()}
+
+
+def _upsert(session: Session, model, keys: Dict, increments: Dict):
+    table = model.__table__
+    statement = sqlite_insert(table).values(**keys, **increments)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: table.c[column] + statement.excluded[column] for column in increments},
+    )
+    session.execute(statement)
+
+
+# --- Writes ---
+def record_event(session: Session, event_type: str, latency_ms: Optional[float] = None,
+                 query_text: Optional[str] = None, upload_ids: Iterable[str] = (),
+                 at: Optional[datetime] = None):
+    """
+    Adds one event to the rollups. Runs in the caller's session, so the rollups
+    commit (or roll back) together with the audit log row.
+    """
+    buckets = _buckets(at or datetime.now(timezone.utc))
+    for period, bucket in buckets.items():
+        keys = {"period": period, "bucket": bucket, "event_type": event_type}
+        _upsert(session, db.AnalyticsCount, keys, {
+            "count": 1,
+            "latency_count": 1 if latency_ms is not None else 0,
+            "latency_sum_ms": latency_ms or 0.0,
+        })
+        if latency_ms is not None:
+            _upsert(session, db.AnalyticsLatency, dict(keys, bin=latency_bin(latency_ms)), {"count": 1})
+
+    normalized = normalize_query(query_text) if query_text else ""
+    if normalized:
+        _upsert(session, db.AnalyticsQuery, {"day": buckets["day"], "query": normalized}, {"count": 1})
+    for upload_id in sorted(set(filter(None, upload_ids))):
+        _upsert(session, db.AnalyticsDocument, {"day": buckets["day"], "upload_id": upload_id}, {"hits": 1})
+
+
+def clear(session: Session):
+    for model in (db.AnalyticsCount, db.AnalyticsLatency, db.AnalyticsQuery, db.AnalyticsDocument):
+        session.query(model).delete()
+
+
+def backfill(session: Session) -> int:
+    """
+    Replays the raw audit log into empty rollups (databases from before analytics
+    existed). Retrieval hits are not in the audit log and stay empty. Returns the
+    number of events replayed.
+    """
+    if session.query(db.AnalyticsCount).first() is not None:
+        raise RuntimeError("Analytics rollups are not empty.")
+    replayed = 0
+    query = session.query(db.AuditLog).order_by(db.AuditLog.id)
+    for row in query.yield_per(ARCHIVE_BATCH_SIZE):
+        record_event(session, row.event_type, latency_ms=row.latency_ms,
+                     query_text=row.query_text if row.event_type == "query" else None,
+                     at=row.created_at or datetime.now(timezone.utc))
+        replayed += 1
+    session.commit()
+    return replayed
+
+
+# --- Reads ---
+def percentiles(histogram: Dict[int, int]) -> Dict[str, Optional[float]]:
+    """Percentiles from a latency histogram, as the upper edge of the bin they fall in."""
+    total = sum(histogram.values())
+    result = {f"p{p}_ms": None for p in PERCENTILES}
+    if not total:
+        return result
+    cumulative, ordered = 0, sorted(histogram.items())
+    targets = [(p, math.ceil(total * p / 100)) for p in PERCENTILES]
+    for latency_bin_index, count in ordered:
+        cumulative += count
+        for p, target in targets:
+            if result[f"p{p}_ms"] is None and cumulative >= target:
+                result[f"p{p}_ms"] = round(bin_upper_ms(latency_bin_index), 1)
+    return result
+
+
+def _since_bucket(period: str, since: datetime) -> str:
+    return _buckets(since)[period]
+
+
+def timeseries(session: Session, period: str = "hour", event_type: str = "query",
+               since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict]:
+    """Count, mean and percentile latency per bucket, oldest first."""
+    until = until or datetime.now(timezone.utc)
+    since = since or until - (timedelta(hours=24) if period == "hour" else timedelta(days=30))
+    start, end = _since_bucket(period, since), _since_bucket(period, until)
+
+    counts = session.query(db.AnalyticsCount).filter(
+        db.AnalyticsCount.period == period, db.AnalyticsCount.event_type == event_type,
+        db.AnalyticsCount.bucket >= start, db.AnalyticsCount.bucket <= end,
+    ).order_by(db.AnalyticsCount.bucket).all()
+    histograms: Dict[str, Dict[int, int]] = defaultdict(dict)
+    for bucket, latency_bin_index, count in session.query(
+            db.AnalyticsLatency.bucket, db.AnalyticsLatency.bin, db.AnalyticsLatency.count).filter(
+            db.AnalyticsLatency.period == period, db.AnalyticsLatency.event_type == event_type,
+            db.AnalyticsLatency.bucket >= start, db.AnalyticsLatency.bucket <= end):
+        histograms[bucket][latency_bin_index] = count
+
+    return [
+        {
+            "bucket": row.bucket,
+            "count": row.count,
+            "avg_latency_ms": round(row.latency_sum_ms / row.latency_count, 1) if row.latency_count else None,
+            **percentiles(histograms.get(row.bucket, {})),
+        }
+        for row in counts
+    ]
+
+
+def summary(session: Session, days: int = 7) -> Dict:
+    """Event counts and query latency percentiles over the last `days` days."""
+    start = _since_bucket("day", datetime.now(timezone.utc) - timedelta(days=days - 1))
+    events = {
+        event_type: {"count": count, "avg_latency_ms": round(latency_sum / latency_count, 1) if latency_count else None}
+        for event_type, count, latency_sum, latency_count in session.query(
+            db.AnalyticsCount.event_type, func.sum(db.AnalyticsCount.count),
+            func.sum(db.AnalyticsCount.latency_sum_ms), func.sum(db.AnalyticsCount.latency_count),
+        ).filter(db.AnalyticsCount.period == "day", db.AnalyticsCount.bucket >= start)
+        .group_by(db.AnalyticsCount.event_type)
+    }
+    histogram = dict(session.query(db.AnalyticsLatency.bin, func.sum(db.AnalyticsLatency.count)).filter(
+        db.AnalyticsLatency.period == "day", db.AnalyticsLatency.event_type == "query",
+        db.AnalyticsLatency.bucket >= start,
+    ).group_by(db.AnalyticsLatency.bin).all())
+    return {"days": days, "since": start, "events": events, "query_latency": percentiles(histogram)}
+
+
+def top_queries(session: Session, days: int = 7, limit: int = 20) -> List[Dict]:
+    start = _since_bucket("day", datetime.now(timezone.utc) - timedelta(days=days - 1))
+    total = func.sum(db.AnalyticsQuery.count)
+    rows = session.query(db.AnalyticsQuery.query, total).filter(db.AnalyticsQuery.day >= start) \
+        .group_by(db.AnalyticsQuery.query).order_by(total.desc(), db.AnalyticsQuery.query).limit(limit)
+    return [{"query": query, "count": count} for query, count in rows]
+
+
+def top_documents(session: Session, days: int = 30, limit: int = 20) -> List[Dict]:
+    start = _since_bucket("day", datetime.now(timezone.utc) - timedelta(days=days - 1))
+    hits = func.sum(db.AnalyticsDocument.hits)
+    rows = session.query(db.AnalyticsDocument.upload_id, hits).filter(db.AnalyticsDocument.day >= start) \
+        .group_by(db.AnalyticsDocument.upload_id).order_by(hits.desc(), db.AnalyticsDocument.upload_id) \
+        .limit(limit).all()
+    filenames = dict(session.query(db.Upload.id, db.Upload.filename)
+                     .filter(db.Upload.id.in_([upload_id for upload_id, _ in rows])))
+    return [{"upload_id": upload_id, "filename": filenames.get(upload_id), "hits": count}
+            for upload_id, count in rows]
+
+
+# --- Archiving ---
+def _archive_row(row: db.AuditLog) -> Dict:
+    return {
+        "id": row.id,
+        "upload_id": row.upload_id,
+        "event_type": row.event_type,
+        "query_text": row.query_text,
+        "response_text": row.response_text,
+        "latency_ms": row.latency_ms,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+    }
+
+
+def _write_partition(directory: str, day: str, rows: List[Dict]):
+    partition = os.path.join(directory, "audit_log", f"date={day}")
+    os.makedirs(partition, exist_ok=True)
+    # Named after the first row id: re-running after a crash overwrites instead of duplicating
+    path = os.path.join(partition, f"part-{rows[0]['id']:012d}.jsonl.gz")
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def archive_audit_log(session: Session, older_than_days: int, directory: Optional[str] = None) -> Dict:
+    """
+    Moves audit rows older than `older_than_days` days to compressed files, one
+    partition per day, deleting them from the database batch by batch.
+    """
+    directory = directory or settings.ANALYTICS_ARCHIVE_DIR
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).replace(tzinfo=None)
+    archived, partitions = 0, set()
+    while True:
+        rows = session.query(db.AuditLog).filter(db.AuditLog.created_at < cutoff) \
+            .order_by(db.AuditLog.id).limit(ARCHIVE_BATCH_SIZE).all()
+        if not rows:
+            break
+        by_day: Dict[str, List[Dict]] = defaultdict(list)
+        for row in rows:
+            by_day[_buckets(row.created_at)["day"]].append(_archive_row(row))
+        for day, day_rows in by_day.items():
+            _write_partition(directory, day, day_rows)
+            partitions.add(day)
+        session.query(db.AuditLog).filter(db.AuditLog.id.in_([row.id for row in rows])) \
+            .delete(synchronize_session=False)
+        session.commit()
+        archived += len(rows)
+    if archived:
+        print(f"Archived {archived} audit log rows to {directory} ({len(partitions)} day partitions).")
+    return {"archived": archived, "partitions": sorted(partitions), "directory": directory}
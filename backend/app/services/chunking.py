@@ -1,4 +1,5 @@
-from typing import List, Dict
+from itertools import groupby
+from typing import List, Dict, Iterable, Iterator
 
 def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[Dict]:
     """
@@ -36,4 +37,77 @@ def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[Dict]:
         # Ensure we don't create a tiny, redundant chunk at the end
         if start_index + chunk_overlap >= len(text):
             break
-    return chunks
\ No newline at end of file
+    return chunks
+
+def chunk_stream(texts: Iterable[str], chunk_size: int, chunk_overlap: int, offset: int = 0) -> Iterator[Dict]:
+    """
+    Streaming version of `chunk_text`: consumes the text in pieces and yields the
+    same chunks `chunk_text` would produce for the concatenated text, while only
+    buffering about one chunk. `offset` is added to the character offsets.
+    """
+    if chunk_size <= chunk_overlap:
+        raise ValueError("chunk_size must be larger than chunk_overlap")
+    step = chunk_size - chunk_overlap
+    buffer = ""
+    buffer_start = 0  # offset of buffer[0] within the stream
+    start_index = 0
+
+    for piece in texts:
+        if not piece:
+            continue
+        buffer += piece
+        # A chunk is final once one character past it has arrived: only then do we
+        # know the end-of-text check in `chunk_text` won't stop before the next one
+        while len(buffer) - (start_index - buffer_start) > chunk_size:
+            local = start_index - buffer_start
+            chunk = buffer[local:local + chunk_size]
+            yield {
+                "chunk_text": chunk,
+                "char_start": offset + start_index,
+                "char_end": offset + start_index + len(chunk),
+            }
+            start_index += step
+        # Drop everything before the next chunk start
+        drop = start_index - buffer_start
+        if drop > 0:
+            buffer = buffer[drop:]
+            buffer_start = start_index
+
+    # Remaining tail: same loop as chunk_text, now that the total length is known
+    total = buffer_start + len(buffer)
+    while start_index < total:
+        local = start_index - buffer_start
+        chunk = buffer[local:local + chunk_size]
+        yield {
+            "chunk_text": chunk,
+            "char_start": offset + start_index,
+            "char_end": offset + start_index + len(chunk),
+        }
+        start_index += step
+        if start_index + chunk_overlap >= total:
+            break
+
+
+def chunk_segments(segments: Iterable[Dict], chunk_size: int, chunk_overlap: int) -> Iterator[Dict]:
+    """
+    Chunks the segments produced by a format loader (see `loaders`). Consecutive
+    segments with the same metadata form one continuous stream (e.g. windows of a
+    large text file); a change of metadata (a new heading, page or row group) is
+    a natural boundary, so no chunk spans two sections. Each chunk carries its
+    section's metadata under 'metadata'. Offsets are relative to the concatenated
+    segment texts. Segments are consumed lazily.
+    """
+    offset = 0
+    for metadata, group in groupby(segments, key=lambda segment: segment.get("metadata") or {}):
+        consumed = [0]
+
+        def texts(group=group, consumed=consumed):
+            for segment in group:
+                consumed[0] += len(segment["text"])
+                yield segment["text"]
+
+        for chunk in chunk_stream(texts(), chunk_size, chunk_overlap, offset):
+            if chunk["chunk_text"].strip():
+                chunk["metadata"] = dict(metadata)
+                yield chunk
+        offset += consumed[0]
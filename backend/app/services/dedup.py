@@ -0,0 +1,332 @@
+"""
+Near-duplicate chunk detection at ingest time (MinHash + LSH).
+
+Every stored chunk has a MinHash signature over its word 3-grams. The signature
+is split into LSH bands, and each band is hashed into a bucket kept in SQLite,
+so candidate duplicates are found with one indexed lookup per batch instead of
+a comparison against every chunk. A candidate whose estimated Jaccard
+similarity reaches DEDUP_THRESHOLD is a near-duplicate. The new chunk is then
+not embedded or stored; it is recorded in `chunk_links` against the stored
+(canonical) chunk, and retrieval lists its file among the canonical chunk's
+sources.
+
+Deleting a document whose chunks are canonical for others promotes one of the
+linked duplicates in its place, reusing the canonical embedding.
+
+Chunks without a single word (punctuation or layout debris) have no shingles
+to compare, so they are never deduplicated.
+"""
+import hashlib
+import json
+import re
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..config import settings
+from . import routing, vectorstore
+
+NUM_PERM = 128
+BANDS = 16  # 8 rows per band: pairs above ~0.7 Jaccard almost always share a bucket
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+# Fixed seed: signatures must stay comparable across processes and restarts
+_rng = np.random.default_rng(20240501)
+_A = _rng.integers(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text: str) -> List[str]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+
+
+def signature(text: str) -> np.ndarray:
+    """
+    MinHash signature (NUM_PERM uint32 values) of the text's word shingles;
+    all-max (see `is_empty`) for a text without words.
+    """
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in set(shingles(text))), dtype=np.uint64)
+    if hashes.size == 0:
+        return np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    # a < 2^31 and crc32 < 2^32, so a * h + b fits in 64 bits
+    permuted = (hashes[:, None] * _A[None, :] + _B[None, :]) % _MERSENNE_PRIME
+    return (permuted.min(axis=0) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def is_empty(sig: np.ndarray) -> bool:
+    """True for the signature of a text without words, which matches nothing."""
+    return bool((sig == np.iinfo(np.uint32).max).all())
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(first == second)) / NUM_PERM
+
+
+def band_buckets(sig: np.ndarray) -> List[int]:
+    """One signed 64-bit bucket id per band (the band number is part of the hash)."""
+    buckets = []
+    for band in range(BANDS):
+        rows = sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+def _index_rows(chunk_id: str, upload_id: str, sig: np.ndarray) -> Tuple[Dict, List[Dict]]:
+    signature_row = {"chunk_id": chunk_id, "upload_id": upload_id, "signature": sig.tobytes()}
+    bucket_rows = [{"bucket": bucket, "chunk_id": chunk_id, "upload_id": upload_id} for bucket in band_buckets(sig)]
+    return signature_row, bucket_rows
+
+
+class ChunkDeduplicator:
+    """
+    Splits one document's chunk batches into new chunks and near-duplicates of
+    chunks already stored (including earlier chunks of the same document).
+    Call `filter` before upserting a batch and `commit` after it was stored.
+    """
+
+    def __init__(self, upload_id: str, filename: str, threshold: Optional[float] = None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.threshold = settings.DEDUP_THRESHOLD if threshold is None else threshold
+        self.duplicates = 0
+        # Canonical chunks of this document so far, for duplicates within it
+        self._own_buckets: Dict[int, List[str]] = {}
+        self._own_signatures: Dict[str, np.ndarray] = {}
+        self._pending_signatures: List[Dict] = []
+        self._pending_buckets: List[Dict] = []
+        self._pending_links: List[Dict] = []
+
+    def _stored_candidates(self, buckets: Iterable[int]) -> Dict[str, np.ndarray]:
+        buckets = list(set(buckets))
+        session = db.SessionLocal()
+        try:
+            chunk_ids = set()
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(buckets), 900):
+                chunk_ids.update(row[0] for row in session.query(db.LshBucket.chunk_id)
+                                 .filter(db.LshBucket.bucket.in_(buckets[start:start + 900])))
+            chunk_ids = list(chunk_ids)
+            signatures = {}
+            for start in range(0, len(chunk_ids), 900):
+                for chunk_id, raw in session.query(db.ChunkSignature.chunk_id, db.ChunkSignature.signature) \
+                        .filter(db.ChunkSignature.chunk_id.in_(chunk_ids[start:start + 900])):
+                    signatures[chunk_id] = np.frombuffer(raw, dtype=np.uint32)
+            return signatures
+        finally:
+            session.close()
+
+    def filter(self, chunks: List[Dict], start_index: int) -> Tuple[List[Dict], List[int]]:
+        """Returns the chunks to embed and store, with their chunk indexes."""
+        signatures = [signature(chunk["chunk_text"]) for chunk in chunks]
+        buckets = [band_buckets(sig) for sig in signatures]
+        stored = self._stored_candidates(bucket for chunk_buckets in buckets for bucket in chunk_buckets)
+        stored_buckets: Dict[int, List[str]] = {}
+        for chunk_id, sig in stored.items():
+            for bucket in band_buckets(sig):
+                stored_buckets.setdefault(bucket, []).append(chunk_id)
+
+        fresh, indices = [], []
+        for offset, (chunk, sig, chunk_buckets) in enumerate(zip(chunks, signatures, buckets)):
+            chunk_index = start_index + offset
+            if is_empty(sig):
+                # Stored, but not indexed: nothing can be a duplicate of it
+                fresh.append(chunk)
+                indices.append(chunk_index)
+                continue
+            candidates = {cid: stored[cid] for b in chunk_buckets for cid in stored_buckets.get(b, ())}
+            candidates.update({cid: self._own_signatures[cid]
+                               for b in chunk_buckets for cid in self._own_buckets.get(b, ())})
+            best_id, best = None, 0.0
+            for candidate_id, candidate_sig in candidates.items():
+                score = similarity(sig, candidate_sig)
+                if score > best:
+                    best_id, best = candidate_id, score
+
+            chunk_id = f"{self.upload_id}_{chunk_index}"
+            if best_id is not None and best >= self.threshold:
+                self._pending_links.append({
+                    "chunk_id": chunk_id,
+                    "upload_id": self.upload_id,
+                    "canonical_id": best_id,
+                    "filename": self.filename,
+                    "chunk_index": chunk_index,
+                    "char_start": chunk.get("char_start"),
+                    "char_end": chunk.get("char_end"),
+                    "similarity": best,
+                    "text": chunk["chunk_text"],
+                    "extra_metadata": json.dumps(vectorstore.chunk_metadata(chunk)),
+                })
+                continue
+
+            fresh.append(chunk)
+            indices.append(chunk_index)
+            self._own_signatures[chunk_id] = sig
+            for bucket in chunk_buckets:
+                self._own_buckets.setdefault(bucket, []).append(chunk_id)
+            signature_row, bucket_rows = _index_rows(chunk_id, self.upload_id, sig)
+            self._pending_signatures.append(signature_row)
+            self._pending_buckets.extend(bucket_rows)
+        return fresh, indices
+
+    def commit(self):
+        """Records the stored chunks' signatures and the duplicates' links."""
+        if not (self._pending_signatures or self._pending_links):
+            return
+        session = db.SessionLocal()
+        try:
+            session.bulk_insert_mappings(db.ChunkSignature, self._pending_signatures)
+            session.bulk_insert_mappings(db.LshBucket, self._pending_buckets)
+            session.bulk_insert_mappings(db.ChunkLink, self._pending_links)
+            session.commit()
+        finally:
+            session.close()
+        self.duplicates += len(self._pending_links)
+        self._pending_signatures, self._pending_buckets, self._pending_links = [], [], []
+
+
+# --- Retrieval ---
+def linked_sources(chunk_ids: List[str]) -> Dict[str, List[Dict]]:
+    """Duplicates linked to each of the given canonical chunks."""
+    if not chunk_ids:
+        return {}
+    session = db.SessionLocal()
+    try:
+        links: Dict[str, List[Dict]] = {}
+        rows = session.query(db.ChunkLink).filter(db.ChunkLink.canonical_id.in_(chunk_ids)) \
+            .order_by(db.ChunkLink.filename, db.ChunkLink.chunk_index)
+        for link in rows:
+            links.setdefault(link.canonical_id, []).append({
+                "upload_id": link.upload_id,
+                "filename": link.filename,
+                "chunk_index": link.chunk_index,
+                "char_start": link.char_start,
+                "char_end": link.char_end,
+            })
+        return links
+    finally:
+        session.close()
+
+
+def collapse(docs: List, k: int, threshold: Optional[float] = None) -> List:
+    """
+    Drops retrieved chunks that are near-duplicates of a better-ranked one (chunks
+    stored before deduplication, or by concurrent ingestions), folding their
+    sources into it. Returns at most k documents.
+    """
+    threshold = settings.DEDUP_THRESHOLD if threshold is None else threshold
+    kept, signatures = [], []
+    for doc in docs:
+        sig = signature(doc.page_content)
+        match = None if is_empty(sig) else next(
+            (i for i, other in enumerate(signatures) if similarity(sig, other) >= threshold), None)
+        if match is None:
+            kept.append(doc)
+            signatures.append(sig)
+            if len(kept) == k:
+                break
+            continue
+        kept[match].metadata.setdefault("duplicates", []).append({
+            "upload_id": doc.metadata.get("upload_id"),
+            "filename": doc.metadata.get("filename"),
+            "chunk_index": doc.metadata.get("chunk_index"),
+            "char_start": doc.metadata.get("char_start"),
+            "char_end": doc.metadata.get("char_end"),
+        })
+    return kept
+
+
+# --- Maintenance ---
+def release_upload(session: Session, upload_id: str):
+    """
+    Removes a document's signatures and links before its chunks are deleted.
+    Canonical chunks that other documents link to are handed over to one of
+    their duplicates, stored with the canonical embedding (no re-embedding).
+    """
+    links = session.query(db.ChunkLink).filter(
+        db.ChunkLink.canonical_id.like(f"{upload_id}\\_%", escape="\\"),
+        db.ChunkLink.upload_id != upload_id,
+    ).order_by(db.ChunkLink.canonical_id, db.ChunkLink.upload_id, db.ChunkLink.chunk_index).all()
+    by_canonical: Dict[str, List[db.ChunkLink]] = {}
+    for link in links:
+        by_canonical.setdefault(link.canonical_id, []).append(link)
+
+    if by_canonical:
+        heirs = set()
+        canonical_ids = list(by_canonical)
+        vectors = vectorstore.get_embeddings(canonical_ids)
+        for canonical_id, group in by_canonical.items():
+            heir, others = group[0], group[1:]
+            if canonical_id not in vectors:
+                continue
+            # The heir's own section, page... (links recorded before these were kept have none)
+            metadata = json.loads(heir.extra_metadata or "{}")
+            metadata.update({
+                "upload_id": heir.upload_id,
+                "filename": heir.filename,
+                "chunk_index": heir.chunk_index,
+                "created_at": datetime.utcnow().isoformat(),
+            })
+            if heir.char_start is not None:
+                metadata.update(char_start=heir.char_start, char_end=heir.char_end)
+            vectorstore.add_chunks([heir.chunk_id], [heir.text], [metadata], [vectors[canonical_id]])
+            signature_row, bucket_rows = _index_rows(heir.chunk_id, heir.upload_id, signature(heir.text))
+            session.bulk_insert_mappings(db.ChunkSignature, [signature_row])
+            session.bulk_insert_mappings(db.LshBucket, bucket_rows)
+            for other in others:
+                other.canonical_id = heir.chunk_id
+            session.delete(heir)
+            heirs.add(heir.upload_id)
+        # The heirs' documents now own chunks they did not have when they were routed
+        routing.reindex(sorted(heirs))
+        print(f"Promoted {len(by_canonical)} linked duplicates before deleting upload {upload_id}.")
+
+    session.query(db.ChunkLink).filter(db.ChunkLink.upload_id == upload_id).delete(synchronize_session=False)
+    session.query(db.LshBucket).filter(db.LshBucket.upload_id == upload_id).delete(synchronize_session=False)
+    session.query(db.ChunkSignature).filter(db.ChunkSignature.upload_id == upload_id).delete(synchronize_session=False)
+
+
+def clear(session: Session, links: bool = True):
+    session.query(db.LshBucket).delete()
+    session.query(db.ChunkSignature).delete()
+    if links:
+        session.query(db.ChunkLink).delete()
+
+
+def rebuild_index(session_factory=None) -> int:
+    """Recomputes the signatures and LSH buckets of every stored chunk (after a snapshot import)."""
+    session_factory = session_factory or db.SessionLocal
+    session = session_factory()
+    try:
+        clear(session, links=False)
+        count = 0
+        for ids, texts, metadatas, _ in vectorstore.iter_chunks():
+            signature_rows, bucket_rows = [], []
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                sig = signature(text)
+                if is_empty(sig):
+                    continue
+                signature_row, rows = _index_rows(chunk_id, (metadata or {}).get("upload_id", ""), sig)
+                signature_rows.append(signature_row)
+                bucket_rows.extend(rows)
+            session.bulk_insert_mappings(db.ChunkSignature, signature_rows)
+            session.bulk_insert_mappings(db.LshBucket, bucket_rows)
+            count += len(ids)
+        session.commit()
+        return count
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
@@ -17,6 +17,16 @@ except Exception as e:
     model = None
     print(f"Failed to load SentenceTransformer model: {e}")
 
+def load_model(model_name: str):
+    """
+    Replaces the active embedding model. Used by offline tooling that compares
+    models; the API keeps the model configured in settings.
+    """
+    global model
+    model = SentenceTransformer(model_name)
+    print(f"Embedding model '{model_name}' loaded successfully")
+    return model
+
 def embed_texts(texts: List[str]) -> List[List[float]]:
     """
     Computers embeddings for a list of texts using the pre-loaded SentenceTransformer model.
@@ -138,9 +138,10 @@
 #         print(f"Error during HF generation: {e}")
 #         return "Error generating answer with the local model."
     
-from typing import List
+from typing import Callable, List, Optional
 from langchain_core.documents import Document
 from ..config import settings
+from . import providers
 
 # --- New, Cleaner Prompt Template ---
 PROMPT_TEMPLATE = """
@@ -164,85 +165,29 @@ def _format_prompt(question: str, context: str) -> str:
     """Fills the prompt template with the question and formatted context."""
     return PROMPT_TEMPLATE.format(context=context, question=question)
 
-def generate_answer(question: str, retrieved_docs: List[Document]) -> str:
+SYSTEM_PROMPT = "You are a helpful assistant that answers questions conversationally based only on the provided context."
+
+def generate_answer(question: str, retrieved_docs: List[Document],
+                    on_token: Optional[Callable[[str], None]] = None) -> str:
     """
-    Generates an answer using either the Groq API or a local Hugging Face model.
+    Generates an answer through the provider chain: the OpenAI-compatible API
+    (Groq) when a key is configured, then the local Hugging Face engine.
+    `on_token` receives the answer as it streams in; the returned answer is
+    authoritative (a provider that fails midway is replaced by the next one).
     """
-    context = _format_context(retrieved_docs)
-    prompt = _format_prompt(question, context)
-
-    if settings.GROQ_API_KEY:
-        try:
-            return _generate_with_groq(prompt)
-        except Exception as e:
-            print(f"Groq API call failed: {e}. Falling back to HF if enabled.")
-            if not settings.HF_FALLBACK:
-                return "Error: Could not generate answer."
+    if not settings.GROQ_API_KEY and not settings.HF_FALLBACK:
+        return "Error: No generation model is configured."
 
-    if settings.HF_FALLBACK:
-        return _generate_with_hf(prompt)
-
-    return "Error: No generation model is configured."
-
-# --- Groq Generation ---
-def _generate_with_groq(prompt: str) -> str:
-    """Calls the Groq API to generate a response."""
-    from groq import Groq
-    
-    client = Groq(api_key=settings.GROQ_API_KEY)
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {
-                "role": "system",
-                "content": "You are a helpful assistant that answers questions conversationally based only on the provided context."
-            },
-            {
-                "role": "user",
-                "content": prompt,
-            }
-        ],
-        # --- THIS IS THE UPDATED MODEL NAME ---
-        model="llama-3.1-8b-instant",
-        temperature=0.2,
-        max_tokens=250,
+    context = _format_context(retrieved_docs)
+    request = providers.GenerationRequest(
+        question=question,
+        context=context,
+        prompt=_format_prompt(question, context),
+        system_prompt=SYSTEM_PROMPT,
+        on_token=on_token,
     )
-    return chat_completion.choices[0].message.content
-
-# --- Hugging Face Fallback (remains unchanged) ---
-hf_pipeline = None
-
-def _initialize_hf_pipeline():
-    global hf_pipeline
-    if hf_pipeline is None:
-        try:
-            from transformers import pipeline
-            print("Initializing Hugging Face pipeline...")
-            hf_pipeline = pipeline("text2text-generation", model="google/flan-t5-base")
-            print("Hugging Face pipeline initialized.")
-        except Exception as e:
-            print(f"Error initializing HF pipeline: {e}")
-            hf_pipeline = "failed"
-
-def _generate_with_hf(prompt: str) -> str:
-    if hf_pipeline is None:
-        _initialize_hf_pipeline()
-    if hf_pipeline == "failed" or hf_pipeline is None:
-        return "Error: Hugging Face fallback model could not be loaded."
-    
-    try:
-        context_part = prompt.split("Context:")[1].split("Question:")[0].strip()
-        question_part = prompt.split("Question:")[1].split("Answer:")[0].strip()
-        simple_prompt = f"Context: {context_part}\n\nQuestion: {question_part}\n\nAnswer:"
-    except IndexError:
-        simple_prompt = prompt
-
-    max_length = 512
-    if len(simple_prompt) > max_length * 3:
-        simple_prompt = simple_prompt[:max_length * 3]
-
     try:
-        result = hf_pipeline(simple_prompt, max_length=150, num_return_sequences=1)
-        return result[0]['generated_text']
-    except Exception as e:
-        print(f"Error during HF generation: {e}")
-        return "Error generating answer with the local model."
\ No newline at end of file
+        return providers.get_router().generate(request)
+    except providers.ProviderError as e:
+        print(f"Generation failed on all providers: {e}")
+        return "Error: Could not generate answer."
@@ -0,0 +1,386 @@
+"""
+Index generations for writer/replica deployments.
+
+A writer node ingests as usual and periodically publishes the knowledge base as
+an immutable generation in GENERATIONS_DIR, a directory shared with the replicas:
+
+    CURRENT                  id of the newest complete generation
+    <id>/manifest.json       generation id, embedding model and counts
+    <id>/chroma_db/          ready-to-open Chroma directory (quantized and routing indexes included)
+    <id>/kaas.db             uploads table and chunk links
+
+Publishing copies the live Chroma directory and database under the vector
+store's write lock: a file copy (with SQLite's online backup for the database
+files), not an export and re-import, so the lock is held for as long as it
+takes to copy the store's bytes. Documents still being ingested are then
+removed from the copy. A generation is built in a temporary directory and
+renamed into place, then CURRENT is replaced atomically, so readers never see
+a partial one.
+
+Replicas mount GENERATIONS_DIR read-only and poll CURRENT. A new generation is
+copied to REPLICA_DATA_DIR (Chroma needs a writable directory), opened, and
+swapped in. Each request pins the generation active when it starts
+(`PinGeneration`); older generations are closed and deleted once no request
+holds them. What a replica writes itself (audit log, analytics) goes to its
+own database (DATABASE_URL), which is not swapped.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import chromadb
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import db
+from ..config import settings
+from . import snapshot, vectorstore
+
+CURRENT_FILE = "CURRENT"
+ROLES = ("standalone", "writer", "replica")
+# Writer-only state left out of generations: replicas keep their own audit log
+# and analytics, and neither ingest nor run jobs
+UNPUBLISHED_MODELS = (db.AuditLog, db.AnalyticsCount, db.AnalyticsLatency, db.AnalyticsQuery, db.AnalyticsDocument,
+                      db.ChunkSignature, db.LshBucket, db.UploadSession, db.UploadPart, db.Job)
+
+# Writer state
+_publish_lock = threading.Lock()
+published_version: Optional[int] = None
+# Replica state: loaded generations, newest last; older ones stay open while requests hold them
+_loaded: deque = deque()
+_load_lock = threading.Lock()
+_ref_lock = threading.Lock()
+# The replica's own database, for the tables it writes (see `db.REPLICA_LOCAL_MODELS`)
+_local_engine = None
+last_error: Optional[str] = None
+
+_worker: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def role() -> str:
+    value = settings.NODE_ROLE.lower()
+    if value not in ROLES:
+        raise ValueError(f"Unknown NODE_ROLE: {settings.NODE_ROLE}")
+    return value
+
+
+def new_generation_id() -> str:
+    # Sorts in publication order
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def current_generation() -> Optional[str]:
+    """The generation CURRENT points to, if any."""
+    try:
+        with open(os.path.join(settings.GENERATIONS_DIR, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _set_current(generation_id: str):
+    tmp = os.path.join(settings.GENERATIONS_DIR, f".{CURRENT_FILE}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(generation_id)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(settings.GENERATIONS_DIR, CURRENT_FILE))
+
+
+def list_generations() -> List[str]:
+    if not os.path.isdir(settings.GENERATIONS_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(settings.GENERATIONS_DIR)
+        if not name.startswith(".") and os.path.exists(os.path.join(settings.GENERATIONS_DIR, name, "manifest.json"))
+    )
+
+
+# --- Writer ---
+def _backup_sqlite(source: sqlite3.Connection, target_path: str):
+    """Copies a live SQLite database with the online backup API (consistent even mid-write)."""
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+
+
+def _copy_store(target_dir: str):
+    """Copies the Chroma directory and the database into `target_dir`. Call under `write_lock`."""
+    chroma_dir = os.path.join(target_dir, "chroma_db")
+    shutil.copytree(settings.CHROMA_DB_DIR, chroma_dir,
+                    ignore=shutil.ignore_patterns(vectorstore.SQLITE_FILE + "*"))
+    source = sqlite3.connect(os.path.join(settings.CHROMA_DB_DIR, vectorstore.SQLITE_FILE))
+    try:
+        _backup_sqlite(source, os.path.join(chroma_dir, vectorstore.SQLITE_FILE))
+    finally:
+        source.close()
+    session = db.SessionLocal()
+    try:
+        _backup_sqlite(session.connection().connection.driver_connection, os.path.join(target_dir, "kaas.db"))
+    finally:
+        session.close()
+
+
+def _finish_copy(target_dir: str) -> Dict:
+    """
+    Turns a copy of the live store into a generation: drops the documents still
+    being ingested and the writer-only tables. Returns the chunk and upload counts.
+    """
+    engine = create_engine(f"sqlite:///{os.path.join(target_dir, 'kaas.db')}")
+    try:
+        session = sessionmaker(bind=engine)()
+        try:
+            unfinished = [row.id for row in session.query(db.Upload.id)
+                          .filter(db.Upload.status.isnot(None), db.Upload.status != "ready")]
+            session.query(db.Upload).filter(db.Upload.id.in_(unfinished)).delete(synchronize_session=False)
+            for model in UNPUBLISHED_MODELS:
+                session.query(model).delete()
+            session.commit()
+            uploads = session.query(db.Upload).count()
+        finally:
+            session.close()
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+    finally:
+        engine.dispose()
+
+    chroma_dir = os.path.join(target_dir, "chroma_db")
+    store_client = chromadb.PersistentClient(path=chroma_dir)
+    try:
+        copied_collection, copied_index = vectorstore.open_collection(store_client, chroma_dir)
+        copied_documents = vectorstore.open_documents(store_client)
+        for upload_id in unfinished:
+            if copied_index is not None:
+                copied_index.remove(copied_collection.get(where={"upload_id": upload_id}, include=[])["ids"])
+            copied_collection.delete(where={"upload_id": upload_id})
+            copied_documents.delete(where={"upload_id": upload_id})
+        chunks = copied_collection.count()
+    finally:
+        store_client.close()
+    return {"chunks": chunks, "uploads": uploads}
+
+
+def publish_generation() -> Dict:
+    """Publishes the current knowledge base as a new generation. Returns its manifest."""
+    global published_version
+    if vectorstore.collection is None:
+        raise RuntimeError("Vector store is not initialized.")
+    with _publish_lock:
+        os.makedirs(settings.GENERATIONS_DIR, exist_ok=True)
+        generation_id = new_generation_id()
+        workdir = tempfile.mkdtemp(prefix=f".tmp-{generation_id}-", dir=settings.GENERATIONS_DIR)
+        try:
+            with vectorstore.write_lock:
+                version = vectorstore.write_version
+                _copy_store(workdir)
+            manifest = {
+                "generation": generation_id,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "embedding_model": settings.EMBEDDING_MODEL,
+                **_finish_copy(workdir),
+            }
+            with open(os.path.join(workdir, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            os.rename(workdir, os.path.join(settings.GENERATIONS_DIR, generation_id))
+        except Exception:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        _set_current(generation_id)
+        published_version = version
+        _prune()
+    print(f"Published generation {generation_id}: {manifest['chunks']} chunks, {manifest['uploads']} uploads.")
+    return manifest
+
+
+def _prune():
+    """Keeps the newest GENERATIONS_KEEP generations (and always the current one)."""
+    current = current_generation()
+    generations = list_generations()
+    for name in generations[:-max(1, settings.GENERATIONS_KEEP)]:
+        if name != current:
+            shutil.rmtree(os.path.join(settings.GENERATIONS_DIR, name), ignore_errors=True)
+
+
+def _publish_loop():
+    # Publishes once at startup (published_version is None), then whenever something was written
+    while True:
+        if vectorstore.write_version != published_version:
+            try:
+                publish_generation()
+            except Exception as e:
+                print(f"Error publishing generation: {e}")
+        if _stop.wait(settings.PUBLISH_INTERVAL_SECONDS):
+            return
+
+
+# --- Replica ---
+def load_generation(generation_id: str):
+    """Copies a published generation locally and makes it the active store and database."""
+    global last_error, _local_engine
+    source = os.path.join(settings.GENERATIONS_DIR, generation_id)
+    with open(os.path.join(source, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest["embedding_model"] != settings.EMBEDDING_MODEL:
+        raise snapshot.SnapshotError(
+            f"Generation {generation_id} was embedded with '{manifest['embedding_model']}', "
+            f"but EMBEDDING_MODEL is '{settings.EMBEDDING_MODEL}'."
+        )
+
+    local_dir = os.path.abspath(os.path.join(settings.REPLICA_DATA_DIR, generation_id))
+    shutil.rmtree(local_dir, ignore_errors=True)
+    shutil.copytree(os.path.join(source, "chroma_db"), os.path.join(local_dir, "chroma_db"))
+    shutil.copy2(os.path.join(source, "kaas.db"), os.path.join(local_dir, "kaas.db"))
+
+    chroma_dir = os.path.join(local_dir, "chroma_db")
+    store_client = chromadb.PersistentClient(path=chroma_dir)
+    loaded_collection, loaded_index = vectorstore.open_collection(store_client, chroma_dir)
+
+    if _local_engine is None:
+        _local_engine = db.engine
+    with _ref_lock:
+        # New requests see the new generation from here on
+        vectorstore.activate(store_client, loaded_collection, loaded_index)
+        db.use_database(f"sqlite:///{os.path.join(local_dir, 'kaas.db')}", local_engine=_local_engine)
+        _loaded.append({
+            "generation": generation_id,
+            "directory": local_dir,
+            "client": store_client,
+            "engine": db.engine,
+            "manifest": manifest,
+            "loaded_at": datetime.now(timezone.utc).isoformat(),
+            "refs": 0,
+        })
+        retired = _unused_generations()
+    last_error = None
+    for loaded in retired:
+        _retire(loaded)
+    print(f"Loaded generation {generation_id}: {manifest['chunks']} chunks, {manifest['uploads']} uploads.")
+
+
+def _unused_generations() -> List[Dict]:
+    """
+    Removes the oldest generations no request holds from `_loaded`, and returns
+    them. Call under `_ref_lock`. They go in order: a request can read the store
+    after a swap, so it may use a newer generation than the one it pinned.
+    """
+    unused = []
+    while len(_loaded) > 1 and _loaded[0]["refs"] == 0:
+        unused.append(_loaded.popleft())
+    return unused
+
+
+def _retire(loaded: Dict):
+    loaded["client"].close()
+    loaded["engine"].dispose()
+    shutil.rmtree(loaded["directory"], ignore_errors=True)
+
+
+def acquire() -> Optional[Dict]:
+    """Pins the active generation until `release`, so it is not deleted under a request."""
+    with _ref_lock:
+        if not _loaded:
+            return None
+        loaded = _loaded[-1]
+        loaded["refs"] += 1
+        return loaded
+
+
+def release(loaded: Optional[Dict]):
+    if loaded is None:
+        return
+    with _ref_lock:
+        loaded["refs"] -= 1
+        retired = _unused_generations()
+    for unused in retired:
+        _retire(unused)
+
+
+class PinGeneration:
+    """ASGI middleware pinning the active generation for each request, streamed responses included."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        loaded = acquire()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            release(loaded)
+
+
+def active_generation() -> Optional[str]:
+    return _loaded[-1]["generation"] if _loaded else None
+
+
+def refresh() -> bool:
+    """Loads the generation CURRENT points to if it is not the active one. Returns True on a swap."""
+    global last_error
+    with _load_lock:
+        generation_id = current_generation()
+        if generation_id is None or generation_id == active_generation():
+            return False
+        try:
+            load_generation(generation_id)
+        except Exception as e:
+            last_error = f"{generation_id}: {e}"
+            print(f"Error loading generation {generation_id}: {e}")
+            return False
+        return True
+
+
+def _watch_loop():
+    while not _stop.wait(settings.REPLICA_POLL_SECONDS):
+        refresh()
+
+
+# --- Lifecycle ---
+def start():
+    """Starts the publisher (writer) or the generation watcher (replica)."""
+    global _worker
+    node_role = role()
+    if node_role == "standalone" or _worker is not None:
+        return
+    _stop.clear()
+    if node_role == "writer":
+        target, name = _publish_loop, "generation-publisher"
+    else:
+        os.makedirs(settings.REPLICA_DATA_DIR, exist_ok=True)
+        if not refresh():
+            print("No generation published yet; waiting for the writer.")
+        target, name = _watch_loop, "generation-watcher"
+    _worker = threading.Thread(target=target, name=name, daemon=True)
+    _worker.start()
+
+
+def stop():
+    global _worker
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout=5)
+        _worker = None
+
+
+def status() -> Dict:
+    result = {"role": role(), "current": current_generation(), "generations": list_generations()}
+    if result["role"] == "writer":
+        result["published_version"] = published_version
+        result["write_version"] = vectorstore.write_version
+    elif result["role"] == "replica":
+        latest = _loaded[-1] if _loaded else None
+        result["active"] = latest["generation"] if latest else None
+        result["loaded_at"] = latest["loaded_at"] if latest else None
+        result["chunks"] = latest["manifest"]["chunks"] if latest else None
+        result["last_error"] = last_error
+    return result
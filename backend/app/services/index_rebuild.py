@@ -0,0 +1,97 @@
+"""
+Online rebuild of the chunk collection.
+
+HNSW space, M and construction ef (and the vector representation) are fixed
+when a collection is built. A rebuild creates a new collection with the current
+settings and fills it from the stored embeddings (nothing is re-embedded) while
+the old one keeps serving:
+
+1. `vectorstore.begin_rebuild` creates the collection; from then on every write
+   (ingestion, deletes, imports) goes to both collections.
+2. The stored chunks are copied page by page, each page under the write lock so
+   no write interleaves with it.
+3. Under the write lock, the id sets are reconciled (pages can shift while
+   deletes run) and `vectorstore.finish_rebuild` switches over atomically.
+
+It runs as a tracked job (see `jobs`); `/reset` cancels it.
+"""
+from typing import Dict, List, Optional, Set
+
+from . import jobs, vectorstore
+
+COPY_PAGE_SIZE = 2000
+
+
+def _all_ids(target_collection) -> Set[str]:
+    ids: Set[str] = set()
+    offset = 0
+    while True:
+        page = target_collection.get(include=[], limit=COPY_PAGE_SIZE * 5, offset=offset)["ids"]
+        if not page:
+            return ids
+        ids.update(page)
+        offset += len(page)
+
+
+def _copy(source, target, ids: Optional[List[str]] = None, offset: Optional[int] = None):
+    """
+    Copies one page (or the given ids) of `source` into `target`, skipping ids it
+    already has. Chunks without a stored vector are not copied.
+    """
+    page_ids, texts, metadatas, vectors = vectorstore.read_page(
+        *source, limit=None if ids is not None else COPY_PAGE_SIZE, offset=offset, ids=ids)
+    if not page_ids:
+        return
+    target_collection, target_index = target
+    present = set(target_collection.get(ids=page_ids, include=[])["ids"])
+    keep = [i for i, chunk_id in enumerate(page_ids) if chunk_id not in present]
+    if keep:
+        vectorstore.add_batch(target_collection, target_index, [page_ids[i] for i in keep],
+                              [texts[i] for i in keep], [metadatas[i] for i in keep], vectors[keep])
+
+
+def rebuild(job: Optional[jobs.JobContext] = None) -> Dict:
+    """Rebuilds the chunk collection with the configured index parameters. Returns a summary."""
+    target = vectorstore.begin_rebuild()
+    try:
+        source = (vectorstore.collection, vectorstore.index)
+        total = source[0].count()
+        copied = 0
+        while True:
+            with vectorstore.write_lock:
+                if vectorstore.rebuild_target is not target:
+                    raise RuntimeError("Index rebuild was cancelled.")
+                if copied >= source[0].count():
+                    break
+                _copy(source, target, offset=copied)
+            # Pages can come back short, so step by the page size
+            copied += COPY_PAGE_SIZE
+            if job is not None:
+                job.progress(min(copied, total), total)
+
+        with vectorstore.write_lock:
+            if vectorstore.rebuild_target is not target:
+                raise RuntimeError("Index rebuild was cancelled.")
+            source_ids, target_ids = _all_ids(source[0]), _all_ids(target[0])
+            missing = sorted(source_ids - target_ids)
+            for start in range(0, len(missing), COPY_PAGE_SIZE):
+                _copy(source, target, ids=missing[start:start + COPY_PAGE_SIZE])
+            extra = sorted(target_ids - source_ids)
+            if extra:
+                if target[1] is not None:
+                    target[1].remove(extra)
+                target[0].delete(ids=extra)
+            vectorstore.finish_rebuild(target)
+    except Exception:
+        vectorstore.cancel_rebuild(target)
+        raise
+
+    result = {"chunks": len(source_ids), "reconciled_missing": len(missing), "reconciled_extra": len(extra),
+              "hnsw": vectorstore.collection_hnsw(target[0])}
+    print(f"Index rebuild finished: {result}")
+    return result
+
+
+@jobs.register("index_rebuild")
+def _rebuild_job(job: jobs.JobContext) -> Dict:
+    return rebuild(job)
@@ -0,0 +1,202 @@
+"""
+Tracked background jobs.
+
+Long-running maintenance (bulk deletes, retention, compaction) is submitted as a
+job: a row in the `jobs` table that the request returns right away, and that a
+single worker thread runs in submission order. Running jobs one at a time keeps
+deletes and compactions from competing for the vector store's write lock.
+
+Handlers are registered per job kind and receive a `JobContext` with the JSON
+parameters the job was submitted with, so jobs interrupted by a restart are
+simply run again on startup (every handler is idempotent).
+"""
+import json
+import queue
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from .. import db
+
+handlers: Dict[str, Callable[["JobContext"], Optional[Dict]]] = {}
+
+_queue: "queue.Queue[Optional[str]]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+class JobContext:
+    """What a handler sees of its job: the parameters and a progress reporter."""
+
+    def __init__(self, job_id: str, params: Dict):
+        self.job_id = job_id
+        self.params = params
+
+    def progress(self, done: int, total: Optional[int] = None):
+        fields = {"progress": done}
+        if total is not None:
+            fields["total"] = total
+        _update(self.job_id, **fields)
+
+
+def register(kind: str):
+    """Decorator registering the handler for a job kind."""
+    def decorator(fn):
+        handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def _update(job_id: str, **fields):
+    session = db.SessionLocal()
+    try:
+        session.query(db.Job).filter(db.Job.id == job_id).update(fields)
+        session.commit()
+    finally:
+        session.close()
+
+
+def to_dict(job: db.Job) -> Dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": json.loads(job.params) if job.params else {},
+        "progress": job.progress,
+        "total": job.total,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def submit(kind: str, params: Optional[Dict] = None) -> Dict:
+    """Records a job and queues it. Returns the job as a dict."""
+    if kind not in handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    session = db.SessionLocal()
+    try:
+        job = db.Job(id=str(uuid.uuid4()), kind=kind, status="pending", params=json.dumps(params or {}))
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+        result = to_dict(job)
+    finally:
+        session.close()
+    _ensure_worker()
+    _queue.put(result["id"])
+    return result
+
+
+def get(job_id: str) -> Optional[Dict]:
+    session = db.SessionLocal()
+    try:
+        job = session.query(db.Job).filter(db.Job.id == job_id).first()
+        return to_dict(job) if job else None
+    finally:
+        session.close()
+
+
+def list_jobs(limit: int = 50, kind: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+    session = db.SessionLocal()
+    try:
+        rows = session.query(db.Job)
+        if kind:
+            rows = rows.filter(db.Job.kind == kind)
+        if status:
+            rows = rows.filter(db.Job.status == status)
+        return [to_dict(job) for job in rows.order_by(db.Job.created_at.desc()).limit(limit)]
+    finally:
+        session.close()
+
+
+def active() -> bool:
+    """True while jobs are queued or running."""
+    return _queue.unfinished_tasks > 0
+
+
+def prune(session, older_than_days: int) -> int:
+    """Deletes finished jobs older than `older_than_days`. Returns the number deleted."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    return session.query(db.Job).filter(
+        db.Job.status.in_(("succeeded", "failed")), db.Job.created_at < cutoff
+    ).delete(synchronize_session=False)
+
+
+def run(job_id: str):
+    """Runs one job in the calling thread, recording its outcome."""
+    session = db.SessionLocal()
+    try:
+        job = session.query(db.Job).filter(db.Job.id == job_id).first()
+        if job is None or job.status in ("succeeded", "failed"):
+            return
+        kind, params = job.kind, json.loads(job.params) if job.params else {}
+    finally:
+        session.close()
+
+    _update(job_id, status="running", started_at=datetime.now(timezone.utc), error=None)
+    try:
+        result = handlers[kind](JobContext(job_id, params))
+    except Exception as e:
+        print(f"Job {job_id} ({kind}) failed: {e}")
+        _update(job_id, status="failed", error=str(e)[:1000], finished_at=datetime.now(timezone.utc))
+        return
+    _update(job_id, status="succeeded", result=json.dumps(result or {}, default=str),
+            finished_at=datetime.now(timezone.utc))
+
+
+def _work():
+    while True:
+        job_id = _queue.get()
+        try:
+            if job_id is None:
+                return
+            run(job_id)
+        except Exception as e:
+            print(f"Error running job {job_id}: {e}")
+        finally:
+            _queue.task_done()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name="job-worker", daemon=True)
+            _worker.start()
+
+
+def start():
+    """Re-queues jobs a previous process left pending or running, and starts the worker."""
+    session = db.SessionLocal()
+    try:
+        leftover = [job.id for job in session.query(db.Job)
+                    .filter(db.Job.status.in_(("pending", "running"))).order_by(db.Job.created_at)]
+    finally:
+        session.close()
+    _ensure_worker()
+    for job_id in leftover:
+        _queue.put(job_id)
+    if leftover:
+        print(f"Resuming {len(leftover)} unfinished jobs.")
+
+
+def stop(timeout: float = 5):
+    """Stops the worker after the job it is running (queued jobs resume on the next start)."""
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is None:
+        return
+    # Drop queued ids; their rows stay pending
+    try:
+        while True:
+            _queue.get_nowait()
+            _queue.task_done()
+    except queue.Empty:
+        pass
+    _queue.put(None)
+    worker.join(timeout=timeout)
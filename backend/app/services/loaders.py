@@ -0,0 +1,435 @@
+"""
+Format loader registry.
+
+Each loader declares how to recognise its format from the first bytes of a
+file (content sniffing, with the extension only as a tie-breaker between text
+formats) and how to stream the file as text segments:
+
+    {"text": "...", "metadata": {"section": "Intro > Setup"}}
+
+Segments are yielded incrementally, so large files are never fully loaded.
+Consecutive segments with equal metadata are chunked as one continuous text
+by `chunking.chunk_segments`; a metadata change is a chunk boundary.
+"""
+import csv
+import io
+import json
+import os
+import re
+import zipfile
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from . import text_loader
+
+SNIFF_BYTES = 8192
+READ_BLOCK_CHARS = 64 * 1024
+# Long sections are emitted in pieces of about this size (same metadata, so the
+# chunker still treats them as one continuous text)
+MAX_SEGMENT_CHARS = 64 * 1024
+# Rows of CSV/JSONL files are grouped into segments of about this many characters
+ROW_GROUP_CHARS = 1000
+# Ambiguous content (prose with commas, '#' lines) in these files is read as plain text
+PLAIN_TEXT_EXTENSIONS = (".txt",)
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+
+
+class LoaderSpec:
+    def __init__(self, name: str, sniff: Callable[[bytes, str, str], bool], load: Callable[[str], Iterator[Dict]],
+                 extensions: Tuple[str, ...]):
+        self.name = name
+        self.sniff = sniff
+        self.load = load
+        self.extensions = extensions
+
+
+# Ordered: the first loader whose sniffer accepts the file wins
+_registry: List[LoaderSpec] = []
+
+
+def register_loader(name: str, sniff: Callable[[bytes, str, str], bool], extensions: Tuple[str, ...] = ()):
+    """
+    Decorator registering `load(path) -> Iterator[segment]` for a format.
+    `sniff(head, filename, path)` gets the first SNIFF_BYTES of the file, the
+    lower-cased filename and the path, and returns True if it recognises the format.
+    """
+    def decorator(load: Callable[[str], Iterator[Dict]]):
+        _registry.append(LoaderSpec(name, sniff, load, extensions))
+        return load
+    return decorator
+
+
+def supported_extensions() -> List[str]:
+    """Extensions of the registered formats, for upload pickers."""
+    return [ext for spec in _registry for ext in spec.extensions]
+
+
+def get_loader(name: str) -> LoaderSpec:
+    for spec in _registry:
+        if spec.name == name:
+            return spec
+    raise KeyError(name)
+
+
+def sniff_format(path: str, filename: Optional[str] = None) -> Optional[str]:
+    """Identifies the format of a file from its leading bytes. Returns None if unsupported."""
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    filename = (filename or os.path.basename(path)).lower()
+    for spec in _registry:
+        try:
+            if spec.sniff(head, filename, path):
+                return spec.name
+        except Exception:
+            continue
+    return None
+
+
+def load_segments(path: str, format_name: str) -> Iterator[Dict]:
+    """Streams the segments of a file with the loader registered for `format_name`."""
+    return get_loader(format_name).load(path)
+
+
+# --- Shared helpers ---
+def _decode_head(head: bytes) -> Optional[str]:
+    """Decodes a sniffing sample as text, or None if it looks binary."""
+    if b"\x00" in head and not head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return None
+    encoding = text_loader.detect_encoding(head)
+    return head.decode(encoding, errors="ignore")
+
+
+def _open_text(path: str):
+    with open(path, "rb") as f:
+        encoding = text_loader.detect_encoding(f.read(SNIFF_BYTES))
+    return open(path, "r", encoding=encoding, errors="replace", newline="")
+
+
+def _split_long(text: str, metadata: Dict) -> Iterator[Dict]:
+    for start in range(0, len(text), MAX_SEGMENT_CHARS):
+        yield {"text": text[start:start + MAX_SEGMENT_CHARS], "metadata": metadata}
+
+
+class _SectionBuilder:
+    """Accumulates text for the current heading path and flushes it as segments."""
+
+    def __init__(self):
+        self.headings: List[Tuple[int, str]] = []
+        self.parts: List[str] = []
+        self.size = 0
+
+    def metadata(self) -> Dict:
+        return {"section": " > ".join(title for _, title in self.headings)} if self.headings else {}
+
+    def add(self, text: str) -> Iterator[Dict]:
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= MAX_SEGMENT_CHARS:
+            yield from self.flush()
+
+    def heading(self, level: int, title: str) -> Iterator[Dict]:
+        yield from self.flush()
+        self.headings = [(lvl, t) for lvl, t in self.headings if lvl < level] + [(level, title)]
+        # The heading text itself belongs to its section
+        self.parts.append(title + "\n")
+        self.size += len(title) + 1
+
+    def flush(self) -> Iterator[Dict]:
+        text = "".join(self.parts)
+        self.parts, self.size = [], 0
+        if text.strip():
+            yield from _split_long(text, self.metadata())
+
+
+# --- PDF ---
+def _sniff_pdf(head: bytes, filename: str, path: str) -> bool:
+    return head.startswith(b"%PDF-")
+
+
+@register_loader("pdf", _sniff_pdf, (".pdf",))
+def load_pdf(path: str) -> Iterator[Dict]:
+    """One segment per page."""
+    import fitz
+
+    with fitz.open(path) as document:
+        for page_num in range(len(document)):
+            text = document.load_page(page_num).get_text()
+            if text:
+                yield {"text": text, "metadata": {"page": page_num + 1}}
+
+
+# --- DOCX ---
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_HEADING_STYLE_RE = re.compile(r"^heading\s*(\d)$", re.IGNORECASE)
+
+
+def _sniff_docx(head: bytes, filename: str, path: str) -> bool:
+    if not head.startswith(b"PK\x03\x04"):
+        return False
+    with zipfile.ZipFile(path) as archive:
+        return "word/document.xml" in archive.namelist()
+
+
+def _docx_heading_level(paragraph) -> Optional[int]:
+    style = paragraph.find(f"{W_NS}pPr/{W_NS}pStyle")
+    if style is None:
+        return None
+    value = style.get(f"{W_NS}val", "")
+    if value.lower() == "title":
+        return 1
+    match = _HEADING_STYLE_RE.match(value)
+    return int(match.group(1)) if match else None
+
+
+@register_loader("docx", _sniff_docx, (".docx",))
+def load_docx(path: str) -> Iterator[Dict]:
+    """Streams paragraphs from word/document.xml; heading styles start new sections."""
+    builder = _SectionBuilder()
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml_stream:
+        depth = 0
+        for event, element in ElementTree.iterparse(xml_stream, events=("start", "end")):
+            if element.tag != f"{W_NS}p":
+                continue
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth > 0:
+                # Paragraph inside a text box: read as part of its enclosing paragraph
+                continue
+            text = "".join(node.text or "" for node in element.iter(f"{W_NS}t"))
+            level = _docx_heading_level(element)
+            if level is not None and text.strip():
+                yield from builder.heading(level, text.strip())
+            elif text:
+                yield from builder.add(text + "\n")
+            # Free the parsed paragraph so memory stays bounded on large documents
+            element.clear()
+    yield from builder.flush()
+
+
+# --- HTML ---
+def _sniff_html(head: bytes, filename: str, path: str) -> bool:
+    text = _decode_head(head)
+    if text is None:
+        return False
+    start = text.lstrip().lower()[:512]
+    return start.startswith(("<!doctype html", "<html")) or ("<html" in start and "<body" in text.lower())
+
+
+class _StreamingHTMLParser(HTMLParser):
+    BLOCK_TAGS = {"p", "div", "li", "tr", "br", "section", "article", "table", "ul", "ol", "pre", "blockquote"}
+    SKIP_TAGS = {"script", "style", "noscript", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.builder = _SectionBuilder()
+        self.ready: List[Dict] = []
+        self.skip_depth = 0
+        self.heading_level: Optional[int] = None
+        self.heading_parts: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif len(tag) == 2 and tag[0] == "h" and tag[1].isdigit():
+            self.heading_level = int(tag[1])
+            self.heading_parts = []
+        elif tag in self.BLOCK_TAGS:
+            self.ready.extend(self.builder.add("\n"))
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif self.heading_level is not None and len(tag) == 2 and tag[0] == "h" and tag[1].isdigit():
+            title = " ".join("".join(self.heading_parts).split())
+            if title:
+                self.ready.extend(self.builder.heading(self.heading_level, title))
+            self.heading_level = None
+        elif tag in self.BLOCK_TAGS:
+            self.ready.extend(self.builder.add("\n"))
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if self.heading_level is not None:
+            self.heading_parts.append(data)
+        elif data.strip():
+            self.ready.extend(self.builder.add(data))
+
+    def drain(self) -> List[Dict]:
+        ready, self.ready = self.ready, []
+        return ready
+
+
+@register_loader("html", _sniff_html, (".html", ".htm"))
+def load_html(path: str) -> Iterator[Dict]:
+    """Feeds the parser block by block; h1-h6 start new sections; scripts/styles are dropped."""
+    parser = _StreamingHTMLParser()
+    with _open_text(path) as f:
+        while True:
+            block = f.read(READ_BLOCK_CHARS)
+            if not block:
+                break
+            parser.feed(block)
+            yield from parser.drain()
+    parser.close()
+    yield from parser.drain()
+    yield from parser.builder.flush()
+
+
+# --- JSONL ---
+def _sniff_jsonl(head: bytes, filename: str, path: str) -> bool:
+    text = _decode_head(head)
+    if text is None:
+        return False
+    lines = [line for line in text.splitlines() if line.strip()]
+    # The last line of the sample may be cut off
+    complete = lines[:-1] if len(lines) > 1 and len(head) == SNIFF_BYTES else lines
+    if not complete:
+        return False
+    for line in complete[:20]:
+        if not isinstance(json.loads(line), dict):
+            return False
+    return True
+
+
+def _flatten(value, prefix: str = "") -> Iterator[str]:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, list):
+        yield f"{prefix.rstrip('.')}: {', '.join(str(v) for v in value)}"
+    else:
+        yield f"{prefix.rstrip('.')}: {value}"
+
+
+def _group_rows(rows: Iterator[Tuple[int, str]], unit: str) -> Iterator[Dict]:
+    """Groups rendered rows into segments of about ROW_GROUP_CHARS, never splitting a row."""
+    parts: List[str] = []
+    first = last = None
+    size = 0
+    for number, text in rows:
+        if parts and size + len(text) > ROW_GROUP_CHARS:
+            yield {"text": "".join(parts), "metadata": {f"{unit}_start": first, f"{unit}_end": last}}
+            parts, size = [], 0
+        if not parts:
+            first = number
+        parts.append(text)
+        size += len(text)
+        last = number
+    if parts:
+        yield {"text": "".join(parts), "metadata": {f"{unit}_start": first, f"{unit}_end": last}}
+
+
+@register_loader("jsonl", _sniff_jsonl, (".jsonl", ".ndjson"))
+def load_jsonl(path: str) -> Iterator[Dict]:
+    """Each JSON object becomes `key: value` lines; objects are grouped by line ranges."""
+    def rows():
+        with _open_text(path) as f:
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                yield number, "; ".join(_flatten(record)) + "\n"
+    return _group_rows(rows(), "line")
+
+
+# --- CSV ---
+def _csv_sample(text: str, truncated: bool) -> str:
+    """The first complete non-empty lines of a sample (the last line of a truncated one may be cut off)."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if truncated:
+        lines = lines[:-1]
+    return "\n".join(lines[:20])
+
+
+def _csv_dialect(sample: str):
+    return csv.Sniffer().sniff(sample, delimiters=",;\t|")
+
+
+def _sniff_csv(head: bytes, filename: str, path: str) -> bool:
+    text = _decode_head(head)
+    # A Markdown file that is mostly a pipe table is still Markdown: the extension breaks the tie
+    if text is None or filename.endswith(PLAIN_TEXT_EXTENSIONS + MARKDOWN_EXTENSIONS):
+        return False
+    sample = _csv_sample(text, len(head) == SNIFF_BYTES)
+    if sample.count("\n") < 1:
+        return False
+    widths = {len(row) for row in csv.reader(io.StringIO(sample), _csv_dialect(sample))}
+    # Every row must have the same number of fields, and more than one
+    return len(widths) == 1 and widths.pop() > 1
+
+
+@register_loader("csv", _sniff_csv, (".csv", ".tsv"))
+def load_csv(path: str) -> Iterator[Dict]:
+    """Rows become `column: value` lines under the header; rows are grouped by row ranges."""
+    def rows():
+        with _open_text(path) as f:
+            sample = f.read(SNIFF_BYTES)
+            f.seek(0)
+            # Same sample handling as the sniffer, so a file that was accepted loads
+            reader = csv.reader(f, _csv_dialect(_csv_sample(sample, len(sample) == SNIFF_BYTES)))
+            header = next(reader, None)
+            if header is None:
+                return
+            for number, row in enumerate(reader, start=2):
+                if not any(cell.strip() for cell in row):
+                    continue
+                fields = [f"{column}: {value}" for column, value in zip(header, row) if value.strip()]
+                yield number, "; ".join(fields) + "\n"
+    return _group_rows(rows(), "row")
+
+
+# --- Markdown ---
+_MD_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+def _sniff_markdown(head: bytes, filename: str, path: str) -> bool:
+    text = _decode_head(head)
+    if text is None:
+        return False
+    if filename.endswith(MARKDOWN_EXTENSIONS):
+        return True
+    if filename.endswith(PLAIN_TEXT_EXTENSIONS):
+        return False
+    lines = text.splitlines()
+    headings = sum(1 for line in lines if _MD_HEADING_RE.match(line))
+    fences = sum(1 for line in lines if line.startswith("```"))
+    return headings >= 2 or (headings >= 1 and fences >= 2)
+
+
+@register_loader("markdown", _sniff_markdown, MARKDOWN_EXTENSIONS)
+def load_markdown(path: str) -> Iterator[Dict]:
+    """ATX headings (`#`..`######`) start new sections; fenced code is kept verbatim."""
+    builder = _SectionBuilder()
+    in_fence = False
+    with _open_text(path) as f:
+        for line in f:
+            if line.startswith(("```", "~~~")):
+                in_fence = not in_fence
+            match = None if in_fence else _MD_HEADING_RE.match(line)
+            if match:
+                yield from builder.heading(len(match.group(1)), match.group(2))
+            else:
+                yield from builder.add(line)
+    yield from builder.flush()
+
+
+# --- Plain text (fallback for anything that decodes as text) ---
+def _sniff_text(head: bytes, filename: str, path: str) -> bool:
+    return _decode_head(head) is not None
+
+
+@register_loader("text", _sniff_text, (".txt",))
+def load_text(path: str) -> Iterator[Dict]:
+    """
+    Memory-mapped, incrementally decoded windows with identical metadata, i.e.
+    one continuous text (see `text_loader.iter_text_windows`).
+    """
+    for window in text_loader.iter_text_windows(path):
+        yield {"text": window["text"], "metadata": {}}
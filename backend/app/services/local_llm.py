@@ -0,0 +1,277 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import List, Optional
+from ..config import settings
+
+# Fixed parts of the local prompt. They are tokenized once when the engine starts
+# and the cached token ids are reused for every request, so only the question and
+# context are tokenized per call.
+PROMPT_PREFIX = "Answer the question using only the context.\n\nContext: "
+PROMPT_QUESTION = "\n\nQuestion: "
+PROMPT_SUFFIX = "\n\nAnswer:"
+
+# After a failed model load, requests fail fast for this long before a retry
+LOAD_RETRY_SECONDS = 60.0
+
+
+class _PendingRequest:
+    def __init__(self, question: str, context: str):
+        self.question = question
+        self.context = context
+        self.future: Future = Future()
+
+
+class LocalGenerationEngine:
+    """
+    Local Hugging Face generation with dynamic batching.
+
+    Requests from concurrent API workers are put on a queue. A single worker
+    thread drains the queue into batches of up to `max_batch_size` (waiting at
+    most `max_wait_ms` for a batch to fill), pads them and runs one `generate`
+    call per batch. Works with encoder-decoder models (flan-t5) and decoder-only
+    causal models.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_batch_size: int = 8,
+        max_wait_ms: int = 20,
+        max_input_tokens: int = 512,
+        max_new_tokens: int = 150,
+        num_threads: int = 0,
+        quantize: bool = False,
+    ):
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self.max_input_tokens = max_input_tokens
+        self.max_new_tokens = max_new_tokens
+        self.num_threads = num_threads
+        self.quantize = quantize
+
+        self.tokenizer = None
+        self.model = None
+        self.is_encoder_decoder = True
+        self._prefix_ids: List[int] = []
+        self._question_ids: List[int] = []
+        self._suffix_ids: List[int] = []
+
+        self._queue: "queue.Queue[Optional[_PendingRequest]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._running = False
+
+    # --- Lifecycle ---
+    def load(self):
+        """Loads the tokenizer and model and caches the encoded prompt template."""
+        import torch
+        from transformers import AutoConfig, AutoTokenizer, AutoModelForSeq2SeqLM, AutoModelForCausalLM
+
+        if self.num_threads > 0:
+            # torch thread pools are process wide; this also affects the embedding model
+            torch.set_num_threads(self.num_threads)
+
+        config = AutoConfig.from_pretrained(self.model_name)
+        self.is_encoder_decoder = bool(getattr(config, "is_encoder_decoder", False))
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        if self.is_encoder_decoder:
+            model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
+        else:
+            model = AutoModelForCausalLM.from_pretrained(self.model_name)
+            if self.tokenizer.pad_token_id is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        if self.quantize:
+            # Dynamic int8 quantization of the linear layers: smaller and faster on CPU
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            print(f"Local LLM '{self.model_name}' quantized to int8.")
+
+        model.eval()
+        self.model = model
+        self._cache_template()
+
+    def _cache_template(self):
+        self._prefix_ids = self._tokenize(PROMPT_PREFIX)
+        self._question_ids = self._tokenize(PROMPT_QUESTION)
+        self._suffix_ids = self._tokenize(PROMPT_SUFFIX)
+        if self.is_encoder_decoder and self.tokenizer.eos_token_id is not None:
+            self._suffix_ids = self._suffix_ids + [self.tokenizer.eos_token_id]
+
+    def start(self):
+        """Loads the model if needed and starts the batching worker."""
+        if self.model is None:
+            self.load()
+        if self._running:
+            return
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="local-llm-batcher", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """Stops the worker; queued requests are failed."""
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is not None and not pending.future.done():
+                pending.future.set_exception(RuntimeError("Local generation engine stopped."))
+
+    # --- Public API ---
+    def submit(self, question: str, context: str) -> Future:
+        """Queues a request and returns a Future resolving to the generated text."""
+        if not self._running:
+            raise RuntimeError("Local generation engine is not running.")
+        request = _PendingRequest(question, context)
+        self._queue.put(request)
+        return request.future
+
+    def generate(self, question: str, context: str, timeout: Optional[float] = None) -> str:
+        """Blocking helper around `submit`. A request that times out while queued is dropped."""
+        future = self.submit(question, context)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    # --- Encoding ---
+    def _tokenize(self, text: str) -> List[int]:
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def encode(self, question: str, context: str) -> List[int]:
+        """
+        Builds the input ids from the cached template ids plus the tokenized question
+        and context. The context is truncated by tokens so the question always fits;
+        a question longer than the whole budget is truncated itself, never the template.
+        """
+        template = len(self._prefix_ids) + len(self._question_ids) + len(self._suffix_ids)
+        question_ids = self._tokenize(question)[:max(0, self.max_input_tokens - template)]
+        budget = max(0, self.max_input_tokens - template - len(question_ids))
+        context_ids = self._tokenize(context)[:budget]
+        return self._prefix_ids + context_ids + self._question_ids + question_ids + self._suffix_ids
+
+    # --- Batching worker ---
+    def _collect_batch(self, first: _PendingRequest) -> List[_PendingRequest]:
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._running = False
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while self._running:
+            first = self._queue.get()
+            if first is None:
+                break
+            # Requests whose caller timed out (cancelled futures) are not computed
+            batch = [r for r in self._collect_batch(first) if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                outputs = self._generate_batch(batch)
+                for request, text in zip(batch, outputs):
+                    request.future.set_result(text)
+            except Exception as e:
+                print(f"Error during local batch generation: {e}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _generate_batch(self, batch: List[_PendingRequest]) -> List[str]:
+        import torch
+
+        encoded = [self.encode(r.question, r.context) for r in batch]
+        longest = max(len(ids) for ids in encoded)
+        pad_id = self.tokenizer.pad_token_id or 0
+
+        input_ids, attention_mask = [], []
+        for ids in encoded:
+            padding = [pad_id] * (longest - len(ids))
+            mask = [1] * len(ids)
+            if self.is_encoder_decoder:
+                input_ids.append(ids + padding)
+                attention_mask.append(mask + [0] * len(padding))
+            else:
+                # Decoder-only models must be left padded so generation continues the prompt
+                input_ids.append(padding + ids)
+                attention_mask.append([0] * len(padding) + mask)
+
+        with torch.inference_mode():
+            output_ids = self.model.generate(
+                input_ids=torch.tensor(input_ids),
+                attention_mask=torch.tensor(attention_mask),
+                max_new_tokens=self.max_new_tokens,
+                num_beams=1,
+                do_sample=False,
+                pad_token_id=pad_id,
+            )
+        if not self.is_encoder_decoder:
+            output_ids = output_ids[:, longest:]
+        return [text.strip() for text in self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)]
+
+
+# --- Module-level engine, created lazily on first use ---
+_engine: Optional[LocalGenerationEngine] = None
+_engine_error: Optional[Exception] = None
+_engine_failed_at = 0.0
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> LocalGenerationEngine:
+    """Returns the shared engine, loading the model and starting it on first use."""
+    global _engine, _engine_error, _engine_failed_at
+    if _engine_error is not None and time.monotonic() - _engine_failed_at < LOAD_RETRY_SECONDS:
+        # Don't retry a multi-second model load on every request after a failure
+        raise RuntimeError(f"Local generation engine failed to load: {_engine_error}")
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None and (_engine_error is None or time.monotonic() - _engine_failed_at >= LOAD_RETRY_SECONDS):
+                engine = LocalGenerationEngine(
+                    model_name=settings.LOCAL_LLM_MODEL,
+                    max_batch_size=settings.LOCAL_LLM_MAX_BATCH_SIZE,
+                    max_wait_ms=settings.LOCAL_LLM_MAX_WAIT_MS,
+                    max_input_tokens=settings.LOCAL_LLM_MAX_INPUT_TOKENS,
+                    max_new_tokens=settings.LOCAL_LLM_MAX_NEW_TOKENS,
+                    num_threads=settings.LOCAL_LLM_THREADS,
+                    quantize=settings.LOCAL_LLM_QUANTIZE,
+                )
+                print(f"Initializing local generation engine ({settings.LOCAL_LLM_MODEL})...")
+                try:
+                    engine.start()
+                except Exception as e:
+                    print(f"Error initializing local generation engine: {e}")
+                    _engine_error = e
+                    _engine_failed_at = time.monotonic()
+                    raise
+                print("Local generation engine initialized.")
+                _engine, _engine_error = engine, None
+    if _engine is None:
+        raise RuntimeError(f"Local generation engine failed to load: {_engine_error}")
+    return _engine
+
+
+def shutdown_engine():
+    """Stops the shared engine if it was started."""
+    global _engine
+    if _engine is not None:
+        _engine.stop()
+        _engine = None
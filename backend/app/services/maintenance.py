@@ -0,0 +1,292 @@
+"""
+Bulk deletion, retention policies and background compaction.
+
+All three run as tracked jobs (see `jobs`):
+
+- "delete" removes a fixed list of uploads: vectors, routing and dedup rows,
+  the uploads' audit log rows and the upload rows themselves.
+- "retention" deletes uploads older than UPLOAD_RETENTION_DAYS and archives (or
+  drops) audit log rows older than AUDIT_LOG_RETENTION_DAYS.
+- "compaction" removes orphaned audit log rows and old jobs, rewrites the
+  quantized vector index without deleted rows, and runs VACUUM/ANALYZE on the
+  uploads database and Chroma's SQLite file.
+
+A maintenance thread submits retention every MAINTENANCE_INTERVAL_SECONDS when a
+policy is set, and compaction when there is space to reclaim and the node has
+been idle (no requests, no busy admission stage) for COMPACTION_IDLE_SECONDS.
+Each pass also drops resumable upload sessions past UPLOAD_SESSION_TTL_HOURS.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..config import settings
+from . import admission, analytics, dedup, jobs, uploads, vectorstore
+
+IN_PROGRESS_STATUSES = ("pending", "processing")
+
+_last_request = time.monotonic()
+_worker: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+# --- Selection ---
+def _glob_to_like(pattern: str) -> str:
+    """Filename glob (`*`, `?`) as a LIKE pattern with `\\` as the escape character."""
+    escaped = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped.replace("*", "%").replace("?", "_")
+
+
+def select_uploads(session: Session, upload_ids: Optional[List[str]] = None,
+                   filename_pattern: Optional[str] = None, older_than_days: Optional[float] = None,
+                   include_in_progress: bool = True) -> List[db.Upload]:
+    """Uploads matching every given criterion, oldest first."""
+    rows = session.query(db.Upload)
+    if upload_ids is not None:
+        rows = rows.filter(db.Upload.id.in_(upload_ids))
+    if filename_pattern:
+        rows = rows.filter(db.Upload.filename.like(_glob_to_like(filename_pattern), escape="\\"))
+    if older_than_days is not None:
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).replace(tzinfo=None)
+        rows = rows.filter(db.Upload.created_at < cutoff)
+    if not include_in_progress:
+        rows = rows.filter(or_(db.Upload.status.is_(None), db.Upload.status.notin_(IN_PROGRESS_STATUSES)))
+    return rows.order_by(db.Upload.created_at, db.Upload.id).all()
+
+
+# --- Deletion ---
+def delete_uploads(upload_ids: List[str], job: Optional[jobs.JobContext] = None) -> Dict:
+    """
+    Deletes uploads one by one, each in its own transaction. Missing ids, and
+    uploads still being ingested (whose remaining chunks would outlive the delete),
+    are skipped.
+    """
+    deleted, missing, in_progress = [], [], []
+    if job is not None:
+        job.progress(0, len(upload_ids))
+    for done, upload_id in enumerate(upload_ids, start=1):
+        session = db.SessionLocal()
+        try:
+            upload = session.query(db.Upload).filter(db.Upload.id == upload_id).first()
+            if upload is None:
+                missing.append(upload_id)
+            elif upload.status in IN_PROGRESS_STATUSES:
+                in_progress.append(upload_id)
+            else:
+                # Hand chunks other documents link to over to a duplicate, then delete from ChromaDB.
+                # Under the write lock, so a snapshot never sees the heirs and the links apart
+                with vectorstore.write_lock:
+                    dedup.release_upload(session, upload_id)
+                    vectorstore.delete_by_upload_id(upload_id)
+                    session.query(db.AuditLog).filter(db.AuditLog.upload_id == upload_id).delete(synchronize_session=False)
+                    session.delete(upload)
+                    session.commit()
+                deleted.append(upload_id)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if job is not None:
+            job.progress(done)
+
+    if deleted:
+        session = db.SessionLocal()
+        try:
+            session.add(db.AuditLog(event_type="delete", response_text=f"Deleted {len(deleted)} documents."))
+            analytics.record_event(session, "delete")
+            session.commit()
+        finally:
+            session.close()
+    return {"deleted": len(deleted), "missing": missing, "in_progress": in_progress}
+
+
+@jobs.register("delete")
+def _delete_job(job: jobs.JobContext) -> Dict:
+    return delete_uploads(job.params["upload_ids"], job)
+
+
+# --- Retention ---
+def apply_retention(job: Optional[jobs.JobContext] = None) -> Dict:
+    result = {"uploads_deleted": 0, "audit_rows_archived": 0, "audit_rows_deleted": 0}
+    if settings.UPLOAD_RETENTION_DAYS > 0:
+        session = db.SessionLocal()
+        try:
+            expired = [upload.id for upload in select_uploads(
+                session, older_than_days=settings.UPLOAD_RETENTION_DAYS, include_in_progress=False)]
+        finally:
+            session.close()
+        result["uploads_deleted"] = delete_uploads(expired, job)["deleted"]
+
+    if settings.AUDIT_LOG_RETENTION_DAYS > 0:
+        session = db.SessionLocal()
+        try:
+            if settings.AUDIT_LOG_RETENTION_ARCHIVE:
+                archived = analytics.archive_audit_log(session, settings.AUDIT_LOG_RETENTION_DAYS)
+                result["audit_rows_archived"] = archived["archived"]
+            else:
+                cutoff = (datetime.now(timezone.utc)
+                          - timedelta(days=settings.AUDIT_LOG_RETENTION_DAYS)).replace(tzinfo=None)
+                result["audit_rows_deleted"] = session.query(db.AuditLog) \
+                    .filter(db.AuditLog.created_at < cutoff).delete(synchronize_session=False)
+                session.commit()
+        finally:
+            session.close()
+    return result
+
+
+@jobs.register("retention")
+def _retention_job(job: jobs.JobContext) -> Dict:
+    return apply_retention(job)
+
+
+# --- Compaction ---
+def _sqlite_files() -> Dict[str, str]:
+    """
+    The SQLite files compaction looks after, by name. Chroma's own file is left
+    alone: VACUUM rewrites it under the connections and caches Chroma keeps open,
+    and SQLite reuses its free pages for new chunks anyway.
+    """
+    files = {}
+    if db.engine.dialect.name == "sqlite" and db.engine.url.database:
+        files["database"] = os.path.abspath(db.engine.url.database)
+    return files
+
+
+def free_ratio(path: str) -> float:
+    """Share of the file's pages that are free (reclaimable by VACUUM)."""
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        free = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        pages = connection.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        connection.close()
+    return free / pages if pages else 0.0
+
+
+def _orphaned_audit_rows(session: Session):
+    return session.query(db.AuditLog).filter(
+        db.AuditLog.upload_id.isnot(None),
+        ~db.AuditLog.upload_id.in_(session.query(db.Upload.id)),
+    )
+
+
+def needs_compaction() -> bool:
+    current_index = vectorstore.index
+    if current_index is not None and current_index.stats()["deleted_vectors"]:
+        return True
+    if any(free_ratio(path) >= settings.COMPACTION_MIN_FREE_RATIO for path in _sqlite_files().values()):
+        return True
+    session = db.SessionLocal()
+    try:
+        return _orphaned_audit_rows(session).first() is not None
+    finally:
+        session.close()
+
+
+def _vacuum(path: str):
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        connection.execute("VACUUM")
+        connection.execute("ANALYZE")
+    finally:
+        connection.close()
+
+
+def compact(job: Optional[jobs.JobContext] = None) -> Dict:
+    """Reclaims space in SQLite and the vector store. Returns what was done and the file sizes."""
+    session = db.SessionLocal()
+    try:
+        orphans = _orphaned_audit_rows(session).delete(synchronize_session=False)
+        pruned_jobs = jobs.prune(session, settings.JOB_RETENTION_DAYS)
+        session.commit()
+    finally:
+        session.close()
+
+    result = {"orphaned_audit_rows": orphans, "pruned_jobs": pruned_jobs, "deleted_vectors": 0, "files": {}}
+    with vectorstore.write_lock:
+        current_index = vectorstore.index
+        if current_index is not None:
+            result["deleted_vectors"] = current_index.stats()["deleted_vectors"]
+            if result["deleted_vectors"]:
+                current_index.compact()
+
+        files = _sqlite_files()
+        if job is not None:
+            job.progress(0, len(files))
+        for done, (name, path) in enumerate(files.items(), start=1):
+            before = os.path.getsize(path)
+            _vacuum(path)
+            result["files"][name] = {"bytes_before": before, "bytes_after": os.path.getsize(path)}
+            if job is not None:
+                job.progress(done)
+    print(f"Compaction finished: {result}")
+    return result
+
+
+@jobs.register("compaction")
+def _compaction_job(job: jobs.JobContext) -> Dict:
+    return compact(job)
+
+
+# --- Scheduling ---
+def note_request():
+    """Called for every HTTP request; compaction waits for a quiet period."""
+    global _last_request
+    _last_request = time.monotonic()
+
+
+def is_idle() -> bool:
+    if time.monotonic() - _last_request < settings.COMPACTION_IDLE_SECONDS:
+        return False
+    return all(gate.active == 0 and gate.waiting == 0 for gate in admission.gates.values())
+
+
+def _pending(kind: str) -> bool:
+    session = db.SessionLocal()
+    try:
+        return session.query(db.Job).filter(
+            db.Job.kind == kind, db.Job.status.in_(("pending", "running"))).first() is not None
+    finally:
+        session.close()
+
+
+def run_scheduled():
+    """One maintenance pass: expires stale upload sessions, submits retention and, when idle, compaction jobs."""
+    uploads.expire_sessions()
+    if (settings.UPLOAD_RETENTION_DAYS > 0 or settings.AUDIT_LOG_RETENTION_DAYS > 0) and not _pending("retention"):
+        jobs.submit("retention")
+    if is_idle() and not jobs.active() and needs_compaction():
+        jobs.submit("compaction")
+
+
+def _loop():
+    while not _stop.wait(settings.MAINTENANCE_INTERVAL_SECONDS):
+        try:
+            run_scheduled()
+        except Exception as e:
+            print(f"Error during scheduled maintenance: {e}")
+
+
+def start():
+    global _worker
+    if _worker is not None:
+        return
+    _stop.clear()
+    _worker = threading.Thread(target=_loop, name="maintenance", daemon=True)
+    _worker.start()
+
+
+def stop():
+    global _worker
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout=5)
+        _worker = None
@@ -0,0 +1,342 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, List, Optional
+
+import httpx
+
+from ..config import settings
+from . import local_llm
+
+
+class ProviderError(Exception):
+    """Raised when a provider cannot produce an answer."""
+
+
+class CircuitOpenError(ProviderError):
+    """Raised without calling upstream while a provider's circuit breaker is open."""
+
+
+class CancelledError(ProviderError):
+    """Raised when the router stopped a call that lost a hedge; not a provider failure."""
+
+
+class GenerationRequest:
+    """Everything a provider may need: chat-style prompt plus the raw question/context."""
+
+    def __init__(self, question: str, context: str, prompt: str, system_prompt: str,
+                 on_token: Optional[Callable[[str], None]] = None):
+        self.question = question
+        self.context = context
+        self.prompt = prompt
+        self.system_prompt = system_prompt
+        # Set by the router to ask a losing hedged call to stop early
+        self.cancelled = threading.Event()
+        # Receives the answer as it is generated (streaming responses)
+        self.on_token = on_token
+        self._streaming_from = None
+        self._emit_lock = threading.Lock()
+
+    def emit(self, provider: "GenerationProvider", text: str):
+        """Passes generated text to `on_token`, only ever from the first provider that emits."""
+        if self.on_token is None:
+            return
+        with self._emit_lock:
+            if self._streaming_from is None:
+                self._streaming_from = provider
+            if self._streaming_from is provider:
+                self.on_token(text)
+
+    def messages(self) -> List[dict]:
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": self.prompt},
+        ]
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker. After `failure_threshold` consecutive failures the
+    circuit opens and calls fail fast; after `reset_timeout` seconds a single trial
+    call is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Ends a half-open trial call without an outcome, so another one can run."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class GenerationProvider:
+    """
+    Base class handling what every provider needs: a circuit breaker, bounded
+    concurrency and a per-provider timeout. Subclasses implement `_complete`.
+    """
+
+    name = "provider"
+
+    def __init__(self, timeout: float, max_concurrency: int,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker(
+            settings.CIRCUIT_BREAKER_FAILURES, settings.CIRCUIT_BREAKER_RESET_SECONDS
+        )
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+
+    def generate(self, request: GenerationRequest,
+                 on_first_token: Optional[Callable[[], None]] = None) -> str:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name}: circuit open")
+        if not self._slots.acquire(timeout=self.timeout):
+            # Saturated: count it as a failure so a stuck upstream trips the breaker
+            self.breaker.record_failure()
+            raise ProviderError(f"{self.name}: no free slot within {self.timeout}s")
+        try:
+            text = self._complete(request, on_first_token or (lambda: None))
+        except CancelledError:
+            # Losing a hedge says nothing about the provider's health
+            self.breaker.release_trial()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            if isinstance(e, ProviderError):
+                raise
+            raise ProviderError(f"{self.name}: {e}") from e
+        finally:
+            self._slots.release()
+        self.breaker.record_success()
+        return text
+
+    def _complete(self, request: GenerationRequest, on_first_token: Callable[[], None]) -> str:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class OpenAICompatibleProvider(GenerationProvider):
+    """
+    Streams chat completions from any OpenAI-compatible endpoint (Groq by default)
+    over one long-lived, pooled HTTP client.
+    """
+
+    name = "openai"
+
+    def __init__(self, base_url: str, api_key: str, model: str, timeout: float = 30.0,
+                 connect_timeout: float = 5.0, max_concurrency: int = 16, max_connections: int = 32,
+                 temperature: float = 0.2, max_tokens: int = 250,
+                 breaker: Optional[CircuitBreaker] = None, name: Optional[str] = None):
+        super().__init__(timeout, max_concurrency, breaker)
+        if name:
+            self.name = name
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.client = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    def _complete(self, request: GenerationRequest, on_first_token: Callable[[], None]) -> str:
+        payload = {
+            "model": self.model,
+            "messages": request.messages(),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": True,
+        }
+        deadline = time.monotonic() + self.timeout
+        parts: List[str] = []
+        with self.client.stream("POST", "/chat/completions", json=payload) as response:
+            if response.status_code >= 400:
+                response.read()
+                raise ProviderError(f"{self.name}: HTTP {response.status_code}: {response.text[:200]}")
+            for line in response.iter_lines():
+                # httpx timeouts are per read; also enforce an overall deadline
+                if time.monotonic() > deadline:
+                    raise ProviderError(f"{self.name}: timed out after {self.timeout}s")
+                if request.cancelled.is_set():
+                    raise CancelledError(f"{self.name}: cancelled")
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                choices = chunk.get("choices") or [{}]
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    if not parts:
+                        on_first_token()
+                    parts.append(content)
+                    request.emit(self, content)
+        return "".join(parts)
+
+    def close(self):
+        self.client.close()
+
+
+class LocalProvider(GenerationProvider):
+    """Adapter for the in-process batching engine in `local_llm`."""
+
+    name = "local"
+
+    def _complete(self, request: GenerationRequest, on_first_token: Callable[[], None]) -> str:
+        engine = local_llm.get_engine()
+        text = engine.generate(request.question, request.context, timeout=self.timeout)
+        on_first_token()
+        request.emit(self, text)
+        return text
+
+
+class ProviderRouter:
+    """
+    Tries providers in order. With `hedge_after_ms` > 0, if the primary has not
+    produced its first token within that time the next provider is started in
+    parallel and whichever answers first wins.
+
+    Primaries and hedges run on separate pools, so a stalled primary can't keep
+    its own hedge from starting. Each pool has room for twice `max_concurrency`
+    calls, since a cancelled loser may still be winding down while the next
+    request starts.
+    """
+
+    def __init__(self, providers: List[GenerationProvider], hedge_after_ms: int = 0, max_concurrency: int = 8):
+        self.providers = providers
+        self.hedge_after_ms = hedge_after_ms
+        self._primary_executor = ThreadPoolExecutor(max_workers=2 * max_concurrency, thread_name_prefix="llm-primary")
+        self._hedge_executor = ThreadPoolExecutor(max_workers=2 * max_concurrency, thread_name_prefix="llm-hedge")
+
+    def generate(self, request: GenerationRequest) -> str:
+        if not self.providers:
+            raise ProviderError("No generation provider is configured.")
+        if self.hedge_after_ms > 0 and len(self.providers) > 1:
+            return self._generate_hedged(request)
+
+        errors = []
+        for provider in self.providers:
+            try:
+                return provider.generate(request)
+            except ProviderError as e:
+                print(f"Provider '{provider.name}' failed: {e}")
+                errors.append(str(e))
+        raise ProviderError("; ".join(errors))
+
+    def _generate_hedged(self, request: GenerationRequest) -> str:
+        primary, fallback = self.providers[0], self.providers[1]
+        first_token = threading.Event()
+        primary_future = self._primary_executor.submit(primary.generate, request, first_token.set)
+
+        if first_token.wait(self.hedge_after_ms / 1000.0) or primary_future.done():
+            try:
+                return primary_future.result()
+            except ProviderError as e:
+                print(f"Provider '{primary.name}' failed: {e}")
+                return fallback.generate(request)
+
+        print(f"Provider '{primary.name}' slow to first token; hedging with '{fallback.name}'.")
+        pending = {primary_future, self._hedge_executor.submit(fallback.generate, request)}
+        errors = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    text = future.result()
+                except ProviderError as e:
+                    errors.append(str(e))
+                    continue
+                request.cancelled.set()
+                return text
+        raise ProviderError("; ".join(errors))
+
+    def close(self):
+        for provider in self.providers:
+            provider.close()
+        self._primary_executor.shutdown(wait=False)
+        self._hedge_executor.shutdown(wait=False)
+
+
+# --- Module-level router built from settings ---
+_router: Optional[ProviderRouter] = None
+_router_lock = threading.Lock()
+
+
+def build_router() -> ProviderRouter:
+    """Creates the provider chain described by the settings."""
+    providers: List[GenerationProvider] = []
+    if settings.GROQ_API_KEY:
+        providers.append(OpenAICompatibleProvider(
+            base_url=settings.LLM_BASE_URL,
+            api_key=settings.GROQ_API_KEY,
+            model=settings.LLM_MODEL,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            connect_timeout=settings.LLM_CONNECT_TIMEOUT_SECONDS,
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+        ))
+    if settings.HF_FALLBACK:
+        providers.append(LocalProvider(
+            timeout=settings.LOCAL_LLM_TIMEOUT_SECONDS,
+            max_concurrency=settings.LOCAL_LLM_MAX_CONCURRENCY,
+        ))
+    return ProviderRouter(providers, hedge_after_ms=settings.LLM_HEDGE_AFTER_MS,
+                          max_concurrency=settings.GENERATION_MAX_CONCURRENCY)
+
+
+def get_router() -> ProviderRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = build_router()
+    return _router
+
+
+def close_providers():
+    """Closes pooled clients; called on application shutdown."""
+    global _router
+    if _router is not None:
+        _router.close()
+        _router = None
@@ -0,0 +1,546 @@
+"""
+Compressed vector storage for large collections.
+
+A `QuantizedIndex` keeps only compact codes in RAM and the full-precision
+float32 vectors in an append-only file on disk:
+
+* "sq8": int8 scalar quantization, one byte per dimension (4x smaller).
+* "pq": product quantization, the vector is split into `subspaces` parts and
+  each part is replaced by the id of its nearest centroid in a trained
+  256-entry codebook, one byte per subspace (e.g. 384 dims -> 16 bytes).
+
+Search scores every live vector from its code, then re-scores the best
+`k * rescore_factor` candidates exactly from the memory-mapped full vectors.
+Distances follow the collection's HNSW space, as Chroma computes them: squared
+L2 ("l2"), 1 - cosine similarity ("cosine") or 1 - inner product ("ip").
+"""
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+METHODS = ("sq8", "pq")
+SPACES = ("l2", "cosine", "ip")
+SEARCH_BLOCK_ROWS = 16384
+
+
+# --- Quantizers ---
+class ScalarQuantizer:
+    """Per-dimension min/max scaling to 0..255."""
+
+    method = "sq8"
+    uses_norms = True
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.low = np.zeros(dim, dtype=np.float32)
+        self.scale = np.ones(dim, dtype=np.float32)
+
+    @property
+    def code_size(self) -> int:
+        return self.dim
+
+    def train(self, vectors: np.ndarray):
+        self.low = vectors.min(axis=0).astype(np.float32)
+        high = vectors.max(axis=0).astype(np.float32)
+        self.scale = np.maximum(high - self.low, 1e-12).astype(np.float32) / 255.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.low) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.low
+
+    def norms(self, codes: np.ndarray) -> np.ndarray:
+        """Squared norms of the decoded vectors, cached by the index to speed up search."""
+        return (self.decode(codes) ** 2).sum(axis=1)
+
+    def dots(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # x.q computed on the raw codes
+        return codes.astype(np.float32) @ (self.scale * query) + float(self.low @ query)
+
+    def distances(self, query: np.ndarray, codes: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2
+        return norms - 2 * self.dots(query, codes) + float(query @ query)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"low": self.low, "scale": self.scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.low, self.scale = state["low"], state["scale"]
+
+
+class ProductQuantizer:
+    """Splits vectors into `subspaces` parts, each encoded against a k-means codebook."""
+
+    method = "pq"
+    uses_norms = False
+
+    def __init__(self, dim: int, subspaces: int = 16, centroids: int = 256, iterations: int = 10, seed: int = 0):
+        if dim % subspaces:
+            raise ValueError(f"Dimension {dim} is not divisible into {subspaces} subspaces.")
+        self.dim = dim
+        self.subspaces = subspaces
+        self.sub_dim = dim // subspaces
+        self.centroids = centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.codebooks = np.zeros((subspaces, centroids, self.sub_dim), dtype=np.float32)
+
+    @property
+    def code_size(self) -> int:
+        return self.subspaces
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors.reshape(len(vectors), self.subspaces, self.sub_dim)
+
+    @staticmethod
+    def _nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        # ||p||^2 is the same for every centroid, so it does not affect the argmin
+        distances = (centroids ** 2).sum(axis=1) - 2 * points @ centroids.T
+        return distances.argmin(axis=1)
+
+    def train(self, vectors: np.ndarray):
+        rng = np.random.default_rng(self.seed)
+        parts = self._split(vectors.astype(np.float32))
+        count = min(self.centroids, len(vectors))
+        for m in range(self.subspaces):
+            points = np.ascontiguousarray(parts[:, m, :])
+            centroids = points[rng.choice(len(points), count, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = self._nearest(points, centroids)
+                sums = np.stack([np.bincount(assignment, weights=points[:, d], minlength=count)
+                                 for d in range(self.sub_dim)], axis=1)
+                sizes = np.bincount(assignment, minlength=count)
+                empty = sizes == 0
+                centroids[~empty] = sums[~empty] / sizes[~empty, None]
+                # Re-seed empty clusters with random points
+                centroids[empty] = points[rng.integers(len(points), size=int(empty.sum()))]
+            codebook = np.zeros((self.centroids, self.sub_dim), dtype=np.float32)
+            codebook[:count] = centroids
+            # Unused entries (tiny training sets) repeat the first centroid
+            codebook[count:] = centroids[0]
+            self.codebooks[m] = codebook
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        parts = self._split(vectors.astype(np.float32))
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for m in range(self.subspaces):
+            codes[:, m] = self._nearest(np.ascontiguousarray(parts[:, m, :]), self.codebooks[m])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.codebooks[m][codes[:, m]] for m in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def distances(self, query: np.ndarray, codes: np.ndarray, norms: Optional[np.ndarray]) -> np.ndarray:
+        # Asymmetric distance: one lookup table per subspace, summed over the codes
+        table = ((self.codebooks - self._split(query[None, :])[0][:, None, :]) ** 2).sum(axis=2)
+        return table[np.arange(self.subspaces), codes].sum(axis=1)
+
+    def dots(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        table = (self.codebooks * self._split(query[None, :])[0][:, None, :]).sum(axis=2)
+        return table[np.arange(self.subspaces), codes].sum(axis=1)
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.codebooks = state["codebooks"]
+
+
+def exact_distances(vectors: np.ndarray, query: np.ndarray, space: str) -> np.ndarray:
+    """Distances from `query` to each row of `vectors` in the given space."""
+    if space == "l2":
+        return ((vectors - query) ** 2).sum(axis=1)
+    dots = vectors @ query
+    if space == "ip":
+        return 1 - dots
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    return 1 - dots / np.maximum(norms, 1e-12)
+
+
+def make_quantizer(config: Dict):
+    if config["method"] == "sq8":
+        return ScalarQuantizer(config["dim"])
+    if config["method"] == "pq":
+        return ProductQuantizer(config["dim"], config.get("subspaces", 16))
+    raise ValueError(f"Unknown quantization method: {config['method']}")
+
+
+# --- On-disk index ---
+def _grow(array: np.ndarray, capacity: int, rows: int) -> np.ndarray:
+    grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:rows] = array[:rows]
+    return grown
+
+
+def _link_or_copy(source: str, target: str):
+    # The old data directory is dropped after the switch, so sharing the file is safe
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+class QuantizedIndex:
+    """
+    Index stored in one directory:
+
+        config.json     method, dimension, training state and the current data directory
+        data-N/         the index data:
+          quantizer.npz   trained quantizer parameters
+          codes.u8        compact codes, loaded into RAM
+          vectors.f32     full-precision vectors, memory-mapped for re-scoring
+          ids.txt         one id per row
+          deleted.txt     rows removed since the data directory was written
+
+    Adds and removals append to the current data directory. Re-training and
+    compaction write a new one and switch to it by replacing config.json, so a
+    crash leaves either the old data or the new, never a mix. Indexes written
+    before data directories kept these files next to config.json; they are
+    moved into one when opened.
+
+    The first batch added trains the quantizer. It is re-trained on a sample of
+    the stored vectors each time the collection doubles, until `train_size`
+    vectors have been seen. For the "cosine" space the codes encode the
+    normalized vectors; vectors.f32 always keeps them as given.
+    """
+
+    def __init__(self, directory: str, method: str = "sq8", subspaces: int = 16,
+                 rescore_factor: int = 10, train_size: int = 20000, space: str = "l2"):
+        if method not in METHODS:
+            raise ValueError(f"Unknown quantization method: {method}")
+        if space not in SPACES:
+            raise ValueError(f"Unknown distance space: {space}")
+        self.directory = directory
+        self.config = {"method": method, "subspaces": subspaces, "dim": None, "space": space,
+                       "trained_rows": 0, "rescore_factor": rescore_factor, "train_size": train_size}
+        self.quantizer = None
+        self.ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._set_rows(np.zeros((0, 0), dtype=np.uint8), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=bool))
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _data_path(self, name: str, data: Optional[str] = None) -> str:
+        return os.path.join(self.directory, self.config["data"] if data is None else data, name)
+
+    # --- Persistence ---
+    def _load(self):
+        if not os.path.exists(self._path("config.json")):
+            return
+        with open(self._path("config.json"), "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored["dim"] is None:
+            # Nothing encoded yet, so the space asked for still applies
+            stored.pop("space", None)
+        else:
+            # Indexes written before spaces were supported are L2
+            stored.setdefault("space", "l2")
+        self.config.update(stored)
+        if self.config["dim"] is None:
+            self._drop_stale_data()
+            return
+        # Indexes written before data directories keep their files at the top
+        legacy = "data" not in self.config
+        if legacy:
+            self.config["data"] = ""
+        self.quantizer = make_quantizer(self.config)
+        with np.load(self._data_path("quantizer.npz")) as state:
+            self.quantizer.load_state({key: state[key] for key in state.files})
+
+        with open(self._data_path("ids.txt"), "r", encoding="utf-8") as f:
+            self.ids = f.read().splitlines()
+        rows = len(self.ids)
+        # Rows written after the last complete ids.txt line belong to an interrupted add
+        code_size, dim = self.quantizer.code_size, self.config["dim"]
+        os.truncate(self._data_path("codes.u8"), rows * code_size)
+        os.truncate(self._data_path("vectors.f32"), rows * dim * 4)
+        codes = np.fromfile(self._data_path("codes.u8"), dtype=np.uint8).reshape(rows, code_size)
+
+        deleted: List[str] = []
+        if os.path.exists(self._data_path("deleted.txt")):
+            with open(self._data_path("deleted.txt"), "r", encoding="utf-8") as f:
+                deleted = [line for line in f.read().splitlines() if line]
+        live = np.ones(rows, dtype=bool)
+        if legacy:
+            # Old indexes recorded removed ids, not rows
+            deleted_ids = set(deleted)
+            live[[row for row, item_id in enumerate(self.ids) if item_id in deleted_ids]] = False
+        else:
+            live[[row for row in map(int, deleted) if row < rows]] = False
+        for row, item_id in enumerate(self.ids):
+            if live[row]:
+                # Later rows win for ids that were re-added
+                if item_id in self._row_of:
+                    live[self._row_of[item_id]] = False
+                self._row_of[item_id] = row
+        self._set_rows(codes, self._norms(self.quantizer, codes), live)
+        self._drop_stale_data()
+        if legacy:
+            self.compact()
+
+    def _save_config(self):
+        tmp = self._path("config.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.config, f, indent=2)
+        os.replace(tmp, self._path("config.json"))
+
+    def _new_data(self, quantizer) -> str:
+        """Creates the next data directory holding `quantizer`'s parameters. Returns its name."""
+        current = self.config.get("data") or "data-0"
+        data = f"data-{int(current.split('-')[1]) + 1}"
+        shutil.rmtree(self._path(data), ignore_errors=True)
+        os.makedirs(self._path(data))
+        np.savez(self._data_path("quantizer.npz", data), **quantizer.state())
+        return data
+
+    def _switch(self, data: str, **config):
+        """Makes `data` the current data directory (the one atomic step) and drops the previous one."""
+        previous = self.config.get("data")
+        self.config.update(config, data=data)
+        self._save_config()
+        self._vectors = None
+        if previous:
+            shutil.rmtree(self._path(previous), ignore_errors=True)
+        elif previous == "":
+            for name in ("quantizer.npz", "codes.u8", "vectors.f32", "ids.txt", "deleted.txt"):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+
+    def _drop_stale_data(self):
+        """Removes data directories a crash left behind before they were switched to."""
+        for name in os.listdir(self.directory):
+            if name.startswith("data-") and name != self.config.get("data"):
+                shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def _set_rows(self, codes: np.ndarray, norms: np.ndarray, live: np.ndarray):
+        # The arrays double as buffers that `_append_rows` fills and grows
+        self._codes_buffer, self._norms_buffer, self._live_buffer = codes, norms, live
+        self.codes, self.norms, self._live = codes, norms, live
+
+    def _append_rows(self, codes: np.ndarray, norms: np.ndarray):
+        """Appends rows to the in-memory arrays, growing their buffers geometrically."""
+        start, end = len(self.ids), len(self.ids) + len(codes)
+        if end > len(self._codes_buffer):
+            capacity = max(end, 2 * len(self._codes_buffer), 1024)
+            self._codes_buffer = _grow(self._codes_buffer, capacity, start)
+            self._live_buffer = _grow(self._live_buffer, capacity, start)
+            if norms.size:
+                self._norms_buffer = _grow(self._norms_buffer, capacity, start)
+        self._codes_buffer[start:end] = codes
+        self._live_buffer[start:end] = True
+        # Searches keep the views they started with; rows past their end don't affect them
+        self.codes, self._live = self._codes_buffer[:end], self._live_buffer[:end]
+        if norms.size:
+            self._norms_buffer[start:end] = norms
+            self.norms = self._norms_buffer[:end]
+
+    def _for_codes(self, vectors: np.ndarray) -> np.ndarray:
+        """The vectors the codes encode: normalized for the cosine space."""
+        if self.config["space"] != "cosine":
+            return vectors
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _full_vectors(self) -> np.ndarray:
+        rows, dim = len(self.ids), self.config["dim"]
+        if rows == 0:
+            return np.zeros((0, dim or 0), dtype=np.float32)
+        if self._vectors is None or self._vectors.shape[0] != rows:
+            self._vectors = np.memmap(self._data_path("vectors.f32"), dtype=np.float32, mode="r", shape=(rows, dim))
+        return self._vectors
+
+    # --- Writes ---
+    def add(self, ids: List[str], vectors: Iterable[Iterable[float]]):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(ids) == 0:
+            return
+        with self._lock:
+            if self.quantizer is None:
+                dim = int(vectors.shape[1])
+                quantizer = make_quantizer({**self.config, "dim": dim})
+                quantizer.train(self._for_codes(vectors))
+                data = self._new_data(quantizer)
+                self._switch(data, dim=dim, trained_rows=len(vectors))
+                self.quantizer = quantizer
+                self._set_rows(np.zeros((0, quantizer.code_size), dtype=np.uint8),
+                               np.zeros(0, dtype=np.float32), np.zeros(0, dtype=bool))
+            elif vectors.shape[1] != self.config["dim"]:
+                raise ValueError(f"Expected {self.config['dim']}-dim vectors, got {vectors.shape[1]}.")
+
+            codes = self.quantizer.encode(self._for_codes(vectors))
+            # Vectors and codes first, ids last: ids.txt decides which rows exist
+            with open(self._data_path("vectors.f32"), "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._data_path("codes.u8"), "ab") as f:
+                f.write(codes.tobytes())
+            with open(self._data_path("ids.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(f"{item_id}\n" for item_id in ids))
+
+            start = len(self.ids)
+            self._append_rows(codes, self._norms(self.quantizer, codes))
+            for offset, item_id in enumerate(ids):
+                previous = self._row_of.get(item_id)
+                if previous is not None:
+                    self._live[previous] = False
+                self._row_of[item_id] = start + offset
+            self.ids.extend(ids)
+
+            trained = self.config["trained_rows"]
+            if trained < self.config["train_size"] and len(self._row_of) >= 2 * trained:
+                self.retrain()
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            rows = [self._row_of[item_id] for item_id in ids if item_id in self._row_of]
+            if not rows:
+                return
+            # Rows, not ids: an id added again later gets a new row that stays live
+            with open(self._data_path("deleted.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(f"{row}\n" for row in rows))
+            for row in rows:
+                self._live[row] = False
+                del self._row_of[self.ids[row]]
+            if self._live.size and (~self._live).sum() > 0.25 * self._live.size:
+                self.compact()
+
+    def retrain(self, sample_size: Optional[int] = None):
+        """
+        Trains a new quantizer on a sample of the stored vectors, re-encodes all rows
+        into a new data directory and switches to it. Searches already running keep
+        the old quantizer together with the old codes.
+        """
+        with self._lock:
+            live_rows = np.flatnonzero(self._live)
+            if live_rows.size == 0:
+                return
+            sample_size = sample_size or self.config["train_size"]
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(live_rows, min(sample_size, live_rows.size), replace=False))
+            vectors = self._full_vectors()
+            quantizer = make_quantizer(self.config)
+            quantizer.train(self._for_codes(np.asarray(vectors[sample])))
+            codes = np.empty((len(self.ids), quantizer.code_size), dtype=np.uint8)
+            for start in range(0, len(self.ids), SEARCH_BLOCK_ROWS):
+                block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS])
+                codes[start:start + len(block)] = quantizer.encode(self._for_codes(block))
+
+            data = self._new_data(quantizer)
+            codes.tofile(self._data_path("codes.u8", data))
+            for name in ("vectors.f32", "ids.txt", "deleted.txt"):
+                if os.path.exists(self._data_path(name)):
+                    _link_or_copy(self._data_path(name), self._data_path(name, data))
+            self._switch(data, trained_rows=int(sample.size))
+            self.quantizer = quantizer
+            self._set_rows(codes, self._norms(quantizer, codes), self._live.copy())
+
+    def compact(self):
+        """Rewrites the data without removed rows into a new data directory and switches to it."""
+        with self._lock:
+            keep = np.flatnonzero(self._live)
+            ids = [self.ids[row] for row in keep]
+            vectors = self._full_vectors()
+            data = self._new_data(self.quantizer)
+            with open(self._data_path("vectors.f32", data), "wb") as f:
+                for start in range(0, keep.size, SEARCH_BLOCK_ROWS):
+                    f.write(np.asarray(vectors[keep[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+            codes = self.codes[keep]
+            codes.tofile(self._data_path("codes.u8", data))
+            with open(self._data_path("ids.txt", data), "w", encoding="utf-8") as f:
+                f.write("".join(f"{item_id}\n" for item_id in ids))
+            self._switch(data)
+            self._set_rows(codes, self.norms[keep] if self.norms.size else self.norms, np.ones(len(ids), dtype=bool))
+            self.ids = ids
+            self._row_of = {item_id: row for row, item_id in enumerate(ids)}
+
+    @staticmethod
+    def _norms(quantizer, codes: np.ndarray) -> np.ndarray:
+        if not quantizer.uses_norms:
+            return np.zeros(0, dtype=np.float32)
+        parts = [quantizer.norms(codes[start:start + SEARCH_BLOCK_ROWS])
+                 for start in range(0, len(codes), SEARCH_BLOCK_ROWS)]
+        return np.concatenate(parts).astype(np.float32) if parts else np.zeros(0, dtype=np.float32)
+
+    # --- Reads ---
+    def search(self, query: Iterable[float], k: int, allowed_ids: Optional[Iterable[str]] = None,
+               rescore: bool = True) -> Tuple[List[str], List[float]]:
+        """
+        Returns the ids and distances (in the index's space) of the k nearest
+        live vectors, optionally restricted to `allowed_ids`.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        space = self.config["space"]
+        code_query = self._for_codes(query[None, :])[0]
+        with self._lock:
+            if self.quantizer is None or not self._row_of:
+                return [], []
+            if allowed_ids is None:
+                candidates = np.flatnonzero(self._live)
+            else:
+                candidates = np.array(sorted(self._row_of[i] for i in allowed_ids if i in self._row_of), dtype=np.int64)
+            # Re-training and compaction swap these objects; keep a consistent view for this search
+            quantizer, codes, norms, ids = self.quantizer, self.codes, self.norms, self.ids
+            vectors = self._full_vectors()
+        if candidates.size == 0:
+            return [], []
+
+        # 1. Approximate distances from the codes, block by block
+        approx = np.empty(candidates.size, dtype=np.float32)
+        for start in range(0, candidates.size, SEARCH_BLOCK_ROWS):
+            rows = candidates[start:start + SEARCH_BLOCK_ROWS]
+            if space == "l2":
+                approx[start:start + rows.size] = quantizer.distances(query, codes[rows], norms[rows] if norms.size else None)
+            else:
+                approx[start:start + rows.size] = 1 - quantizer.dots(code_query, codes[rows])
+
+        shortlist = k * self.config["rescore_factor"] if rescore else k
+        shortlist = min(shortlist, candidates.size)
+        best = np.argpartition(approx, shortlist - 1)[:shortlist]
+        rows = np.sort(candidates[best])
+
+        # 2. Exact re-scoring of the shortlist from the full vectors on disk
+        if rescore:
+            distances = exact_distances(np.asarray(vectors[rows]), query, space)
+        else:
+            distances = approx[np.searchsorted(candidates, rows)]
+        order = np.argsort(distances)[:k]
+        return [ids[rows[i]] for i in order], [float(distances[i]) for i in order]
+
+    def get_vectors(self, ids: List[str]) -> Tuple[List[str], np.ndarray]:
+        """
+        Full-precision vectors for the given ids, in order, as (found ids, vectors).
+        Ids the index does not hold are left out.
+        """
+        with self._lock:
+            found = [item_id for item_id in ids if item_id in self._row_of]
+            rows = [self._row_of[item_id] for item_id in found]
+            vectors = self._full_vectors()
+        return found, (np.asarray(vectors[rows]) if rows else np.zeros((0, self.config["dim"] or 0), np.float32))
+
+    def stats(self) -> Dict:
+        """Vector counts and the bytes held in RAM versus on disk."""
+        live = len(self._row_of)
+        dim = self.config["dim"] or 0
+        return {
+            "method": self.config["method"],
+            "space": self.config["space"],
+            "vectors": live,
+            "deleted_vectors": len(self.ids) - live,  # reclaimed by `compact`
+            "code_bytes_per_vector": self.quantizer.code_size if self.quantizer else 0,
+            "ram_bytes": int(self._codes_buffer.nbytes + self._norms_buffer.nbytes),
+            "disk_vector_bytes": len(self.ids) * dim * 4,
+            "float32_bytes": live * dim * 4,
+        }
+
+    def __len__(self):
+        return len(self._row_of)
@@ -1,24 +1,41 @@
 from typing import List, Optional, Dict
 from langchain_core.documents import Document
-from . import vectorstore
+from ..config import settings
+from . import dedup, routing
 
-def retrieve_relevant_chunks(question: str, k: int, where_filter: Optional[Dict] = None) -> List[Document]:
+def retrieve_relevant_chunks(question: str, k: int, where_filter: Optional[Dict] = None,
+                             ef: Optional[int] = None) -> List[Document]:
     """
     High-level function to retrieve relevant document chunks for a given question,
-    with an optional filter for metadata.
+    with an optional filter for metadata and HNSW search breadth (`ef`). Large collections are searched in two
+    stages, candidate documents first (see `routing`). Near-duplicate chunks are
+    collapsed into one result whose metadata lists the other copies under
+    "duplicates" (see `dedup`).
     """
-    search_results = vectorstore.search(question, k, where_filter=where_filter)
+    # Over-fetch so collapsing stored near-duplicates still leaves k results
+    fetch_k = 2 * k if settings.DEDUP_ENABLED else k
+    search_results = routing.search(question, fetch_k, where_filter=where_filter, ef=ef)
     
     if not search_results or not search_results['documents']:
         return []
 
     documents = search_results['documents'][0]
     metadatas = search_results['metadatas'][0]
+    ids = search_results['ids'][0]
 
     retrieved_docs = []
-    for doc_content, metadata in zip(documents, metadatas):
+    for chunk_id, doc_content, metadata in zip(ids, documents, metadatas):
         retrieved_docs.append(
-            Document(page_content=doc_content, metadata=metadata)
+            Document(page_content=doc_content, metadata=dict(metadata, chunk_id=chunk_id))
         )
-        
+
+    if not settings.DEDUP_ENABLED:
+        return retrieved_docs
+
+    retrieved_docs = dedup.collapse(retrieved_docs, k)
+    # Chunks that were linked at ingest instead of stored
+    linked = dedup.linked_sources([doc.metadata["chunk_id"] for doc in retrieved_docs])
+    for doc in retrieved_docs:
+        if doc.metadata["chunk_id"] in linked:
+            doc.metadata["duplicates"] = doc.metadata.get("duplicates", []) + linked[doc.metadata["chunk_id"]]
     return retrieved_docs
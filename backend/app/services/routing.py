@@ -0,0 +1,217 @@
+"""
+Two-stage retrieval through a small per-document index.
+
+Each upload is represented in the `kaas_documents` collection by its centroid
+(rescaled to the mean chunk norm, so it lives on the same scale as the chunks)
+and a few medoids: real chunk vectors picked by clustering a bounded sample of
+the document's chunks. A query first finds the nearest representatives, which
+name the top DOC_ROUTING_TOP_N documents, and then searches chunks only within
+those documents (their chunk ids). If that yields fewer than k chunks,
+retrieval falls back to a global search (DOC_ROUTING_FALLBACK).
+
+Routing pays off when chunk search is exhaustive (quantized collections scan
+every code); Chroma's HNSW search is already sublinear, so by default
+(DOC_ROUTING=auto) only quantized collections are routed. See
+`benchmarks/routing.py`.
+
+The index is derived data: it is rebuilt from the chunk embeddings when it is
+missing (older stores, snapshot imports, published generations).
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..config import settings
+from . import embeddings, vectorstore
+
+KMEANS_ITERATIONS = 5
+REBUILD_PAGE_SIZE = 5000
+
+
+class DocumentProfile:
+    """
+    Accumulates a document's chunk embeddings during ingestion: a running sum for
+    the centroid and a fixed-size reservoir sample for the medoids.
+    """
+
+    def __init__(self, sample_size: Optional[int] = None, seed: int = 0):
+        self.sample_size = sample_size or settings.DOC_ROUTING_SAMPLE_SIZE
+        self.count = 0
+        self.total: Optional[np.ndarray] = None
+        self.norm_total = 0.0
+        self.sample: List[np.ndarray] = []
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.size == 0:
+            return
+        if self.total is None:
+            self.total = np.zeros(vectors.shape[1], dtype=np.float64)
+        self.total += vectors.sum(axis=0)
+        self.norm_total += float(np.linalg.norm(vectors, axis=1).sum())
+        for vector in vectors:
+            self.count += 1
+            # Copies, so sampled rows do not keep whole batches alive
+            if len(self.sample) < self.sample_size:
+                self.sample.append(vector.copy())
+            else:
+                slot = self._rng.integers(self.count)
+                if slot < self.sample_size:
+                    self.sample[slot] = vector.copy()
+
+    def centroid(self) -> np.ndarray:
+        centroid = self.total / self.count
+        norm = np.linalg.norm(centroid)
+        return (centroid * (self.norm_total / self.count / norm) if norm else centroid).astype(np.float32)
+
+    def medoids(self, count: int) -> List[np.ndarray]:
+        """Sample vectors closest to the centres of `count` k-means clusters of the sample."""
+        sample = np.stack(self.sample)
+        if len(sample) <= count:
+            return list(sample)
+        rng = np.random.default_rng(0)
+        centres = sample[rng.choice(len(sample), count, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = _nearest(sample, centres)
+            for cluster in range(count):
+                members = sample[assignment == cluster]
+                if len(members):
+                    centres[cluster] = members.mean(axis=0)
+        picked = sorted(set(_nearest(centres, sample).tolist()))
+        return [sample[row] for row in picked]
+
+    def representatives(self, medoids: Optional[int] = None) -> List[np.ndarray]:
+        if not self.count:
+            return []
+        medoids = settings.DOC_ROUTING_MEDOIDS if medoids is None else medoids
+        return [self.centroid()] + (self.medoids(medoids) if medoids else [])
+
+
+def _nearest(points: np.ndarray, centres: np.ndarray) -> np.ndarray:
+    distances = (centres ** 2).sum(axis=1)[None, :] - 2 * points @ centres.T
+    return distances.argmin(axis=1)
+
+
+def index_document(upload_id: str, filename: str, profile: DocumentProfile, target_documents=None,
+                   chunk_count: Optional[int] = None):
+    """
+    Stores (or replaces) a document's representatives in the routing collection.
+    `chunk_count` bounds the document's chunk indexes when some chunks were not
+    stored (near-duplicates); it defaults to the number of profiled chunks.
+    """
+    target_documents = target_documents if target_documents is not None else vectorstore.documents
+    if target_documents is None:
+        raise RuntimeError("Vector store is not initialized.")
+    vectors = profile.representatives()
+    if not vectors:
+        return
+    target_documents.delete(where={"upload_id": upload_id})
+    target_documents.add(
+        ids=[f"{upload_id}_r{i}" for i in range(len(vectors))],
+        embeddings=[vector.tolist() for vector in vectors],
+        metadatas=[{"upload_id": upload_id, "filename": filename, "chunk_count": chunk_count or profile.count,
+                    "kind": "centroid" if i == 0 else "medoid"} for i in range(len(vectors))],
+    )
+
+
+def rebuild(target_collection=None, target_index=None, target_documents=None) -> int:
+    """
+    Recomputes every document's representatives from the stored chunk embeddings,
+    one upload at a time. Defaults to the active store. Returns the number of documents.
+    """
+    if target_collection is None:
+        target_collection, target_index, target_documents = (
+            vectorstore.collection, vectorstore.index, vectorstore.documents)
+    if target_collection is None:
+        raise RuntimeError("Vector store is not initialized.")
+
+    upload_ids = set()
+    offset = 0
+    while True:
+        page = target_collection.get(include=["metadatas"], limit=REBUILD_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        upload_ids.update(metadata["upload_id"] for metadata in page["metadatas"]
+                          if metadata and metadata.get("upload_id"))
+        offset += len(page["ids"])
+
+    for upload_id in upload_ids:
+        _index_stored_document(upload_id, target_collection, target_index, target_documents)
+    print(f"Rebuilt document routing index: {len(upload_ids)} documents.")
+    return len(upload_ids)
+
+
+def reindex(upload_ids: List[str]):
+    """Recomputes the representatives of some documents of the active store."""
+    if vectorstore.collection is None:
+        raise RuntimeError("Vector store is not initialized.")
+    for upload_id in upload_ids:
+        _index_stored_document(upload_id, vectorstore.collection, vectorstore.index, vectorstore.documents)
+
+
+def _index_stored_document(upload_id: str, target_collection, target_index, target_documents):
+    if target_index is not None:
+        page = target_collection.get(where={"upload_id": upload_id}, include=["metadatas"])
+        found, vectors = target_index.get_vectors(page["ids"])
+        metadata_of = dict(zip(page["ids"], page["metadatas"]))
+        page = {"ids": found, "metadatas": [metadata_of[chunk_id] for chunk_id in found]}
+    else:
+        page = target_collection.get(where={"upload_id": upload_id}, include=["metadatas", "embeddings"])
+        vectors = page["embeddings"]
+    if not page["ids"]:
+        return
+    metadatas = [metadata or {} for metadata in page["metadatas"]]
+    # Indexes can have gaps (near-duplicates are not stored), so count up to the last one
+    chunk_count = max(int(metadata.get("chunk_index") or 0) for metadata in metadatas) + 1
+    profile = DocumentProfile()
+    profile.add(vectors)
+    index_document(upload_id, metadatas[0].get("filename") or "", profile, target_documents, chunk_count=chunk_count)
+
+
+def ensure_index():
+    """Builds the routing index for a store that has chunks but no document representatives."""
+    if vectorstore.documents is not None and vectorstore.documents.count() == 0 and vectorstore.collection.count():
+        rebuild()
+
+
+def route(query_embedding: List[float], top_n: int) -> Optional[Dict[str, int]]:
+    """
+    The `top_n` documents nearest to the query as {upload_id: chunk_count}, or None
+    when routing does not apply (see DOC_ROUTING) or would not narrow the search.
+    """
+    current_documents = vectorstore.documents
+    mode = settings.DOC_ROUTING.lower()
+    if mode == "off" or (mode == "auto" and vectorstore.index is None) or current_documents is None:
+        return None
+    # A document has at most 1 + MEDOIDS representatives, so this names at least top_n documents
+    n_results = top_n * (1 + settings.DOC_ROUTING_MEDOIDS)
+    if current_documents.count() <= n_results:
+        return None
+    results = current_documents.query(query_embeddings=[query_embedding], n_results=n_results, include=["metadatas"])
+    routed: Dict[str, int] = {}
+    for metadata in results["metadatas"][0]:
+        upload_id = metadata.get("upload_id")
+        if upload_id and upload_id not in routed and len(routed) < top_n:
+            routed[upload_id] = int(metadata.get("chunk_count") or 0)
+    return routed
+
+
+def search(query_text: str, k: int, where_filter: Optional[Dict] = None,
+           query_embedding: Optional[List[float]] = None, ef: Optional[int] = None):
+    """
+    Chunk search restricted to the routed documents, with the same result shape
+    as `vectorstore.search`. Falls back to a global search when routing does not
+    apply or finds fewer than k chunks.
+    """
+    if query_embedding is None:
+        query_embedding = embeddings.embed_texts([query_text])[0]
+    routed = route(query_embedding, settings.DOC_ROUTING_TOP_N)
+    if routed:
+        # Chunk ids are "<upload_id>_<index>", so the candidates need no metadata scan
+        candidate_ids = [f"{upload_id}_{i}" for upload_id, count in routed.items() for i in range(count)]
+        results = vectorstore.search(query_text, k, where_filter=where_filter,
+                                     query_embedding=query_embedding, ids=candidate_ids, ef=ef)
+        if len(results["ids"][0]) >= k or not settings.DOC_ROUTING_FALLBACK:
+            return results
+    return vectorstore.search(query_text, k, where_filter=where_filter, query_embedding=query_embedding, ef=ef)
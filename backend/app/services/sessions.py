@@ -0,0 +1,214 @@
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from ..config import settings
+from . import vectorstore
+
+# Words that signal a question depends on earlier turns ("what about the second one?")
+FOLLOW_UP_MARKERS = {
+    "it", "its", "they", "them", "their", "this", "that", "these", "those", "he", "she", "him",
+    "her", "his", "one", "ones", "first", "second", "third", "last", "former", "latter", "same",
+    "also", "else", "other", "another", "more", "previous", "above",
+}
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "at", "for", "with", "by", "from",
+    "is", "are", "was", "were", "be", "been", "do", "does", "did", "what", "which", "who", "whom",
+    "where", "when", "why", "how", "about", "can", "could", "would", "should", "tell", "me", "please",
+    "i", "you", "we", "my", "your", "our", "there", "any", "some", "as", "so", "than", "then", "if",
+} | FOLLOW_UP_MARKERS
+
+MAX_TOPIC_TERMS = 12
+ANSWER_SUMMARY_CHARS = 300
+_WORD_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9.+#-]*")
+
+
+def _terms(text: str) -> List[str]:
+    """Content words of a text, in order, without duplicates."""
+    seen, terms = set(), []
+    for word in _WORD_RE.findall(text):
+        key = word.lower().rstrip(".")
+        if key and key not in STOPWORDS and key not in seen:
+            seen.add(key)
+            terms.append(word.rstrip("."))
+    return terms
+
+
+def is_follow_up(question: str) -> bool:
+    """Heuristic: short questions or ones with anaphora depend on the conversation."""
+    words = [w.lower() for w in _WORD_RE.findall(question)]
+    return len(_terms(question)) <= 2 or any(w in FOLLOW_UP_MARKERS for w in words)
+
+
+def _normalize(query: str) -> str:
+    return " ".join(w.lower() for w in _WORD_RE.findall(query))
+
+
+class ChatSession:
+    """
+    Server-side state for one conversation. Only a condensed history is kept:
+    the standalone query of each turn, a truncated answer, a rolling list of topic
+    terms, and an LRU cache of the chunks retrieved so far. The cache only holds
+    for the store as it was when it was filled: any write (a delete, `/reset`, a
+    snapshot import, a replica loading a new generation) empties it.
+    """
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.created_at = time.time()
+        self.last_access = time.monotonic()
+        self.turns: deque = deque(maxlen=settings.SESSION_MAX_TURNS)
+        self.topic_terms: List[str] = []
+        self.chunk_cache: "OrderedDict[str, Document]" = OrderedDict()
+        self.query_cache: "OrderedDict[str, List[str]]" = OrderedDict()
+        self.last_chunk_ids: List[str] = []
+        self.store_version = vectorstore.write_version
+        self.size_bytes = 0
+        self.lock = threading.Lock()
+
+    def condense(self, question: str) -> str:
+        """
+        Builds a standalone retrieval query. Follow-ups are expanded with the topic
+        terms of the conversation so far; self-contained questions are used as is.
+        """
+        if not self.turns or not is_follow_up(question):
+            return question
+        own = {t.lower() for t in _terms(question)}
+        context_terms = [t for t in self.topic_terms if t.lower() not in own]
+        return f"{question} ({' '.join(context_terms)})" if context_terms else question
+
+    def _drop_stale_chunks(self):
+        """Empties the chunk caches if the store was written to since they were filled."""
+        version = vectorstore.write_version
+        if version == self.store_version:
+            return
+        self.chunk_cache.clear()
+        self.query_cache.clear()
+        self.last_chunk_ids = []
+        self.store_version = version
+        self.size_bytes = self._estimate_size()
+
+    def cached_chunks(self, standalone_query: str) -> Optional[List[Document]]:
+        """Chunks retrieved earlier for the same standalone query, if all still cached."""
+        self._drop_stale_chunks()
+        chunk_ids = self.query_cache.get(_normalize(standalone_query))
+        if chunk_ids is None or any(cid not in self.chunk_cache for cid in chunk_ids):
+            return None
+        self.query_cache.move_to_end(_normalize(standalone_query))
+        return [self.chunk_cache[cid] for cid in chunk_ids]
+
+    def previous_chunks(self) -> List[Document]:
+        """Chunks used to answer the previous turn, for reuse by a follow-up."""
+        self._drop_stale_chunks()
+        return [self.chunk_cache[cid] for cid in self.last_chunk_ids if cid in self.chunk_cache]
+
+    def record_turn(self, question: str, standalone_query: str, answer: str, docs: List[Document]):
+        chunk_ids = []
+        for doc in docs:
+            chunk_id = doc.metadata.get("chunk_id")
+            if not chunk_id:
+                continue
+            chunk_ids.append(chunk_id)
+            self.chunk_cache[chunk_id] = doc
+            self.chunk_cache.move_to_end(chunk_id)
+        while len(self.chunk_cache) > settings.SESSION_CHUNK_CACHE_SIZE:
+            self.chunk_cache.popitem(last=False)
+
+        self.query_cache[_normalize(standalone_query)] = chunk_ids
+        while len(self.query_cache) > settings.SESSION_CHUNK_CACHE_SIZE:
+            self.query_cache.popitem(last=False)
+        self.last_chunk_ids = chunk_ids
+
+        # Newest terms first so the most recent topic wins when the list is capped
+        terms = _terms(question) + [t for t in self.topic_terms if t.lower() not in
+                                    {q.lower() for q in _terms(question)}]
+        self.topic_terms = terms[:MAX_TOPIC_TERMS]
+        self.turns.append({
+            "question": question,
+            "standalone_query": standalone_query,
+            "answer": answer[:ANSWER_SUMMARY_CHARS],
+        })
+        self.size_bytes = self._estimate_size()
+
+    def _estimate_size(self) -> int:
+        size = sum(len(t["question"]) + len(t["standalone_query"]) + len(t["answer"]) for t in self.turns)
+        size += sum(len(doc.page_content) + 200 for doc in self.chunk_cache.values())
+        size += sum(len(key) + 40 * len(ids) for key, ids in self.query_cache.items())
+        return size + 1024
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.id,
+            "turns": list(self.turns),
+            "topic_terms": self.topic_terms,
+            "cached_chunks": len(self.chunk_cache),
+        }
+
+
+class SessionStore:
+    """
+    In-memory sessions ordered by last access. Sessions idle for longer than the TTL
+    are dropped, and the least recently used ones are evicted while the total
+    estimated size is above the memory cap.
+    """
+
+    def __init__(self, idle_ttl_seconds: float, max_memory_bytes: int):
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self) -> ChatSession:
+        session = ChatSession(str(uuid.uuid4()))
+        with self._lock:
+            self._sessions[session.id] = session
+            self._evict()
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def touch(self, session: ChatSession):
+        """Re-checks the memory cap after a session grew."""
+        with self._lock:
+            session.last_access = time.monotonic()
+            if session.id in self._sessions:
+                self._sessions.move_to_end(session.id)
+            self._evict()
+
+    def total_bytes(self) -> int:
+        return sum(s.size_bytes for s in self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self):
+        now = time.monotonic()
+        # Oldest access first, so idle sessions are always at the front
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_access <= self.idle_ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+        total = self.total_bytes()
+        while len(self._sessions) > 1 and total > self.max_memory_bytes:
+            _, evicted = self._sessions.popitem(last=False)
+            total -= evicted.size_bytes
+
+
+store = SessionStore(settings.SESSION_IDLE_TTL_SECONDS, settings.SESSION_MAX_MEMORY_MB * 1024 * 1024)
@@ -0,0 +1,477 @@
+"""
+Snapshot export/import of the whole knowledge base.
+
+A snapshot is a zip archive (deflate-compressed) with a columnar layout:
+
+    manifest.json            format version, embedding model, counts, sha256 of every file
+    uploads/<column>.bin     the uploads table, one member per column
+    chunks/ids.bin           chunk ids, one record per row
+    chunks/texts.bin         chunk texts, same order
+    chunks/metadata.bin      chunk metadata, one JSON object per row
+    chunks/embeddings.npy    float32 embedding matrix, one row per chunk
+    chunk_links/<column>.bin near-duplicate chunks linked to stored ones, one member per column
+
+The .bin members are sequences of length-prefixed records (a little-endian
+uint32 byte count, then the bytes): UTF-8 text for ids and texts, a JSON value
+for the other columns. Every member is written and read in batches, so neither
+side holds the whole knowledge base in memory. Version 1 snapshots (JSON
+arrays) can still be imported.
+
+Exports run under the vector store's write lock, so the chunks and the uploads
+table are captured at one point in time; documents still being ingested are
+left out. Imports verify every checksum, then load the stored embeddings (no
+re-embedding) into a fresh collection that replaces the live one only once the
+load succeeded.
+"""
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import DateTime
+
+from .. import db
+from ..config import settings
+from . import dedup, routing, vectorstore
+
+FORMAT = "kaas-snapshot"
+FORMAT_VERSION = 2
+HASH_BLOCK_BYTES = 1024 * 1024
+BATCH_ROWS = 5000
+CHUNK_FILES = ("chunks/ids.bin", "chunks/texts.bin", "chunks/metadata.bin", "chunks/embeddings.npy")
+RECORD_HEADER = struct.Struct("<I")
+
+
+class SnapshotError(Exception):
+    """Raised for unreadable, corrupt or incompatible snapshots."""
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --- Record columns ---
+def _encode_json(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _encode_text(value: str) -> bytes:
+    return value.encode("utf-8")
+
+
+class _RecordWriter:
+    """Appends length-prefixed records to a file."""
+
+    def __init__(self, path: str, encode=_encode_json):
+        self.file = open(path, "wb")
+        self.encode = encode
+        self.count = 0
+
+    def extend(self, values: Iterable):
+        for value in values:
+            data = self.encode(value)
+            self.file.write(RECORD_HEADER.pack(len(data)))
+            self.file.write(data)
+            self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+def _iter_records(member, name: str) -> Iterator[bytes]:
+    while True:
+        header = member.read(RECORD_HEADER.size)
+        if not header:
+            return
+        if len(header) != RECORD_HEADER.size:
+            raise SnapshotError(f"Truncated record in {name}.")
+        size = RECORD_HEADER.unpack(header)[0]
+        data = member.read(size)
+        if len(data) != size:
+            raise SnapshotError(f"Truncated record in {name}.")
+        yield data
+
+
+class _TableWriter:
+    """Writes the rows of a table as one record member per column under `directory`."""
+
+    def __init__(self, workdir: str, directory: str, columns: List[str]):
+        os.makedirs(os.path.join(workdir, directory))
+        self.names = [f"{directory}/{column}.bin" for column in columns]
+        self.columns = [_RecordWriter(os.path.join(workdir, name)) for name in self.names]
+        self.count = 0
+
+    def add(self, values: List):
+        for writer, value in zip(self.columns, values):
+            writer.extend([value])
+        self.count += 1
+
+    def close(self):
+        for writer in self.columns:
+            writer.close()
+
+
+def _read_table(archive: zipfile.ZipFile, manifest: Dict, directory: str, count: int) -> Iterator[Dict]:
+    """Rows of a table written by `_TableWriter`, as {column: value}."""
+    names = sorted(name for name in manifest["files"] if name.startswith(directory + "/"))
+    columns = [name[len(directory) + 1:-len(".bin")] for name in names]
+    members = [archive.open(name) for name in names]
+    try:
+        rows = 0
+        for values in zip(*(_iter_records(member, name) for member, name in zip(members, names))):
+            yield {column: json.loads(value) for column, value in zip(columns, values)}
+            rows += 1
+        # zip() stops at the shortest column
+        if columns and (rows != count or any(member.read(1) for member in members)):
+            raise SnapshotError(f"The columns of {directory} do not have {count} rows.")
+    finally:
+        for member in members:
+            member.close()
+
+
+# --- Export ---
+def _export_uploads(workdir: str) -> Tuple[_TableWriter, set]:
+    """Writes the uploads whose ingestion finished. Returns the writer and their ids."""
+    columns = [column.name for column in db.Upload.__table__.columns]
+    table = _TableWriter(workdir, "uploads", columns)
+    complete = set()
+    session = db.SessionLocal()
+    try:
+        rows = (session.query(db.Upload).order_by(db.Upload.created_at, db.Upload.id)
+                .yield_per(BATCH_ROWS))
+        for row in rows:
+            # A document still being ingested has some of its chunks in the store,
+            # and is left out entirely
+            if row.status not in (None, "ready"):
+                continue
+            complete.add(row.id)
+            values = [getattr(row, column) for column in columns]
+            table.add([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    finally:
+        session.close()
+        table.close()
+    return table, complete
+
+
+def _export_links(workdir: str, chunk_ids: set) -> _TableWriter:
+    """Writes the links whose canonical chunk is part of the export."""
+    columns = [column.name for column in db.ChunkLink.__table__.columns]
+    table = _TableWriter(workdir, "chunk_links", columns)
+    session = db.SessionLocal()
+    try:
+        for row in session.query(db.ChunkLink).order_by(db.ChunkLink.chunk_id).yield_per(BATCH_ROWS):
+            if row.canonical_id in chunk_ids:
+                table.add([getattr(row, column) for column in columns])
+    finally:
+        session.close()
+        table.close()
+    return table
+
+
+def export_snapshot(path: str) -> Dict:
+    """Writes a snapshot of the uploads table and the vector store to `path`. Returns the manifest."""
+    if vectorstore.collection is None:
+        raise RuntimeError("Vector store is not initialized.")
+    workdir = tempfile.mkdtemp(prefix="kaas_snapshot_")
+    try:
+        os.makedirs(os.path.join(workdir, "chunks"))
+        ids = _RecordWriter(os.path.join(workdir, "chunks/ids.bin"), _encode_text)
+        texts = _RecordWriter(os.path.join(workdir, "chunks/texts.bin"), _encode_text)
+        metadatas = _RecordWriter(os.path.join(workdir, "chunks/metadata.bin"))
+        raw_path = os.path.join(workdir, "embeddings.f32")
+        dim = 0
+        exported_ids = set()
+
+        with vectorstore.write_lock, open(raw_path, "wb") as raw:
+            uploads, complete = _export_uploads(workdir)
+            for batch_ids, batch_texts, batch_metadatas, vectors in vectorstore.iter_chunks(BATCH_ROWS):
+                keep = [i for i, metadata in enumerate(batch_metadatas)
+                        if (metadata or {}).get("upload_id") in complete]
+                if not keep:
+                    continue
+                dim = int(vectors.shape[1])
+                raw.write(np.ascontiguousarray(vectors[keep], dtype="<f4").tobytes())
+                ids.extend(batch_ids[i] for i in keep)
+                exported_ids.update(batch_ids[i] for i in keep)
+                texts.extend(batch_texts[i] for i in keep)
+                metadatas.extend(batch_metadatas[i] or {} for i in keep)
+            links = _export_links(workdir, exported_ids)
+        for writer in (ids, texts, metadatas):
+            writer.close()
+        count = ids.count
+
+        with open(os.path.join(workdir, "chunks/embeddings.npy"), "wb") as npy, open(raw_path, "rb") as raw:
+            np.lib.format.write_array_header_1_0(
+                npy, {"descr": "<f4", "fortran_order": False, "shape": (count, dim)})
+            shutil.copyfileobj(raw, npy, HASH_BLOCK_BYTES)
+        os.remove(raw_path)
+
+        files = tuple(uploads.names) + CHUNK_FILES + tuple(links.names)
+        manifest = {
+            "format": FORMAT,
+            "version": FORMAT_VERSION,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "embedding_model": settings.EMBEDDING_MODEL,
+            "dim": dim,
+            "chunks": count,
+            "uploads": uploads.count,
+            "chunk_links": links.count,
+            "files": {
+                name: {"sha256": _sha256_file(os.path.join(workdir, name)),
+                       "bytes": os.path.getsize(os.path.join(workdir, name))}
+                for name in files
+            },
+        }
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+            for name in files:
+                archive.write(os.path.join(workdir, name), name)
+        os.replace(tmp_path, path)
+        print(f"Snapshot written to {path}: {count} chunks, {manifest['uploads']} uploads.")
+        return manifest
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# --- Import ---
+def read_manifest(path: str) -> Dict:
+    try:
+        with zipfile.ZipFile(path) as archive:
+            manifest = json.loads(archive.read("manifest.json"))
+    except (zipfile.BadZipFile, KeyError, json.JSONDecodeError) as e:
+        raise SnapshotError(f"Not a KaaS snapshot: {e}")
+    if manifest.get("format") != FORMAT:
+        raise SnapshotError("Not a KaaS snapshot.")
+    if manifest.get("version", 0) > FORMAT_VERSION:
+        raise SnapshotError(f"Snapshot version {manifest['version']} is newer than supported ({FORMAT_VERSION}).")
+    return manifest
+
+
+def verify_snapshot(path: str) -> Dict:
+    """Checks the manifest and the sha256 of every file. Returns the manifest."""
+    manifest = read_manifest(path)
+    with zipfile.ZipFile(path) as archive:
+        for name, expected in manifest["files"].items():
+            digest = hashlib.sha256()
+            try:
+                with archive.open(name) as member:
+                    for block in iter(lambda: member.read(HASH_BLOCK_BYTES), b""):
+                        digest.update(block)
+            except KeyError:
+                raise SnapshotError(f"Snapshot is missing {name}.")
+            if digest.hexdigest() != expected["sha256"]:
+                raise SnapshotError(f"Checksum mismatch for {name}.")
+    return manifest
+
+
+def open_snapshot(path: str, allow_model_mismatch: bool = False) -> Dict:
+    """Verifies a snapshot and checks it was embedded with EMBEDDING_MODEL. Returns the manifest."""
+    manifest = verify_snapshot(path)
+    if manifest["embedding_model"] != settings.EMBEDDING_MODEL and not allow_model_mismatch:
+        raise SnapshotError(
+            f"Snapshot embeddings come from '{manifest['embedding_model']}', "
+            f"but EMBEDDING_MODEL is '{settings.EMBEDDING_MODEL}'."
+        )
+    return manifest
+
+
+def _parse_upload(row: Dict) -> Dict:
+    columns = {column.name: column for column in db.Upload.__table__.columns}
+    parsed = {}
+    for name, value in row.items():
+        if name not in columns:
+            continue
+        if value is not None and isinstance(columns[name].type, DateTime):
+            value = datetime.fromisoformat(value)
+        parsed[name] = value
+    return parsed
+
+
+def read_uploads(archive: zipfile.ZipFile, manifest: Dict) -> Iterator[Dict]:
+    """The snapshot's upload rows, ready to insert."""
+    if manifest["version"] == 1:
+        rows = _legacy_table(json.loads(archive.read("uploads.json")))
+    else:
+        rows = _read_table(archive, manifest, "uploads", manifest["uploads"])
+    for row in rows:
+        yield _parse_upload(row)
+
+
+def read_links(archive: zipfile.ZipFile, manifest: Dict) -> Iterator[Dict]:
+    """The snapshot's chunk links."""
+    if manifest["version"] == 1:
+        if "chunk_links.json" not in manifest["files"]:
+            return iter(())
+        return _legacy_table(json.loads(archive.read("chunk_links.json")))
+    return _read_table(archive, manifest, "chunk_links", manifest["chunk_links"])
+
+
+def read_chunks(archive: zipfile.ZipFile, manifest: Dict,
+                batch_size: int = BATCH_ROWS) -> Iterator[Tuple[List[str], List[str], List[Dict], np.ndarray]]:
+    """The snapshot's chunks as batches of (ids, texts, metadatas, float32 embeddings)."""
+    if manifest["version"] == 1:
+        yield from _legacy_chunks(archive, batch_size)
+        return
+    count = manifest["chunks"]
+    with archive.open("chunks/ids.bin") as ids_member, archive.open("chunks/texts.bin") as texts_member, \
+            archive.open("chunks/metadata.bin") as metadata_member, \
+            archive.open("chunks/embeddings.npy") as embeddings_member:
+        shape, dtype = _read_npy_header(embeddings_member, count)
+        rows = zip(_iter_records(ids_member, "chunks/ids.bin"), _iter_records(texts_member, "chunks/texts.bin"),
+                   _iter_records(metadata_member, "chunks/metadata.bin"))
+        read = 0
+        while read < count:
+            batch = [next(rows, None) for _ in range(min(batch_size, count - read))]
+            if batch[-1] is None:
+                raise SnapshotError("Chunk columns are shorter than the manifest says.")
+            data = embeddings_member.read(len(batch) * shape[1] * dtype.itemsize)
+            if len(data) != len(batch) * shape[1] * dtype.itemsize:
+                raise SnapshotError("Embedding matrix is shorter than the manifest says.")
+            yield ([row[0].decode("utf-8") for row in batch], [row[1].decode("utf-8") for row in batch],
+                   [json.loads(row[2]) for row in batch],
+                   np.frombuffer(data, dtype=dtype).reshape(len(batch), shape[1]).astype(np.float32))
+            read += len(batch)
+
+
+def _read_npy_header(member, count: int):
+    version = np.lib.format.read_magic(member)
+    read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                   else np.lib.format.read_array_header_2_0)
+    shape, fortran_order, dtype = read_header(member)
+    if len(shape) != 2 or shape[0] != count or fortran_order:
+        raise SnapshotError("Embedding matrix does not match the chunk columns.")
+    return shape, dtype
+
+
+def _legacy_table(table: Dict[str, List]) -> Iterator[Dict]:
+    return (dict(zip(table, values)) for values in zip(*table.values()))
+
+
+def _legacy_chunks(archive: zipfile.ZipFile, batch_size: int):
+    """Chunks of a version 1 snapshot, whose JSON arrays can only be read whole."""
+    ids = json.loads(archive.read("chunks/ids.json"))
+    texts = json.loads(archive.read("chunks/texts.json"))
+    columns = json.loads(archive.read("chunks/metadata.json"))
+    with archive.open("chunks/embeddings.npy") as member:
+        shape, dtype = _read_npy_header(member, len(ids))
+        for start in range(0, len(ids), batch_size):
+            rows = range(start, min(start + batch_size, len(ids)))
+            data = member.read(len(rows) * shape[1] * dtype.itemsize)
+            yield (ids[start:rows.stop], texts[start:rows.stop],
+                   [{key: values[row] for key, values in columns.items() if values[row] is not None} for row in rows],
+                   np.frombuffer(data, dtype=dtype).reshape(len(rows), shape[1]).astype(np.float32))
+
+
+def load_chunks(archive: zipfile.ZipFile, manifest: Dict, target_collection, target_index, batch_size: int) -> int:
+    """Adds the snapshot's chunks to a collection, in batches. Returns the number of chunks."""
+    count = 0
+    for ids, texts, metadatas, vectors in read_chunks(archive, manifest, batch_size):
+        vectorstore.add_batch(target_collection, target_index, ids, texts, metadatas, vectors)
+        count += len(ids)
+    return count
+
+
+def write_uploads(session_factory, uploads: Iterable[Dict], links: Iterable[Dict] = ()):
+    """
+    Replaces the uploads table (and its audit log and chunk links) with the snapshot
+    rows, in one transaction.
+    """
+    session = session_factory()
+    try:
+        session.query(db.AuditLog).delete()
+        session.query(db.Upload).delete()
+        dedup.clear(session)
+        for model, rows in ((db.Upload, uploads), (db.ChunkLink, links)):
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == BATCH_ROWS:
+                    session.bulk_insert_mappings(model, batch)
+                    batch = []
+            session.bulk_insert_mappings(model, batch)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def import_snapshot(path: str, allow_model_mismatch: bool = False) -> Dict:
+    """
+    Replaces the knowledge base with the snapshot at `path`: verifies it, loads the
+    stored rows and embeddings into a new collection, then swaps it in for the live
+    one and replaces the uploads table. Returns the manifest.
+    """
+    manifest = open_snapshot(path, allow_model_mismatch)
+    if vectorstore.client is None:
+        vectorstore.init_vectorstore()
+
+    with zipfile.ZipFile(path) as archive, vectorstore.write_lock:
+        # A rebuild in progress would copy the old contents; its job stops
+        vectorstore.cancel_rebuild()
+        target = vectorstore.begin_rebuild()
+        try:
+            count = load_chunks(archive, manifest, *target,
+                                batch_size=min(BATCH_ROWS, vectorstore.client.get_max_batch_size()))
+            # Until here, a failed import leaves the live data untouched
+            write_uploads(db.SessionLocal, read_uploads(archive, manifest), read_links(archive, manifest))
+        except Exception:
+            vectorstore.cancel_rebuild(target)
+            raise
+        vectorstore.finish_rebuild(target)
+        vectorstore.clear_documents()
+        if count:
+            routing.rebuild()
+            dedup.rebuild_index()
+
+    print(f"Snapshot {path} imported: {count} chunks, {manifest['uploads']} uploads.")
+    return manifest
+
+
+def snapshot_path(name: str) -> Optional[str]:
+    """Resolves a snapshot file name inside SNAPSHOT_DIR, rejecting path traversal."""
+    if not name.endswith(".zip") or os.path.basename(name) != name:
+        return None
+    return os.path.join(settings.SNAPSHOT_DIR, name)
+
+
+def list_snapshots() -> List[Dict]:
+    if not os.path.isdir(settings.SNAPSHOT_DIR):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(settings.SNAPSHOT_DIR)):
+        if not name.endswith(".zip"):
+            continue
+        path = os.path.join(settings.SNAPSHOT_DIR, name)
+        try:
+            manifest = read_manifest(path)
+        except SnapshotError:
+            continue
+        snapshots.append({
+            "name": name,
+            "bytes": os.path.getsize(path),
+            "created_at": manifest["created_at"],
+            "chunks": manifest["chunks"],
+            "uploads": manifest["uploads"],
+            "embedding_model": manifest["embedding_model"],
+        })
+    return snapshots
+
+
+def new_snapshot_name() -> str:
+    return f"kaas-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')}.zip"
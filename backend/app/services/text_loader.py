@@ -1,17 +1,69 @@
-def extract_text_from_txt(txt_bytes: bytes) -> str:
+import codecs
+import mmap
+import os
+from typing import Dict, Iterator, Optional
+
+# Bytes inspected to guess the encoding of a file
+SAMPLE_BYTES = 64 * 1024
+# Bytes decoded per window when streaming a file
+WINDOW_BYTES = 1024 * 1024
+
+def detect_encoding(sample: bytes) -> str:
     """
-    Extracts text content from a TXT file provided as bytes.
-    Assumes UTF-8 encoding.
+    Guesses the encoding of a text file from a sample of its first bytes:
+    a BOM wins, then UTF-8 if the sample decodes cleanly, else latin-1
+    (which accepts any byte sequence).
     """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
     try:
-        return txt_bytes.decode('utf-8')
+        # An incremental decoder tolerates a multi-byte character cut at the end of the sample
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
     except UnicodeDecodeError:
-        # Fallback to another encoding if needed, or handle the error
-        try:
-            return txt_bytes.decode('latin-1')
-        except Exception as e:
-            print(f"Error decoding TXT file: {e}")
-            return ""
-    except Exception as e:
-        print("Error reading TXT file: {e}")
-        return ""
\ No newline at end of file
+        return "latin-1"
+
+def iter_text_windows(path: str, window_bytes: int = WINDOW_BYTES,
+                      encoding: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Streams a text file as decoded windows without reading it into memory.
+
+    The file is memory-mapped, the encoding is detected from the first
+    SAMPLE_BYTES, and each window of raw bytes goes through one incremental
+    decoder, so multi-byte characters split across windows are decoded exactly
+    once. Yields {"text", "char_start", "char_end", "byte_start", "byte_end"};
+    character offsets are exact positions in the decoded file, so the windows
+    can be fed straight into `chunking.chunk_stream`. Invalid bytes later in the
+    file become U+FFFD instead of forcing a second decoding pass.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        encoding = encoding or detect_encoding(mapped[:SAMPLE_BYTES])
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+
+        char_start = 0
+        released = 0  # mapped bytes already handed back to the OS
+        for byte_start in range(0, size, window_bytes):
+            byte_end = min(size, byte_start + window_bytes)
+            text = decoder.decode(mapped[byte_start:byte_end], final=byte_end == size)
+            if hasattr(mmap, "MADV_DONTNEED"):
+                # Drop pages we are done with so resident memory stays at about one window
+                done = byte_end - byte_end % mmap.PAGESIZE
+                if done > released:
+                    mapped.madvise(mmap.MADV_DONTNEED, released, done - released)
+                    released = done
+            if text:
+                yield {
+                    "text": text,
+                    "char_start": char_start,
+                    "char_end": char_start + len(text),
+                    "byte_start": byte_start,
+                    "byte_end": byte_end,
+                }
+                char_start += len(text)
@@ -0,0 +1,262 @@
+"""
+Resumable uploads.
+
+A client creates a session with the file's name and size (and optionally its
+SHA-256), then PUTs the file in fixed-size parts, each at an offset that is a
+multiple of the session's part size, in any order and in parallel. A part
+streams into its own temporary file, so nothing is buffered in memory. It is
+copied into a preallocated file at its offset only once its length and
+checksum match, so a bad resend can't overwrite a part that already arrived.
+After a dropped connection the client asks which ranges arrived and sends the
+rest. Completing the session hands the file to the regular ingestion pipeline
+under the session id.
+
+A session is "open" while parts arrive, "assembling" while it is completed
+and "completed" after. Both steps that touch the data file claim the session
+with a conditional UPDATE, so a part can't be written into a file that is
+being assembled, and two completions can't assemble the same file.
+"""
+import glob
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..config import settings
+
+PARTS_DIR = os.path.join("storage", "parts")
+BUFFER_SIZE = 1024 * 1024
+
+
+class UploadError(HTTPException):
+    """Raised for requests that don't fit the session (unknown id, bad offset, checksum mismatch)."""
+
+
+def data_path(session_id: str) -> str:
+    return os.path.join(PARTS_DIR, f"{session_id}.data")
+
+
+def _temp_part_path(session_id: str) -> str:
+    # Unique per request, so parallel resends of one part don't share a file
+    return os.path.join(PARTS_DIR, f"{session_id}.{uuid.uuid4().hex}.part")
+
+
+def get_session(session: Session, session_id: str) -> db.UploadSession:
+    upload_session = session.query(db.UploadSession).filter(db.UploadSession.id == session_id).first()
+    if upload_session is None:
+        raise UploadError(status_code=404, detail="Upload session not found or expired.")
+    return upload_session
+
+
+def create_session(session: Session, session_id: str, filename: str, size: int,
+                   sha256: Optional[str] = None) -> db.UploadSession:
+    """Records a new session and preallocates its (sparse) data file."""
+    if size <= 0:
+        raise UploadError(status_code=400, detail="File is empty.")
+    if size > settings.UPLOAD_MAX_BYTES:
+        raise UploadError(status_code=413, detail=f"File is larger than {settings.UPLOAD_MAX_BYTES} bytes.")
+    os.makedirs(PARTS_DIR, exist_ok=True)
+    with open(data_path(session_id), "wb") as f:
+        f.truncate(size)
+    upload_session = db.UploadSession(id=session_id, filename=filename, size=size,
+                                      part_size=settings.UPLOAD_PART_SIZE, sha256=sha256.lower() if sha256 else None)
+    session.add(upload_session)
+    session.commit()
+    return upload_session
+
+
+def part_length(upload_session: db.UploadSession, offset: int) -> int:
+    """Expected length of the part at `offset`; raises if the offset is not a part boundary."""
+    if offset < 0 or offset >= upload_session.size or offset % upload_session.part_size:
+        raise UploadError(status_code=400,
+                          detail=f"Offset must be a multiple of {upload_session.part_size} below {upload_session.size}.")
+    return min(upload_session.part_size, upload_session.size - offset)
+
+
+async def write_part(session: Session, upload_session: db.UploadSession, offset: int,
+                     body: AsyncIterator[bytes], sha256: Optional[str] = None) -> Dict:
+    """
+    Streams one part to a temporary file and, if the length (and checksum, when
+    given) match, copies it into the data file at `offset` and records it. A
+    rejected part changes nothing, so the client just sends it again.
+    """
+    if upload_session.status != "open":
+        raise UploadError(status_code=409, detail="Upload session no longer accepts parts.")
+    expected = part_length(upload_session, offset)
+    digest = hashlib.sha256()
+    received = 0
+    temp_path = _temp_part_path(upload_session.id)
+    f = await run_in_threadpool(open, temp_path, "wb")
+    try:
+        try:
+            async for data in body:
+                received += len(data)
+                if received > expected:
+                    raise UploadError(status_code=400, detail=f"Part at offset {offset} must be {expected} bytes.")
+                digest.update(data)
+                await run_in_threadpool(f.write, data)
+        finally:
+            await run_in_threadpool(f.close)
+        if received != expected:
+            raise UploadError(status_code=400, detail=f"Part at offset {offset} must be {expected} bytes, got {received}.")
+        checksum = digest.hexdigest()
+        if sha256 and sha256.lower() != checksum:
+            raise UploadError(status_code=400, detail=f"Checksum mismatch for part at offset {offset}.")
+        await run_in_threadpool(_store_part, session, upload_session, offset, temp_path, received, checksum)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return {"offset": offset, "size": received, "sha256": checksum}
+
+
+def _claim(session: Session, upload_session: db.UploadSession, status: str) -> bool:
+    """
+    Moves the session from "open" to `status` (or just touches it, for "open")
+    with a conditional UPDATE, which holds the row until the caller commits.
+    Returns False, rolling back, if the session is no longer open.
+    """
+    claimed = (session.query(db.UploadSession)
+               .filter(db.UploadSession.id == upload_session.id, db.UploadSession.status == "open")
+               .update({"status": status, "updated_at": datetime.now(timezone.utc)}))
+    if not claimed:
+        session.rollback()
+    return bool(claimed)
+
+
+def _store_part(session: Session, upload_session: db.UploadSession, offset: int, temp_path: str,
+                size: int, checksum: str):
+    """Copies a verified part into the data file at `offset` and records it, while the session is open."""
+    if not _claim(session, upload_session, "open"):
+        raise UploadError(status_code=409, detail="Upload session no longer accepts parts.")
+    try:
+        with open(temp_path, "rb") as source, open(data_path(upload_session.id), "r+b") as target:
+            target.seek(offset)
+            shutil.copyfileobj(source, target, BUFFER_SIZE)
+    except FileNotFoundError:
+        session.rollback()
+        raise UploadError(status_code=409, detail="Upload session data is gone; start the upload again.")
+    session.merge(db.UploadPart(session_id=upload_session.id, offset=offset, size=size, sha256=checksum))
+    session.commit()
+
+
+def received_ranges(session: Session, upload_session: db.UploadSession) -> List[List[int]]:
+    """Received bytes as merged [start, end) ranges."""
+    ranges: List[List[int]] = []
+    parts = (session.query(db.UploadPart.offset, db.UploadPart.size)
+             .filter(db.UploadPart.session_id == upload_session.id).order_by(db.UploadPart.offset))
+    for offset, size in parts:
+        if ranges and ranges[-1][1] == offset:
+            ranges[-1][1] = offset + size
+        else:
+            ranges.append([offset, offset + size])
+    return ranges
+
+
+def _missing_offsets(upload_session: db.UploadSession, ranges: List[List[int]]) -> List[int]:
+    received = set()
+    for start, end in ranges:
+        received.update(range(start, end, upload_session.part_size))
+    return [offset for offset in range(0, upload_session.size, upload_session.part_size) if offset not in received]
+
+
+def describe(session: Session, upload_session: db.UploadSession) -> Dict:
+    ranges = received_ranges(session, upload_session)
+    missing = _missing_offsets(upload_session, ranges)
+    if upload_session.status != "open":
+        ranges, missing = [[0, upload_session.size]], []
+    return {
+        "upload_id": upload_session.id,
+        "filename": upload_session.filename,
+        "size": upload_session.size,
+        "part_size": upload_session.part_size,
+        "status": upload_session.status,
+        "received_bytes": sum(end - start for start, end in ranges),
+        "ranges": ranges,
+        "missing_offsets": missing,
+        "expires_at": _as_utc(upload_session.updated_at) + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS),
+    }
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(BUFFER_SIZE), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def assemble(session: Session, upload_session: db.UploadSession, file_path: str):
+    """
+    Claims the session for assembly, checks that every part arrived (and the
+    whole-file checksum, if one was given) and moves the data file to
+    `file_path` for ingestion. The session stays "assembling" for
+    `mark_completed`; an incomplete upload is reopened.
+    """
+    if not _claim(session, upload_session, "assembling"):
+        raise UploadError(status_code=409, detail="Upload is already being completed.")
+    session.commit()
+    missing = _missing_offsets(upload_session, received_ranges(session, upload_session))
+    if missing:
+        upload_session.status = "open"
+        session.commit()
+        raise UploadError(status_code=409, detail={"message": "Upload is incomplete.", "missing_offsets": missing})
+    path = data_path(upload_session.id)
+    try:
+        if upload_session.sha256 and _file_sha256(path) != upload_session.sha256:
+            # Some part was corrupted without a part checksum; it can't be told which
+            discard(session, upload_session)
+            raise UploadError(status_code=400, detail="Checksum mismatch for the assembled file; upload it again.")
+        shutil.move(path, file_path)
+    except FileNotFoundError:
+        discard(session, upload_session)
+        raise UploadError(status_code=409, detail="Upload session data is gone; upload the file again.")
+
+
+def mark_completed(session: Session, upload_session: db.UploadSession):
+    """Keeps the session as completed (so a retried completion is answered) and drops its parts."""
+    upload_session.status = "completed"
+    session.query(db.UploadPart).filter(db.UploadPart.session_id == upload_session.id).delete()
+
+
+def discard(session: Session, upload_session: db.UploadSession):
+    session.query(db.UploadPart).filter(db.UploadPart.session_id == upload_session.id).delete()
+    session.delete(upload_session)
+    session.commit()
+    # Along with any parts a crashed request left behind
+    for path in [data_path(upload_session.id)] + glob.glob(os.path.join(PARTS_DIR, f"{upload_session.id}.*.part")):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def expire_sessions(now: Optional[datetime] = None) -> int:
+    """Drops sessions without activity for UPLOAD_SESSION_TTL_HOURS. Returns how many."""
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    session = db.SessionLocal()
+    try:
+        expired = session.query(db.UploadSession).filter(db.UploadSession.updated_at < cutoff).all()
+        for upload_session in expired:
+            discard(session, upload_session)
+        if expired:
+            print(f"Expired {len(expired)} upload sessions.")
+        return len(expired)
+    finally:
+        session.close()
+
+
+def clear(session: Session):
+    """Drops every session and its data (used by `/reset`). Caller commits."""
+    session.query(db.UploadPart).delete()
+    session.query(db.UploadSession).delete()
+    shutil.rmtree(PARTS_DIR, ignore_errors=True)
@@ -1,31 +1,220 @@
+import os
+import shutil
+import threading
 import chromadb
+import numpy as np
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional, Tuple
 from ..config import settings
-from . import embeddings
+from . import embeddings, quantization
+
+COLLECTION_NAME = "kaas_collection"
+# Names used while an online rebuild swaps collections (see `index_rebuild`)
+REBUILD_COLLECTION_NAME = COLLECTION_NAME + "_rebuild"
+RETIRED_COLLECTION_NAME = COLLECTION_NAME + "_retired"
+# Chroma's database file inside CHROMA_DB_DIR
+SQLITE_FILE = "chroma.sqlite3"
+# HNSW parameters fixed when the index is built; ef_search can change in place
+HNSW_BUILD_PARAMS = ("space", "max_neighbors", "ef_construction")
+# Per-document representative vectors used to route queries (see `routing`)
+DOCUMENTS_COLLECTION_NAME = "kaas_documents"
 
 client = None
 collection = None
+documents = None
+# Set when the collection stores compressed vectors (see `quantization`)
+index: Optional[quantization.QuantizedIndex] = None
+# Serializes writes, so a snapshot sees the collection, index and database at one point in time
+write_lock = threading.RLock()
+# Incremented by every write (and generation swap); lets a writer node skip publishing
+# unchanged generations, and chat sessions drop cached chunks
+write_version = 0
+# (collection, index) being built by an online rebuild; writes go to it as well
+rebuild_target: Optional[Tuple] = None
+
+def _collection_config() -> Dict:
+    """Collection metadata recording the vector representation chosen at creation."""
+    method = settings.VECTOR_QUANTIZATION.lower()
+    if method == "none":
+        return {"quantization": "none"}
+    if method not in quantization.METHODS:
+        raise ValueError(f"Unknown VECTOR_QUANTIZATION: {settings.VECTOR_QUANTIZATION}")
+    return {
+        "quantization": method,
+        "pq_subspaces": settings.PQ_SUBSPACES,
+        "rescore_factor": settings.QUANTIZATION_RESCORE_FACTOR,
+    }
+
+def hnsw_configuration() -> Dict:
+    """HNSW parameters for new collections, from the settings."""
+    return {
+        "space": settings.HNSW_SPACE,
+        "max_neighbors": settings.HNSW_M,
+        "ef_construction": settings.HNSW_CONSTRUCTION_EF,
+        "ef_search": settings.HNSW_SEARCH_EF,
+    }
+
+def collection_hnsw(target_collection) -> Dict:
+    """The HNSW parameters a collection was created with (ef_search: its current value)."""
+    current = (target_collection.configuration or {}).get("hnsw") or {}
+    return {key: current.get(key) for key in HNSW_BUILD_PARAMS + ("ef_search",)}
+
+def open_collection(store_client, db_dir: str, name: str = COLLECTION_NAME, config: Optional[Dict] = None,
+                    hnsw: Optional[Dict] = None):
+    """
+    Opens a collection of `store_client` (persisted in `db_dir`), creating it with
+    `config` as metadata (default: the configured representation) and `hnsw` as
+    index parameters (default: the settings) if needed, and loads its quantized
+    index when the collection uses one.
+    """
+    try:
+        opened = store_client.get_collection(name=name)
+    except Exception:
+        opened = store_client.create_collection(name=name, metadata=config or _collection_config(),
+                                                configuration={"hnsw": hnsw or hnsw_configuration()})
+    else:
+        if hnsw is None:
+            _apply_search_ef(opened)
+
+    config = opened.metadata or {}
+    method = config.get("quantization", "none")
+    if method != settings.VECTOR_QUANTIZATION.lower():
+        print(f"Collection '{name}' uses quantization '{method}'; VECTOR_QUANTIZATION only applies to new collections.")
+    opened_index = None
+    if method != "none":
+        opened_index = quantization.QuantizedIndex(
+            # Rebuilt collections are renamed, so their index directory is recorded
+            os.path.join(db_dir, "quantized", config.get("index_dir", name)),
+            method=method,
+            subspaces=config.get("pq_subspaces", settings.PQ_SUBSPACES),
+            rescore_factor=config.get("rescore_factor", settings.QUANTIZATION_RESCORE_FACTOR),
+            train_size=settings.QUANTIZATION_TRAIN_SIZE,
+            space=collection_hnsw(opened)["space"] or "l2",
+        )
+    return opened, opened_index
+
+def _apply_search_ef(opened):
+    """
+    Brings an existing collection's ef_search in line with HNSW_SEARCH_EF (it
+    applies once Chroma loads the index) and flags build parameters that need
+    an online rebuild.
+    """
+    current, wanted = collection_hnsw(opened), hnsw_configuration()
+    if current["ef_search"] is not None and current["ef_search"] != wanted["ef_search"]:
+        opened.modify(configuration={"hnsw": {"ef_search": wanted["ef_search"]}})
+    stale = [key for key in HNSW_BUILD_PARAMS if current[key] is not None and current[key] != wanted[key]]
+    if stale:
+        print(f"Collection '{opened.name}' was built with {', '.join(f'{k}={current[k]}' for k in stale)}; "
+              f"rebuild the index (POST /admin/vectorstore/rebuild) to apply the configured values.")
+
+def open_documents(store_client):
+    """Opens (or creates) the small per-document routing collection of `store_client`."""
+    return store_client.get_or_create_collection(name=DOCUMENTS_COLLECTION_NAME)
 
 def init_vectorstore():
     """Initializes the ChromaDB client and collection."""
-    global client, collection
+    global client, collection, index, documents
     
     try:
         client = chromadb.PersistentClient(path=settings.CHROMA_DB_DIR)
-        collection = client.get_or_create_collection(name="kaas_collection")
+        _recover_rebuild(client)
+        collection, index = open_collection(client, settings.CHROMA_DB_DIR)
+        documents = open_documents(client)
         print("ChromaDB vector store initialized.")
         
     except Exception as e:
         print(f"Error initializing ChromaDB: {e}")
         raise
 
-def upsert_chunks(upload_id: str, filename: str, chunks: List[Dict]):
-    """Embeds and upserts a list of text chunks into the ChromaDB collection."""
+# --- Online index rebuild (driven by `index_rebuild`) ---
+def _drop_collection(store_client, name: str):
+    """Deletes a collection and its quantized index files, if it exists."""
+    try:
+        dropped = store_client.get_collection(name=name)
+    except Exception:
+        return
+    config = dropped.metadata or {}
+    if config.get("quantization", "none") != "none":
+        # Without a recorded directory, the index is named after the collection's
+        # original name (a retired collection was the main one)
+        default_dir = COLLECTION_NAME if name == RETIRED_COLLECTION_NAME else name
+        shutil.rmtree(os.path.join(settings.CHROMA_DB_DIR, "quantized", config.get("index_dir", default_dir)),
+                      ignore_errors=True)
+    store_client.delete_collection(name=name)
+
+def _recover_rebuild(store_client):
+    """Finishes or undoes a collection swap interrupted by a crash, and drops leftovers."""
+    names = {listed.name for listed in store_client.list_collections()}
+    if COLLECTION_NAME not in names and RETIRED_COLLECTION_NAME in names:
+        # Crashed between the two renames: the old collection is still complete
+        store_client.get_collection(name=RETIRED_COLLECTION_NAME).modify(name=COLLECTION_NAME)
+        print("Restored the collection retired by an interrupted index rebuild.")
+    for leftover in (REBUILD_COLLECTION_NAME, RETIRED_COLLECTION_NAME):
+        _drop_collection(store_client, leftover)
+
+def begin_rebuild() -> Tuple:
+    """
+    Creates an empty collection with the configured HNSW parameters and vector
+    representation, and mirrors every write into it from now on. Returns
+    (collection, index).
+    """
+    global rebuild_target
+    if collection is None:
+        raise RuntimeError("Vector store is not initialized.")
+    with write_lock:
+        if rebuild_target is not None:
+            raise RuntimeError("An index rebuild is already running.")
+        _drop_collection(client, REBUILD_COLLECTION_NAME)
+        # A fresh quantized index directory, as the collection is renamed on switch-over
+        config = dict(_collection_config(), index_dir=f"{COLLECTION_NAME}-{datetime.utcnow():%Y%m%dT%H%M%S%f}")
+        rebuild_target = open_collection(client, settings.CHROMA_DB_DIR, name=REBUILD_COLLECTION_NAME,
+                                         config=config, hnsw=hnsw_configuration())
+        return rebuild_target
+
+def cancel_rebuild(target: Optional[Tuple] = None):
+    """Stops mirroring writes and drops the collection being rebuilt (only `target`, if given)."""
+    global rebuild_target
+    with write_lock:
+        if rebuild_target is None or (target is not None and rebuild_target is not target):
+            return
+        rebuild_target = None
+        _drop_collection(client, REBUILD_COLLECTION_NAME)
+
+def finish_rebuild(target: Tuple):
+    """
+    Switches to the rebuilt collection: it takes the collection's name, and the
+    old one is dropped. Requests already running keep the objects they started with.
+    """
+    global collection, index, rebuild_target
+    with write_lock:
+        if rebuild_target is not target:
+            raise RuntimeError("Index rebuild was cancelled.")
+        new_collection, new_index = target
+        collection.modify(name=RETIRED_COLLECTION_NAME)
+        new_collection.modify(name=COLLECTION_NAME)
+        collection, index, rebuild_target = new_collection, new_index, None
+        _drop_collection(client, RETIRED_COLLECTION_NAME)
+        _bump_version()
+
+def chunk_metadata(chunk: Dict) -> Dict:
+    """The scalar values of a chunk's optional 'metadata' (section, page, row range...)."""
+    return {key: value for key, value in (chunk.get('metadata') or {}).items()
+            if isinstance(value, (str, int, float, bool))}
+
+def upsert_chunks(upload_id: str, filename: str, chunks: List[Dict], start_index: int = 0,
+                  indices: Optional[List[int]] = None):
+    """
+    Embeds and upserts a list of text chunks into the ChromaDB collection.
+    Large documents are upserted in batches; `start_index` is the chunk index of
+    the first chunk in this batch, or `indices` gives each chunk's index when some
+    were skipped (near-duplicates). Scalar values in a chunk's optional 'metadata'
+    (section, page, row range...) are stored alongside the standard fields.
+    Returns the embeddings, so callers can build the document's routing profile.
+    """
     if collection is None:
         raise RuntimeError("Vector store is not initialized.")
     if not chunks:
-        return
+        return []
 
     chunk_texts = [chunk['chunk_text'] for chunk in chunks]
     embedded_chunks = embeddings.embed_texts(chunk_texts)
@@ -33,8 +222,11 @@ def upsert_chunks(upload_id: str, filename: str, chunks: List[Dict]):
     metadatas = []
     ids = []
     
-    for i, chunk in enumerate(chunks):
-        metadatas.append({
+    if indices is None:
+        indices = range(start_index, start_index + len(chunks))
+    for i, chunk in zip(indices, chunks):
+        metadata = chunk_metadata(chunk)
+        metadata.update({
             "upload_id": upload_id,
             "filename": filename,
             "chunk_index": i,
@@ -42,56 +234,256 @@ def upsert_chunks(upload_id: str, filename: str, chunks: List[Dict]):
             "char_end": chunk['char_end'],
             "created_at": datetime.utcnow().isoformat()
         })
+        metadatas.append(metadata)
         ids.append(f"{upload_id}_{i}")
 
-    collection.add(
-        embeddings=embedded_chunks,
-        documents=chunk_texts,
+    with write_lock:
+        for target_collection, target_index in _write_targets():
+            add_batch(target_collection, target_index, ids, chunk_texts, metadatas, embedded_chunks)
+        _bump_version()
+    return embedded_chunks
+
+def _write_targets() -> List[Tuple]:
+    """The active collection, plus the one an online rebuild is filling. Call under `write_lock`."""
+    return [(collection, index)] + ([rebuild_target] if rebuild_target is not None else [])
+
+def _bump_version():
+    global write_version
+    write_version += 1
+
+def add_batch(target_collection, target_index, ids: List[str], texts: List[str], metadatas: List[Dict], vectors):
+    """Adds precomputed embeddings to a collection (and its quantized index, if any)."""
+    if target_index is not None:
+        # Chroma keeps texts and metadata; the vectors live in the quantized index
+        target_index.add(ids, vectors)
+        vectors = [[0.0]] * len(ids)
+
+    target_collection.add(
+        embeddings=vectors,
+        documents=texts,
         metadatas=metadatas,
         ids=ids
     )
 
-def search(query_text: str, k: int = 3, where_filter: Optional[Dict] = None):
+def add_chunks(ids: List[str], texts: List[str], metadatas: List[Dict], vectors):
+    """Adds chunks whose embeddings are already known to the active collection."""
+    if collection is None:
+        raise RuntimeError("Vector store is not initialized.")
+    with write_lock:
+        for target_collection, target_index in _write_targets():
+            add_batch(target_collection, target_index, ids, texts, metadatas, vectors)
+        _bump_version()
+
+def get_embeddings(ids: List[str]) -> Dict[str, np.ndarray]:
+    """Stored embeddings of the given chunks, by id (missing ids are left out)."""
+    current_collection, current_index = collection, index
+    if current_collection is None:
+        raise RuntimeError("Vector store is not initialized.")
+    if current_index is not None:
+        found = current_collection.get(ids=ids, include=[])["ids"]
+        return dict(zip(*current_index.get_vectors(found)))
+    fetched = current_collection.get(ids=ids, include=["embeddings"])
+    return {chunk_id: np.asarray(vector, dtype=np.float32)
+            for chunk_id, vector in zip(fetched["ids"], fetched["embeddings"])}
+
+def bulk_load(ids: List[str], texts: List[str], metadatas: List[Dict], vectors: np.ndarray):
+    """Adds precomputed chunks and embeddings (snapshot import), in Chroma-sized batches."""
+    if collection is None:
+        raise RuntimeError("Vector store is not initialized.")
+    batch_size = client.get_max_batch_size()
+    with write_lock:
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            for target_collection, target_index in _write_targets():
+                add_batch(target_collection, target_index, ids[start:end], texts[start:end],
+                          metadatas[start:end], vectors[start:end])
+        _bump_version()
+
+def activate(new_client, new_collection, new_index: Optional[quantization.QuantizedIndex], new_documents=None):
     """
-    Performs a similarity search in the vector store, with an optional metadata filter.
+    Switches the active store (used by read replicas loading a new generation).
+    Requests already running keep the objects they started with.
+    """
+    global client, collection, index, documents
+    with write_lock:
+        client, collection, index = new_client, new_collection, new_index
+        documents = new_documents if new_documents is not None else open_documents(new_client)
+        # Everything may have changed; caches keyed on the version must not survive
+        _bump_version()
+
+def iter_chunks(batch_size: int = 5000) -> Iterator[Tuple[List[str], List[str], List[Dict], np.ndarray]]:
+    """
+    Pages through every chunk as (ids, texts, metadatas, float32 embeddings).
+    Hold `write_lock` while iterating to get a consistent view.
     """
     if collection is None:
         raise RuntimeError("Vector store is not initialized.")
+    # Pages can come back short (see `read_page`), so step by the page size
+    for offset in range(0, collection.count(), batch_size):
+        page = read_page(collection, index, limit=batch_size, offset=offset)
+        if page[0]:
+            yield page
+
+def read_page(source_collection, source_index, limit: Optional[int] = None, offset: Optional[int] = None,
+              ids: Optional[List[str]] = None) -> Tuple[List[str], List[str], List[Dict], np.ndarray]:
+    """
+    Chunks of a collection as (ids, texts, metadatas, float32 embeddings), by page or by id.
+    Chunks whose vector is missing from the quantized index (left behind by a delete
+    interrupted between the index and Chroma) are skipped.
+    """
+    include = ["documents", "metadatas"] + ([] if source_index is not None else ["embeddings"])
+    page = source_collection.get(ids=ids, include=include, limit=limit, offset=offset)
+    if source_index is None:
+        return page["ids"], page["documents"], page["metadatas"], np.asarray(page["embeddings"], dtype=np.float32)
+    found, vectors = source_index.get_vectors(page["ids"])
+    if len(found) == len(page["ids"]):
+        return page["ids"], page["documents"], page["metadatas"], vectors
+    print(f"Skipping {len(page['ids']) - len(found)} chunks of '{source_collection.name}' with no stored vector.")
+    keep = set(found)
+    rows = [row for row, chunk_id in enumerate(page["ids"]) if chunk_id in keep]
+    return found, [page["documents"][row] for row in rows], [page["metadatas"][row] for row in rows], vectors
+
+def search(query_text: str, k: int = 3, where_filter: Optional[Dict] = None,
+           query_embedding: Optional[List[float]] = None, ids: Optional[List[str]] = None,
+           ef: Optional[int] = None):
+    """
+    Performs a similarity search in the vector store, with an optional metadata filter.
+    Pass `query_embedding` when the query was already embedded, and `ids` to search
+    only those chunks. `ef` raises the HNSW search breadth for this query above
+    the collection's ef_search; it cannot lower it (quantized collections search
+    exhaustively and ignore it).
+    """
+    # One consistent view even if a replica swaps generations mid-request
+    current_collection, current_index = collection, index
+    if current_collection is None:
+        raise RuntimeError("Vector store is not initialized.")
         
-    query_embedding = embeddings.embed_texts([query_text])[0]
+    if query_embedding is None:
+        query_embedding = embeddings.embed_texts([query_text])[0]
+
+    if current_index is not None:
+        return _search_quantized(current_collection, current_index, query_embedding, k, where_filter, ids)
     
+    if ef is not None and ef > k:
+        return _search_wide(current_collection, query_embedding, k, ef, where_filter, ids)
+
     # Use the where filter if provided
-    results = collection.query(
+    results = current_collection.query(
         query_embeddings=[query_embedding],
         n_results=k,
-        where=where_filter
+        where=where_filter,
+        ids=ids
     )
     
     return results
 
+def _search_wide(current_collection, query_embedding: List[float], k: int, ef: int,
+                 where_filter: Optional[Dict] = None, ids: Optional[List[str]] = None):
+    """
+    HNSW keeps max(ef_search, n_results) candidates, so asking for `ef` results
+    and keeping the best k is a search with that ef. Only ids and distances come
+    back for the `ef` candidates; texts and metadata are fetched for the top k.
+    """
+    candidates = current_collection.query(
+        query_embeddings=[query_embedding],
+        n_results=ef,
+        where=where_filter,
+        ids=ids,
+        include=["distances"]
+    )
+    return _with_documents(current_collection, candidates["ids"][0][:k], candidates["distances"][0][:k])
+
+def _search_quantized(current_collection, current_index: quantization.QuantizedIndex,
+                      query_embedding: List[float], k: int, where_filter: Optional[Dict] = None,
+                      ids: Optional[List[str]] = None):
+    """
+    Nearest neighbours from the quantized index, with texts and metadata fetched
+    from Chroma. Returns the same shape as `collection.query`.
+    """
+    allowed_ids = ids
+    if where_filter:
+        allowed_ids = current_collection.get(where=where_filter, ids=ids, include=[])["ids"]
+    ids, distances = current_index.search(query_embedding, k, allowed_ids=allowed_ids)
+    return _with_documents(current_collection, ids, distances)
+
+def _with_documents(current_collection, ids: List[str], distances: List[float]):
+    """
+    Texts and metadata for ranked ids, in the shape of `collection.query`.
+    Keeps the ranking's order and skips ids Chroma no longer has.
+    """
+    if not ids:
+        return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+    fetched = current_collection.get(ids=ids, include=["documents", "metadatas"])
+    by_id = {
+        chunk_id: (document, metadata)
+        for chunk_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"])
+    }
+    found = [(chunk_id, distance) for chunk_id, distance in zip(ids, distances) if chunk_id in by_id]
+    return {
+        "ids": [[chunk_id for chunk_id, _ in found]],
+        "documents": [[by_id[chunk_id][0] for chunk_id, _ in found]],
+        "metadatas": [[by_id[chunk_id][1] for chunk_id, _ in found]],
+        "distances": [[distance for _, distance in found]],
+    }
+
+def stats() -> Dict:
+    """Chunk count and vector memory footprint of the collection."""
+    current_collection, current_index = collection, index
+    if current_collection is None:
+        raise RuntimeError("Vector store is not initialized.")
+    result = {"collection": current_collection.name, "chunks": current_collection.count(), "quantization": "none",
+              "hnsw": collection_hnsw(current_collection), "rebuilding": rebuild_target is not None}
+    if current_index is not None:
+        result.update(current_index.stats())
+        result["quantization"] = result.pop("method")
+    return result
+
 def delete_by_upload_id(upload_id: str):
     """Deletes all vectors associated with a specific upload_id."""
     if collection is None:
         raise RuntimeError("Vector store is not initialized.")
-        
-    collection.delete(where={"upload_id": upload_id})
+
+    with write_lock:
+        for target_collection, target_index in _write_targets():
+            if target_index is not None:
+                target_index.remove(target_collection.get(where={"upload_id": upload_id}, include=[])["ids"])
+            target_collection.delete(where={"upload_id": upload_id})
+        if documents is not None:
+            documents.delete(where={"upload_id": upload_id})
+        _bump_version()
     print(f"Deleted all chunks for upload_id: {upload_id}")
 
+def clear_documents():
+    """Empties the document routing collection (`routing.rebuild` fills it again)."""
+    global documents
+    with write_lock:
+        try:
+            client.delete_collection(name=DOCUMENTS_COLLECTION_NAME)
+        except Exception:
+            pass
+        documents = open_documents(client)
+
 def reset_vectorstore():
     """Deletes and recreates the collection to wipe all data."""
-    global client, collection
+    global client, collection, index
     if client is None:
         init_vectorstore() # Ensure client is initialized
     
-    try:
-        # This is safer than deleting the folder
-        client.delete_collection(name="kaas_collection")
-        print("ChromaDB collection 'kaas_collection' deleted.")
-        collection = client.get_or_create_collection(name="kaas_collection")
-        print("ChromaDB collection 'kaas_collection' recreated.")
-    except Exception as e:
-        # If the collection didn't exist, this might fail. We can ignore that.
-        print(f"Info during reset (can be ignored if first run): {e}")
-        # Re-initialize just in case as a fallback
-        collection = client.get_or_create_collection(name="kaas_collection")
+    with write_lock:
+        # A rebuild in progress would copy the old contents; its job stops
+        cancel_rebuild()
+        try:
+            # This is safer than deleting the folder
+            client.delete_collection(name=COLLECTION_NAME)
+            print(f"ChromaDB collection '{COLLECTION_NAME}' deleted.")
+        except Exception as e:
+            # If the collection didn't exist, this might fail. We can ignore that.
+            print(f"Info during reset (can be ignored if first run): {e}")
+        clear_documents()
 
+        if index is not None:
+            shutil.rmtree(index.directory, ignore_errors=True)
+        # Recreated with the currently configured representation
+        collection, index = open_collection(client, settings.CHROMA_DB_DIR)
+        _bump_version()
+        print(f"ChromaDB collection '{COLLECTION_NAME}' recreated.")
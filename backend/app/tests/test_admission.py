@@ -0,0 +1,141 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from ..api import ingestion
+from ..config import settings
+from ..services import admission
+
+
+def test_token_bucket_refills_over_time():
+    bucket = admission.TokenBucket(rate=2.0, capacity=2)
+    assert bucket.try_acquire(now=bucket.updated_at) == 0
+    assert bucket.try_acquire(now=bucket.updated_at) == 0
+    assert bucket.try_acquire(now=bucket.updated_at) == pytest.approx(0.5)
+    assert bucket.try_acquire(now=bucket.updated_at + 0.5) == 0
+
+
+def test_rate_limit_returns_429_with_retry_after_per_client(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_API_KEYS", "a,b")
+    admission.rate_limiters["test"] = admission.RateLimiter("test", per_minute=60, burst=2)
+    app = FastAPI()
+
+    @app.get("/limited", dependencies=[Depends(admission.rate_limit("test"))])
+    def limited():
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert client.get("/limited", headers={"X-API-Key": "a"}).status_code == 200
+    assert client.get("/limited", headers={"X-API-Key": "a"}).status_code == 200
+    response = client.get("/limited", headers={"X-API-Key": "a"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    # Another client has its own bucket, and so does each user a known key acts for
+    assert client.get("/limited", headers={"X-API-Key": "b"}).status_code == 200
+    assert client.get("/limited", headers={"X-API-Key": "a", "X-Client-Id": "user-1"}).status_code == 200
+
+    # Unknown keys don't get a fresh bucket; they share the caller's IP bucket
+    assert client.get("/limited", headers={"X-API-Key": "new-1"}).status_code == 200
+    assert client.get("/limited", headers={"X-API-Key": "new-2"}).status_code == 200
+    assert client.get("/limited", headers={"X-API-Key": "new-3"}).status_code == 429
+
+
+def test_zero_rate_gives_a_bounded_retry_after():
+    limiter = admission.RateLimiter("test", per_minute=0, burst=1)
+    limiter.check("c")
+    with pytest.raises(admission.AdmissionRejected) as rejected:
+        limiter.check("c")
+    assert rejected.value.retry_after == admission.MAX_RETRY_AFTER_SECONDS
+
+
+def test_stage_gate_rejects_when_slots_and_queue_are_full():
+    gate = admission.StageGate("test", max_concurrency=1, max_queue=1, max_wait=0.1)
+    running = gate.reserve()
+    assert running.acquire(timeout=0)
+
+    queued = gate.reserve()
+    with pytest.raises(admission.AdmissionRejected) as rejected:
+        gate.reserve()
+    assert rejected.value.status_code == 503
+    assert "Retry-After" in rejected.value.headers
+
+    # The queued ticket gets the slot once the running one is released
+    threading.Timer(0.05, running.release).start()
+    assert queued.acquire(timeout=1)
+    queued.release()
+    assert gate.stats()["active"] == 0 and gate.stats()["waiting"] == 0
+
+
+def test_stage_slot_times_out_with_503():
+    gate = admission.StageGate("test", max_concurrency=1, max_queue=4, max_wait=0.05)
+    with gate.slot():
+        with pytest.raises(admission.AdmissionRejected) as rejected:
+            with gate.slot():
+                pass
+    assert rejected.value.status_code == 503
+    assert gate.stats() == {"active": 0, "waiting": 0, "max_concurrency": 1, "max_queue": 4}
+
+
+def test_queued_ingestion_gives_up_and_marks_the_upload_failed(tmp_path, monkeypatch):
+    gate = admission.StageGate("ingestion", max_concurrency=1, max_queue=1, max_wait=10)
+    running = gate.reserve()
+    assert running.acquire(timeout=0)
+    monkeypatch.setattr(settings, "INGESTION_MAX_WAIT_SECONDS", 0.05)
+    updates = []
+    monkeypatch.setattr(ingestion, "_update_upload", lambda upload_id, **fields: updates.append(fields))
+    monkeypatch.setattr(ingestion, "ingest_document", lambda *args: pytest.fail("must not ingest"))
+    file_path = tmp_path / "doc.txt"
+    file_path.write_text("text")
+
+    asyncio.run(ingestion._run_admitted_ingestion(gate.reserve(), str(file_path), "doc.txt", "u1"))
+    assert updates[0]["status"] == "failed" and not file_path.exists()
+    assert gate.waiting == 0
+    running.release()
+
+
+def test_released_slots_go_to_waiters_in_arrival_order():
+    gate = admission.StageGate("test", max_concurrency=1, max_queue=8, max_wait=1)
+    running = gate.reserve()
+    assert running.acquire(timeout=0)
+    order = []
+
+    async def wait(name, ticket):
+        assert await ticket.acquire_async(timeout=5)
+        order.append(name)
+        await asyncio.sleep(0.01)
+        ticket.release()
+
+    async def main():
+        first = asyncio.create_task(wait("first", gate.reserve()))
+        second = asyncio.create_task(wait("second", gate.reserve()))
+        await asyncio.sleep(0.05)
+        # A late arrival queues behind the waiters instead of grabbing the freed slot
+        late = gate.reserve()
+        running.release()
+        assert not late.acquire(timeout=0)
+        await asyncio.gather(first, second)
+
+    asyncio.run(main())
+    assert order == ["first", "second"]
+    assert gate.stats()["active"] == 0 and gate.stats()["waiting"] == 0
+
+
+def test_waiting_for_a_slot_holds_no_thread():
+    gate = admission.StageGate("test", max_concurrency=1, max_queue=64, max_wait=1)
+    running = gate.reserve()
+    assert running.acquire(timeout=0)
+
+    async def main():
+        threads = threading.active_count()
+        waiters = [asyncio.create_task(gate.reserve().acquire_async(timeout=0.05)) for _ in range(50)]
+        await asyncio.sleep(0.01)
+        assert threading.active_count() == threads and gate.stats()["waiting"] == 50
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(main()) == [False] * 50
+    assert gate.stats()["waiting"] == 0
+    running.release()
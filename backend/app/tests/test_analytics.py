@@ -0,0 +1,66 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import db
+from ..services import analytics
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'kaas.db'}")
+    db.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_rollups_count_latency_queries_and_documents(session):
+    now = datetime.now(timezone.utc).replace(minute=30)
+    for latency in range(1, 101):
+        analytics.record_event(session, "query", latency_ms=float(latency * 10), at=now,
+                               query_text="What is  TechGen?" if latency % 2 else "what is techgen",
+                               upload_ids=["u1", "u1", "u2"] if latency <= 10 else ["u1"])
+    analytics.record_event(session, "upload", at=now)
+    session.commit()
+
+    # One row per bucket, however many events
+    assert session.query(db.AnalyticsCount).filter_by(period="hour", event_type="query").one().count == 100
+
+    (point,) = analytics.timeseries(session, period="hour", since=now - timedelta(hours=1), until=now)
+    assert point["count"] == 100
+    assert point["avg_latency_ms"] == pytest.approx(505.0)
+    # Histogram percentiles are within one bin (25%) of the exact values
+    for key, exact in (("p50_ms", 500), ("p95_ms", 950), ("p99_ms", 990)):
+        assert exact <= point[key] <= exact * analytics.LATENCY_BIN_BASE
+
+    summary = analytics.summary(session, days=1)
+    assert summary["events"]["query"]["count"] == 100 and summary["events"]["upload"]["count"] == 1
+    assert analytics.top_queries(session) == [{"query": "what is techgen", "count": 100}]
+    assert [(d["upload_id"], d["hits"]) for d in analytics.top_documents(session)] == [("u1", 100), ("u2", 10)]
+
+
+def test_archive_moves_old_rows_to_daily_partitions(session, tmp_path):
+    old = datetime(2024, 5, 1, 12, 0, 0)
+    session.add_all([
+        db.AuditLog(event_type="query", query_text="old one", created_at=old),
+        db.AuditLog(event_type="query", query_text="old two", created_at=old + timedelta(days=1)),
+        db.AuditLog(event_type="query", query_text="recent", created_at=datetime.now(timezone.utc)),
+    ])
+    session.commit()
+
+    result = analytics.archive_audit_log(session, older_than_days=30, directory=str(tmp_path / "archive"))
+    assert result["archived"] == 2 and result["partitions"] == ["2024-05-01", "2024-05-02"]
+    assert [row.query_text for row in session.query(db.AuditLog)] == ["recent"]
+
+    partition = tmp_path / "archive" / "audit_log" / "date=2024-05-01"
+    (name,) = os.listdir(partition)
+    with gzip.open(partition / name, "rt", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert [row["query_text"] for row in rows] == ["old one"]
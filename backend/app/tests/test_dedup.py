@@ -0,0 +1,135 @@
+import hashlib
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import db
+from ..api import ingestion
+from ..config import settings
+from ..services import dedup, embeddings, retrieval, vectorstore
+
+WORDS = ("alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november oscar papa "
+         "quebec romeo sierra tango uniform victor whiskey xray yankee zulu").split()
+
+
+def _paragraph(seed: int, words: int = 120) -> str:
+    rng = np.random.default_rng(seed)
+    return " ".join(WORDS[i] for i in rng.integers(len(WORDS), size=words)) + "."
+
+
+def _fake_embed(texts):
+    vectors = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+        vectors.append(np.random.default_rng(seed).normal(size=8).tolist())
+    return vectors
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'kaas.db'}", connect_args={"check_same_thread": False})
+    db.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(settings, "CHROMA_DB_DIR", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 2000)
+    monkeypatch.setattr(embeddings, "embed_texts", _fake_embed)
+    vectorstore.init_vectorstore()
+
+    def ingest(upload_id: str, filename: str, text: str):
+        path = tmp_path / f"{upload_id}_{filename}"
+        path.write_text(text, encoding="utf-8")
+        session = db.SessionLocal()
+        session.add(db.Upload(id=upload_id, filename=filename, status="pending"))
+        session.commit()
+        session.close()
+        ingestion.ingest_document(str(path), filename, upload_id)
+        session = db.SessionLocal()
+        upload = session.query(db.Upload).filter(db.Upload.id == upload_id).one()
+        session.close()
+        assert upload.status == "ready", upload.error
+        return upload
+
+    return ingest
+
+
+def test_signature_estimates_jaccard_similarity():
+    text = _paragraph(0, 300)
+    edited = text.replace("alpha", "zulu", 1)
+    assert dedup.similarity(dedup.signature(text), dedup.signature(text)) == 1.0
+    assert dedup.similarity(dedup.signature(text), dedup.signature(edited)) > 0.9
+    assert dedup.similarity(dedup.signature(text), dedup.signature(_paragraph(1, 300))) < 0.3
+    # Near-duplicates share at least one LSH bucket
+    assert set(dedup.band_buckets(dedup.signature(text))) & set(dedup.band_buckets(dedup.signature(edited)))
+
+
+def test_near_duplicate_is_linked_not_stored_and_listed_in_sources(store):
+    shared = _paragraph(10)
+    store("u1", "a.txt", shared)
+    second = store("u2", "b.txt", shared.replace("alpha", "bravo", 1))
+
+    assert second.chunk_count == 1 and second.duplicate_count == 1
+    assert vectorstore.collection.count() == 1
+
+    (doc,) = retrieval.retrieve_relevant_chunks(shared, k=3)
+    assert doc.metadata["filename"] == "a.txt"
+    assert [(d["upload_id"], d["filename"]) for d in doc.metadata["duplicates"]] == [("u2", "b.txt")]
+
+
+def test_deleting_the_canonical_chunk_promotes_a_duplicate(store):
+    shared = _paragraph(20)
+    store("u1", "a.txt", shared)
+    store("u2", "b.txt", shared)
+    store("u3", "c.txt", shared)
+    canonical = vectorstore.get_embeddings(["u1_0"])["u1_0"]
+
+    session = db.SessionLocal()
+    dedup.release_upload(session, "u1")
+    session.commit()
+    vectorstore.delete_by_upload_id("u1")
+
+    stored = vectorstore.collection.get(include=["metadatas"])
+    assert stored["ids"] == ["u2_0"] and stored["metadatas"][0]["filename"] == "b.txt"
+    # The heir reuses the canonical embedding, and the remaining link follows it
+    assert np.allclose(vectorstore.get_embeddings(["u2_0"])["u2_0"], canonical)
+    assert [(link.chunk_id, link.canonical_id) for link in session.query(db.ChunkLink)] == [("u3_0", "u2_0")]
+    assert {row.upload_id for row in session.query(db.ChunkSignature)} == {"u2"}
+    session.close()
+
+
+def test_chunks_without_words_are_never_deduplicated(store):
+    deduplicator = dedup.ChunkDeduplicator("u1", "a.txt", threshold=0.5)
+    chunks = [{"chunk_text": text, "char_start": 0, "char_end": len(text)} for text in ("----", "* * *", "----")]
+    fresh, indices = deduplicator.filter(chunks, 0)
+    assert indices == [0, 1, 2]
+    deduplicator.commit()
+    session = db.SessionLocal()
+    assert session.query(db.ChunkSignature).count() == 0 and session.query(db.ChunkLink).count() == 0
+    session.close()
+
+    class Doc:
+        def __init__(self, text):
+            self.page_content, self.metadata = text, {}
+
+    assert len(dedup.collapse([Doc("----"), Doc("* * *")], k=5)) == 2
+
+
+def test_promoted_duplicate_keeps_its_own_metadata(store):
+    shared = _paragraph(30)
+    store("u1", "a.txt", shared)
+    deduplicator = dedup.ChunkDeduplicator("u2", "b.md")
+    chunk = {"chunk_text": shared, "char_start": 10, "char_end": 10 + len(shared),
+             "metadata": {"section": "Results", "page": 4}}
+    assert deduplicator.filter([chunk], 0) == ([], [])
+    deduplicator.commit()
+
+    session = db.SessionLocal()
+    dedup.release_upload(session, "u1")
+    session.commit()
+    session.close()
+    vectorstore.delete_by_upload_id("u1")
+
+    (metadata,) = vectorstore.collection.get(ids=["u2_0"], include=["metadatas"])["metadatas"]
+    assert metadata["section"] == "Results" and metadata["page"] == 4
+    assert metadata["filename"] == "b.md" and metadata["char_start"] == 10
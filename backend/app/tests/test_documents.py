@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from .. import db
+from ..main import app
+
+
+@pytest.fixture
+def documents(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'kaas.db'}", connect_args={"check_same_thread": False})
+    db.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+
+    base = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    session = db.SessionLocal()
+    # u2/u3 share a timestamp, so the id tie-breaker decides their order
+    for upload_id, filename, minutes in [("u1", "b.txt", 0), ("u2", "a.txt", 1), ("u3", "c.txt", 1),
+                                         ("u4", "notes.md", 2), ("u5", "notes-2.md", 3)]:
+        session.add(db.Upload(id=upload_id, filename=filename, status="ready",
+                              created_at=base + timedelta(minutes=minutes)))
+    session.commit()
+    session.close()
+    return TestClient(app)
+
+
+def _all_pages(client, **params):
+    ids, cursor = [], None
+    while True:
+        response = client.get("/documents", params={**params, "limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        ids.extend(doc["id"] for doc in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+def test_keyset_pages_cover_every_document_once(documents):
+    assert _all_pages(documents) == ["u5", "u4", "u3", "u2", "u1"]
+    assert _all_pages(documents, order="asc") == ["u1", "u2", "u3", "u4", "u5"]
+    assert _all_pages(documents, sort="filename", order="asc") == ["u2", "u1", "u3", "u5", "u4"]
+    assert _all_pages(documents, prefix="notes") == ["u5", "u4"]
+    assert documents.get("/documents", params={"cursor": "garbage"}).status_code == 400
+
+
+def test_unchanged_listing_answers_304(documents):
+    first = documents.get("/documents")
+    etag = first.headers["ETag"]
+    assert documents.get("/documents", headers={"If-None-Match": etag}).status_code == 304
+    # Other parameters are another listing
+    assert documents.get("/documents", params={"limit": 1}, headers={"If-None-Match": etag}).status_code == 200
+
+    session = db.SessionLocal()
+    session.query(db.Upload).filter(db.Upload.id == "u1").update({"chunk_count": 3})
+    session.commit()
+    session.close()
+    changed = documents.get("/documents", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+
+def test_old_uploads_table_is_migrated(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE uploads (id VARCHAR PRIMARY KEY, filename VARCHAR, "
+                          "created_at DATETIME DEFAULT CURRENT_TIMESTAMP)"))
+        conn.execute(text("INSERT INTO uploads (id, filename, created_at) VALUES ('old', 'a.pdf', '2024-01-02 03:04:05')"))
+        conn.execute(text("CREATE TABLE audit_log (id INTEGER PRIMARY KEY, upload_id VARCHAR, event_type VARCHAR)"))
+    monkeypatch.setattr(db, "engine", engine)
+
+    db.init_db()
+    columns = {column["name"] for column in inspect(engine).get_columns("uploads")}
+    assert {"status", "chunk_count", "updated_at", "duplicate_count"} <= columns
+    assert "latency_ms" in {column["name"] for column in inspect(engine).get_columns("audit_log")}
+    with engine.connect() as conn:
+        status, created_at, updated_at = conn.execute(
+            text("SELECT status, created_at, updated_at FROM uploads")).one()
+    assert status == "ready"
+    assert created_at == "2024-01-02 03:04:05.000000" and updated_at == created_at
+
+    # A second run has nothing to do
+    db.init_db()
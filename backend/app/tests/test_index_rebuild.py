@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from ..config import settings
+from ..services import index_rebuild, vectorstore
+
+DIM = 8
+
+
+def _chunks(upload_id: str, count: int, seed: int):
+    ids = [f"{upload_id}_{i}" for i in range(count)]
+    metadatas = [{"upload_id": upload_id, "chunk_index": i} for i in range(count)]
+    vectors = np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+    return ids, [f"text {chunk_id}" for chunk_id in ids], metadatas, vectors
+
+
+class _WritingJob:
+    """Stands in for a job context; writes to the store while the copy runs."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def progress(self, done, total=None):
+        self.calls += 1
+        if self.calls == 1:
+            vectorstore.add_chunks(*_chunks("late", 5, seed=2))
+            vectorstore.delete_by_upload_id("a")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHROMA_DB_DIR", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(index_rebuild, "COPY_PAGE_SIZE", 10)
+    vectorstore.init_vectorstore()
+    vectorstore.bulk_load(*_chunks("a", 20, seed=0))
+    vectorstore.bulk_load(*_chunks("b", 30, seed=1))
+
+
+def test_rebuild_applies_new_parameters_and_keeps_concurrent_writes(store, monkeypatch):
+    assert vectorstore.collection_hnsw(vectorstore.collection)["space"] == "l2"
+    monkeypatch.setattr(settings, "HNSW_SPACE", "cosine")
+    monkeypatch.setattr(settings, "HNSW_M", 8)
+    monkeypatch.setattr(settings, "VECTOR_QUANTIZATION", "sq8")
+
+    result = index_rebuild.rebuild(_WritingJob())
+
+    assert result["chunks"] == 35
+    assert vectorstore.collection.name == vectorstore.COLLECTION_NAME
+    assert vectorstore.collection_hnsw(vectorstore.collection)["space"] == "cosine"
+    assert vectorstore.collection_hnsw(vectorstore.collection)["max_neighbors"] == 8
+    assert vectorstore.index is not None and len(vectorstore.index) == 35
+    assert vectorstore.index.config["space"] == "cosine"
+    assert vectorstore.rebuild_target is None
+    assert [c.name for c in vectorstore.client.list_collections()
+            if c.name.startswith(vectorstore.COLLECTION_NAME)] == [vectorstore.COLLECTION_NAME]
+
+    stored = set(vectorstore.collection.get(include=[])["ids"])
+    assert stored == {f"b_{i}" for i in range(30)} | {f"late_{i}" for i in range(5)}
+    # Embeddings were copied, not recomputed
+    query = _chunks("b", 30, seed=1)[3][7].tolist()
+    assert vectorstore.search("", 1, query_embedding=query)["ids"][0] == ["b_7"]
+
+
+def test_chunks_missing_from_the_quantized_index_are_dropped(store, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_QUANTIZATION", "sq8")
+    index_rebuild.rebuild()
+    # A delete interrupted after the index removal, before the Chroma delete
+    vectorstore.index.remove(["a_0", "a_1"])
+    assert len(list(vectorstore.iter_chunks(batch_size=10))) == 5
+    assert sum(len(page[0]) for page in vectorstore.iter_chunks(batch_size=10)) == 48
+    assert set(vectorstore.get_embeddings(["a_0", "a_2"])) == {"a_2"}
+
+    result = index_rebuild.rebuild()
+    assert result["chunks"] == 50 and vectorstore.collection.count() == len(vectorstore.index) == 48
+
+
+def test_per_request_ef_returns_k_results(store):
+    query = _chunks("b", 30, seed=1)[3][0].tolist()
+    results = vectorstore.search("", 3, query_embedding=query, ef=40)
+    assert results["ids"][0][0] == "b_0" and all(len(results[key][0]) == 3 for key in ("ids", "documents", "metadatas"))
+    # Texts and metadata line up with the ranked ids
+    plain = vectorstore.search("", 3, query_embedding=query)
+    assert all(results[key] == plain[key] for key in ("ids", "documents", "metadatas"))
+    assert vectorstore.search("", 3, query_embedding=query, ef=40, where_filter={"upload_id": "missing"})["ids"] == [[]]
+
+
+def test_interrupted_switch_over_is_undone_on_startup(store):
+    # Crash right after the old collection was renamed away
+    vectorstore.collection.modify(name=vectorstore.RETIRED_COLLECTION_NAME)
+    vectorstore.client.create_collection(vectorstore.REBUILD_COLLECTION_NAME)
+
+    vectorstore.init_vectorstore()
+    assert vectorstore.collection.count() == 50
+    assert {c.name for c in vectorstore.client.list_collections()} == {
+        vectorstore.COLLECTION_NAME, vectorstore.DOCUMENTS_COLLECTION_NAME}
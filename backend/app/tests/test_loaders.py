@@ -0,0 +1,102 @@
+import io
+import json
+import zipfile
+
+from ..services import chunking, loaders
+
+DOCX_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>
+<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr><w:r><w:t>Experience</w:t></w:r></w:p>
+<w:p><w:r><w:t>Senior engineer at Innovatech Solutions.</w:t></w:r></w:p>
+<w:p><w:pPr><w:pStyle w:val="Heading2"/></w:pPr><w:r><w:t>Projects</w:t></w:r></w:p>
+<w:p><w:r><w:t>Built a search </w:t></w:r><w:r><w:t>platform.</w:t></w:r></w:p>
+</w:body></w:document>"""
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data if isinstance(data, bytes) else data.encode("utf-8"))
+    return str(path)
+
+
+def make_docx(tmp_path):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("[Content_Types].xml", "<Types/>")
+        archive.writestr("word/document.xml", DOCX_XML)
+    # Misleading extension on purpose: the format comes from the content
+    return write(tmp_path, "resume.bin", buffer.getvalue())
+
+
+def test_formats_are_sniffed_from_content(tmp_path):
+    cases = {
+        "page.dat": ("<!DOCTYPE html><html><body><p>Hi</p></body></html>", "html"),
+        "rows.dat": ("name,role\nAlex,Engineer\nSam,Designer\n", "csv"),
+        "records.dat": ('{"name": "Alex"}\n{"name": "Sam"}\n', "jsonl"),
+        "notes.dat": ("# Title\n\nIntro\n\n## Part\n\nBody\n", "markdown"),
+        "plain.dat": ("Just some words, nothing else.\n", "text"),
+        # Ambiguous content in a .txt file stays plain text
+        "resume.txt": ("# Alex Doe\n\n## Skills\nPython, SQL\nGo, Rust\n", "text"),
+    }
+    for name, (content, expected) in cases.items():
+        assert loaders.sniff_format(write(tmp_path, name, content)) == expected, name
+
+    assert loaders.sniff_format(make_docx(tmp_path)) == "docx"
+    assert loaders.sniff_format(write(tmp_path, "doc.pdf", b"%PDF-1.4\n...")) == "pdf"
+    assert loaders.sniff_format(write(tmp_path, "blob.bin", b"\x00\x01\x02\x03")) is None
+
+
+def test_docx_and_markdown_headings_become_sections(tmp_path):
+    segments = list(loaders.load_segments(make_docx(tmp_path), "docx"))
+    by_section = {s["metadata"]["section"]: s["text"] for s in segments}
+    assert "Innovatech" in by_section["Experience"]
+    assert "Built a search platform." in by_section["Experience > Projects"]
+
+    path = write(tmp_path, "notes.md", "# Guide\nIntro\n## Setup\n```\n# not a heading\n```\n# Other\nEnd\n")
+    sections = [s["metadata"]["section"] for s in loaders.load_segments(path, "markdown")]
+    assert sections == ["Guide", "Guide > Setup", "Other"]
+
+
+def test_csv_and_jsonl_rows_are_grouped_by_range(tmp_path):
+    rows = "id,text\n" + "".join(f"{i},{'x' * 300}\n" for i in range(10))
+    segments = list(loaders.load_segments(write(tmp_path, "data.csv", rows), "csv"))
+    assert segments[0]["metadata"] == {"row_start": 2, "row_end": 4}
+    assert segments[-1]["metadata"]["row_end"] == 11
+    assert segments[0]["text"].startswith("id: 0; text: xxx")
+
+    lines = "".join(json.dumps({"id": i, "tags": ["a", "b"]}) + "\n" for i in range(3))
+    segments = list(loaders.load_segments(write(tmp_path, "data.jsonl", lines), "jsonl"))
+    assert segments == [{"text": "id: 0; tags: a, b\nid: 1; tags: a, b\nid: 2; tags: a, b\n",
+                         "metadata": {"line_start": 1, "line_end": 3}}]
+
+
+def test_chunk_segments_respects_section_boundaries():
+    text = "word " * 200
+    segments = [
+        {"text": text[:500], "metadata": {"section": "A"}},
+        {"text": text[500:], "metadata": {"section": "A"}},
+        {"text": "short section", "metadata": {"section": "B"}},
+    ]
+    chunks = list(chunking.chunk_segments(iter(segments), chunk_size=300, chunk_overlap=50))
+
+    # The two "A" windows are chunked as one text, exactly like chunk_text would
+    expected = chunking.chunk_text(text, 300, 50)
+    a_chunks = [c for c in chunks if c["metadata"] == {"section": "A"}]
+    assert [c["chunk_text"] for c in a_chunks] == [c["chunk_text"] for c in expected]
+    assert chunks[-1]["chunk_text"] == "short section"
+    assert chunks[-1]["char_start"] == len(text)
+
+
+def test_extension_breaks_csv_markdown_ties(tmp_path):
+    table = "| name | role |\n|------|------|\n| Alex | Engineer |\n| Sam | Designer |\n"
+    assert loaders.sniff_format(write(tmp_path, "team.md", table)) == "markdown"
+    assert loaders.sniff_format(write(tmp_path, "team.dat", table)) == "csv"
+
+
+def test_large_csv_loads_with_the_sniffed_dialect(tmp_path):
+    # Longer than the sniffing sample, which ends in the middle of a row
+    rows = "id;text\n" + "".join(f"{i};{'word, ' * 40}\n" for i in range(200))
+    path = write(tmp_path, "data.csv", rows)
+    assert len(rows) > loaders.SNIFF_BYTES and loaders.sniff_format(path) == "csv"
+    text = "".join(segment["text"] for segment in loaders.load_segments(path, "csv"))
+    assert text.count("id: ") == 200 and text.startswith("id: 0; text: word, word")
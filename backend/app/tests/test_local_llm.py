@@ -0,0 +1,111 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import pytest
+
+from ..services import local_llm
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word."""
+
+    def __call__(self, text, add_special_tokens=False):
+        return {"input_ids": [hash(word) % 1000 for word in text.split()]}
+
+
+class FakeEngine(local_llm.LocalGenerationEngine):
+    """Batching engine with the model replaced by a recorder."""
+
+    def __init__(self, fail=False, release=None, **kwargs):
+        super().__init__("fake-model", **kwargs)
+        self.batches = []
+        self.fail = fail
+        self.release = release
+
+    def load(self):
+        self.model = object()
+
+    def _generate_batch(self, batch):
+        if self.release is not None:
+            self.release.wait(5)
+        self.batches.append([r.question for r in batch])
+        if self.fail:
+            raise RuntimeError("out of memory")
+        return [f"answer to {r.question}" for r in batch]
+
+
+def test_concurrent_requests_are_batched():
+    engine = FakeEngine(max_batch_size=4, max_wait_ms=200)
+    engine.start()
+    with ThreadPoolExecutor(4) as pool:
+        answers = list(pool.map(lambda i: engine.generate(f"q{i}", "context", timeout=5), range(4)))
+    engine.stop()
+    assert answers == [f"answer to q{i}" for i in range(4)]
+    assert len(engine.batches) == 1 and sorted(engine.batches[0]) == ["q0", "q1", "q2", "q3"]
+
+
+def test_batch_errors_reach_every_caller():
+    engine = FakeEngine(fail=True, max_batch_size=2, max_wait_ms=200)
+    engine.start()
+    futures = [engine.submit("q0", "c"), engine.submit("q1", "c")]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="out of memory"):
+            future.result(timeout=5)
+    engine.stop()
+
+
+def test_timed_out_requests_are_dropped_from_the_queue():
+    release = threading.Event()
+    engine = FakeEngine(release=release, max_batch_size=1, max_wait_ms=0)
+    engine.start()
+    busy = engine.submit("busy", "c")
+    with pytest.raises(FutureTimeoutError):
+        engine.generate("late", "c", timeout=0.05)
+    release.set()
+    assert busy.result(timeout=5) == "answer to busy"
+    assert engine.submit("next", "c").result(timeout=5) == "answer to next"
+    engine.stop()
+    assert engine.batches == [["busy"], ["next"]]
+
+
+def test_long_question_keeps_the_template():
+    engine = FakeEngine(max_input_tokens=20)
+    engine.tokenizer = WordTokenizer()
+    engine.is_encoder_decoder = False
+    engine._cache_template()
+
+    ids = engine.encode(" ".join(f"w{i}" for i in range(50)), "some context words")
+    assert len(ids) == 20
+    assert ids[:len(engine._prefix_ids)] == engine._prefix_ids
+    assert ids[-len(engine._suffix_ids):] == engine._suffix_ids
+    # The question took the whole budget, leaving no room for context
+    assert ids[len(engine._prefix_ids):len(engine._prefix_ids) + len(engine._question_ids)] == engine._question_ids
+
+
+def test_failed_load_is_retried_after_back_off(monkeypatch):
+    attempts = []
+
+    class FlakyEngine(FakeEngine):
+        def __init__(self, **kwargs):
+            super().__init__()
+
+        def load(self):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OSError("download failed")
+            super().load()
+
+    monkeypatch.setattr(local_llm, "LocalGenerationEngine", FlakyEngine)
+    monkeypatch.setattr(local_llm, "_engine", None)
+    monkeypatch.setattr(local_llm, "_engine_error", None)
+    with pytest.raises(OSError):
+        local_llm.get_engine()
+    with pytest.raises(RuntimeError, match="failed to load"):
+        local_llm.get_engine()
+    assert len(attempts) == 1
+
+    monkeypatch.setattr(local_llm, "LOAD_RETRY_SECONDS", 0)
+    engine = local_llm.get_engine()
+    assert len(attempts) == 2 and local_llm._engine_error is None
+    local_llm.shutdown_engine()
+    assert engine.model is not None
@@ -0,0 +1,118 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import db
+from ..config import settings
+from ..main import app
+from ..services import jobs, maintenance, vectorstore
+
+
+@pytest.fixture
+def knowledge_base(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'kaas.db'}", connect_args={"check_same_thread": False})
+    db.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(settings, "CHROMA_DB_DIR", str(tmp_path / "chroma_db"))
+    vectorstore.init_vectorstore()
+
+    old = datetime.now(timezone.utc) - timedelta(days=40)
+    uploads = [("r1", "report-2023-q1.pdf", old), ("r2", "report-2023-q2.pdf", datetime.now(timezone.utc)),
+               ("n1", "notes_2023.txt", old)]
+    session = db.SessionLocal()
+    for upload_id, filename, created_at in uploads:
+        session.add(db.Upload(id=upload_id, filename=filename, status="ready", created_at=created_at))
+        session.add(db.AuditLog(upload_id=upload_id, event_type="upload"))
+    session.commit()
+    session.close()
+
+    rng = np.random.default_rng(0)
+    ids = [f"{upload_id}_{i}" for upload_id, _, _ in uploads for i in range(50)]
+    metadatas = [{"upload_id": chunk_id.split("_")[0], "chunk_index": int(chunk_id.split("_")[1])} for chunk_id in ids]
+    vectorstore.bulk_load(ids, ["lorem ipsum " * 100] * len(ids), metadatas,
+                          rng.normal(size=(len(ids), 8)).astype(np.float32))
+    yield
+    jobs.stop()
+
+
+def _wait(job_id: str, timeout: float = 30) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_select_by_pattern_and_age(knowledge_base):
+    session = db.SessionLocal()
+    by_pattern = maintenance.select_uploads(session, filename_pattern="report-2023-*.pdf")
+    assert [u.id for u in by_pattern] == ["r1", "r2"]
+    # "_" is literal in a glob, not a LIKE wildcard
+    assert [u.id for u in maintenance.select_uploads(session, filename_pattern="notes_*")] == ["n1"]
+    assert [u.id for u in maintenance.select_uploads(session, filename_pattern="notesX*")] == []
+    both = maintenance.select_uploads(session, filename_pattern="report-*", older_than_days=30)
+    assert [u.id for u in both] == ["r1"]
+    session.close()
+
+
+def test_delete_job_removes_chunks_audit_rows_and_uploads(knowledge_base):
+    job = jobs.submit("delete", {"upload_ids": ["r1", "n1", "missing"]})
+    assert job["status"] == "pending"
+
+    job = _wait(job["id"])
+    assert job["status"] == "succeeded", job["error"]
+    assert job["result"] == {"deleted": 2, "missing": ["missing"], "in_progress": []}
+    assert job["progress"] == job["total"] == 3
+
+    assert vectorstore.collection.count() == 50
+    session = db.SessionLocal()
+    assert [u.id for u in session.query(db.Upload)] == ["r2"]
+    assert {row.upload_id for row in session.query(db.AuditLog)} == {"r2", None}
+    session.close()
+
+
+def test_uploads_being_ingested_are_not_deleted(knowledge_base):
+    session = db.SessionLocal()
+    session.add(db.Upload(id="p1", filename="report-2023-q3.pdf", status="processing",
+                          created_at=datetime.now(timezone.utc) - timedelta(days=40)))
+    session.commit()
+    session.close()
+
+    client = TestClient(app)
+    assert client.delete("/documents/p1").status_code == 409
+    dry_run = client.post("/documents/delete", json={"filename_pattern": "report-*", "dry_run": True}).json()
+    assert dry_run["upload_ids"] == ["r1", "r2"]
+    # A job queued before the upload started is skipped when it runs
+    assert maintenance.delete_uploads(["p1"]) == {"deleted": 0, "missing": [], "in_progress": ["p1"]}
+
+
+def test_compaction_drops_orphans_and_reclaims_space(knowledge_base):
+    session = db.SessionLocal()
+    # Left behind by deletes from before audit rows were cleaned up
+    session.add(db.AuditLog(upload_id="gone", event_type="query"))
+    session.commit()
+    session.close()
+    maintenance.delete_uploads(["r1", "r2"])
+    assert maintenance.needs_compaction()
+
+    result = maintenance.compact()
+    assert result["orphaned_audit_rows"] == 1
+    # Chroma's file stays open in Chroma and is not vacuumed
+    assert list(result["files"]) == ["database"]
+    assert not maintenance.needs_compaction()
+
+
+def test_retention_deletes_only_expired_uploads(knowledge_base, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_RETENTION_DAYS", 30)
+    assert maintenance.apply_retention()["uploads_deleted"] == 2
+    session = db.SessionLocal()
+    assert [u.id for u in session.query(db.Upload)] == ["r2"]
+    session.close()
@@ -0,0 +1,173 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ..services import providers
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Mimics POST /v1/chat/completions with server-sent-event streaming."""
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server.requests.append(body)
+        if server.status != 200:
+            self.send_response(server.status)
+            self.end_headers()
+            self.wfile.write(b'{"error": "boom"}')
+            return
+
+        time.sleep(server.first_token_delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for word in server.reply.split(" "):
+            chunk = {"choices": [{"delta": {"content": word + " "}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+    server.requests = []
+    server.status = 200
+    server.first_token_delay = 0.0
+    server.reply = "TechGen Corp"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_provider(server, **kwargs):
+    host, port = server.server_address
+    kwargs.setdefault("breaker", providers.CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    return providers.OpenAICompatibleProvider(
+        base_url=f"http://{host}:{port}/v1", api_key="test", model="stub-model", **kwargs
+    )
+
+
+def make_request():
+    return providers.GenerationRequest("Where?", "context", "prompt", "system")
+
+
+class StaticProvider(providers.GenerationProvider):
+    name = "static"
+
+    def __init__(self, text):
+        super().__init__(timeout=5, max_concurrency=4, breaker=providers.CircuitBreaker(5, 60))
+        self.text = text
+
+    def _complete(self, request, on_first_token):
+        on_first_token()
+        request.emit(self, self.text)
+        return self.text
+
+
+class StalledProvider(providers.GenerationProvider):
+    """Never produces a token; stops once the router cancels it."""
+
+    name = "stalled"
+
+    def __init__(self):
+        super().__init__(timeout=5, max_concurrency=16, breaker=providers.CircuitBreaker(5, 60))
+
+    def _complete(self, request, on_first_token):
+        request.cancelled.wait(5)
+        raise providers.CancelledError(f"{self.name}: cancelled")
+
+
+def test_streams_answer_over_pooled_client(stub_server):
+    provider = make_provider(stub_server)
+    assert provider.generate(make_request()).strip() == "TechGen Corp"
+    assert provider.generate(make_request()).strip() == "TechGen Corp"
+    assert stub_server.requests[0]["stream"] is True
+    assert stub_server.requests[0]["messages"][1]["content"] == "prompt"
+    provider.close()
+
+
+def test_timeout_and_circuit_breaker(stub_server):
+    stub_server.first_token_delay = 1.0
+    provider = make_provider(stub_server, timeout=0.2)
+    for _ in range(2):
+        with pytest.raises(providers.ProviderError):
+            provider.generate(make_request())
+    assert provider.breaker.state == "open"
+
+    calls = len(stub_server.requests)
+    with pytest.raises(providers.CircuitOpenError):
+        provider.generate(make_request())
+    assert len(stub_server.requests) == calls
+    provider.close()
+
+
+def test_router_falls_back_on_http_error(stub_server):
+    stub_server.status = 500
+    router = providers.ProviderRouter([make_provider(stub_server), StaticProvider("local answer")])
+    assert router.generate(make_request()) == "local answer"
+    router.close()
+
+
+def test_hedged_request_uses_fallback_when_primary_is_slow(stub_server):
+    stub_server.first_token_delay = 1.0
+    router = providers.ProviderRouter(
+        [make_provider(stub_server, timeout=5), StaticProvider("hedged answer")], hedge_after_ms=100
+    )
+    started = time.monotonic()
+    assert router.generate(make_request()) == "hedged answer"
+    assert time.monotonic() - started < 0.9
+    router.close()
+
+
+def test_streamed_tokens_come_from_one_provider(stub_server):
+    tokens = []
+    request = providers.GenerationRequest("Where?", "context", "prompt", "system", on_token=tokens.append)
+    provider = make_provider(stub_server)
+    assert provider.generate(request).strip() == "TechGen Corp"
+    assert tokens == ["TechGen ", "Corp "]
+
+    # The hedge answers first; the primary's late tokens are not mixed in
+    tokens.clear()
+    stub_server.first_token_delay = 0.3
+    request = providers.GenerationRequest("Where?", "context", "prompt", "system", on_token=tokens.append)
+    router = providers.ProviderRouter([make_provider(stub_server, timeout=5), StaticProvider("hedged answer")],
+                                      hedge_after_ms=100)
+    assert router.generate(request) == "hedged answer"
+    time.sleep(0.5)
+    assert tokens == ["hedged answer"]
+    router.close()
+    provider.close()
+
+
+def test_cancelled_hedge_loser_does_not_trip_breaker(stub_server):
+    stub_server.first_token_delay = 0.3
+    stub_server.reply = " ".join(["word"] * 50)
+    primary = make_provider(stub_server, timeout=5)
+    router = providers.ProviderRouter([primary, StaticProvider("hedged answer")], hedge_after_ms=50)
+    for _ in range(3):
+        assert router.generate(make_request()) == "hedged answer"
+    time.sleep(0.6)
+    assert primary.breaker.failures == 0 and primary.breaker.state == "closed"
+    router.close()
+
+
+def test_hedges_run_while_every_primary_is_stalled():
+    router = providers.ProviderRouter([StalledProvider(), StaticProvider("hedged answer")],
+                                      hedge_after_ms=50, max_concurrency=8)
+    started = time.monotonic()
+    with ThreadPoolExecutor(8) as pool:
+        answers = list(pool.map(lambda _: router.generate(make_request()), range(8)))
+    assert answers == ["hedged answer"] * 8
+    assert time.monotonic() - started < 2
+    router.close()
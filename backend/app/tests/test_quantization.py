@@ -0,0 +1,168 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from ..services import quantization
+
+
+def make_vectors(count=2000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(20, dim))
+    vectors = centres[rng.integers(20, size=count)] + 0.3 * rng.normal(size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def recall(index, vectors, k=5, queries=30):
+    hits = 0
+    for query in vectors[:queries]:
+        exact = np.argsort(((vectors - query) ** 2).sum(axis=1))[:k]
+        found, _ = index.search(query, k)
+        hits += len({int(i) for i in found} & set(exact.tolist()))
+    return hits / (k * queries)
+
+
+def test_search_rescores_to_near_exact_recall(tmp_path):
+    vectors = make_vectors()
+    ids = [str(i) for i in range(len(vectors))]
+    for method in quantization.METHODS:
+        index = quantization.QuantizedIndex(str(tmp_path / method), method=method, subspaces=8)
+        for start in range(0, len(vectors), 500):
+            index.add(ids[start:start + 500], vectors[start:start + 500])
+        assert recall(index, vectors) >= 0.95, method
+
+        found, distances = index.search(vectors[7], 3)
+        assert found[0] == "7" and distances[0] < 1e-6
+        stats = index.stats()
+        assert stats["ram_bytes"] < stats["float32_bytes"] / 3
+
+
+def test_index_persists_removals_and_filters(tmp_path):
+    vectors = make_vectors(count=400)
+    ids = [f"doc_{i}" for i in range(len(vectors))]
+    index = quantization.QuantizedIndex(str(tmp_path), method="sq8")
+    index.add(ids, vectors)
+    index.remove(ids[:50])
+    # Re-adding an id replaces its previous row
+    index.add(["doc_60"], vectors[61:62])
+
+    reopened = quantization.QuantizedIndex(str(tmp_path))
+    assert len(reopened) == 350
+    assert reopened.search(vectors[10], 1)[0] != ["doc_10"]
+    assert sorted(reopened.search(vectors[61], 2)[0]) == ["doc_60", "doc_61"]
+
+    found, _ = reopened.search(vectors[0], 5, allowed_ids=["doc_100", "doc_200", "doc_5"])
+    assert sorted(found) == ["doc_100", "doc_200"]
+
+    # Removing over a quarter of the rows compacts the files
+    reopened.remove(ids[50:200])
+    assert len(reopened.ids) == len(reopened) == 200
+    assert len(quantization.QuantizedIndex(str(tmp_path))) == 200
+
+
+def test_distances_follow_the_space(tmp_path):
+    rng = np.random.default_rng(1)
+    # Unnormalized vectors, so the spaces rank differently
+    vectors = (make_vectors(count=600) * rng.uniform(0.5, 2.0, size=(600, 1))).astype(np.float32)
+    ids = [str(i) for i in range(len(vectors))]
+    query = vectors[3]
+    for space in quantization.SPACES:
+        exact = quantization.exact_distances(vectors, query, space)
+        for method in quantization.METHODS:
+            index = quantization.QuantizedIndex(str(tmp_path / space / method), method=method, subspaces=8, space=space)
+            index.add(ids, vectors)
+            found, distances = index.search(query, 5)
+            assert found == [str(i) for i in np.argsort(exact)[:5]], (space, method)
+            assert np.allclose(distances, np.sort(exact)[:5], atol=1e-5)
+    assert quantization.exact_distances(vectors[:1], vectors[0], "cosine")[0] < 1e-6
+
+    # The space an index was built with survives reopening with another one
+    assert quantization.QuantizedIndex(str(tmp_path / "ip" / "sq8"), space="cosine").config["space"] == "ip"
+
+
+def test_missing_ids_are_left_out(tmp_path):
+    vectors = make_vectors(count=50)
+    index = quantization.QuantizedIndex(str(tmp_path))
+    index.add([f"doc_{i}" for i in range(50)], vectors)
+    index.remove(["doc_1"])
+
+    found, found_vectors = index.get_vectors(["doc_0", "doc_1", "unknown", "doc_2"])
+    assert found == ["doc_0", "doc_2"]
+    assert np.array_equal(found_vectors, vectors[[0, 2]])
+
+
+def test_removed_id_added_again_survives_reopening(tmp_path):
+    vectors = make_vectors(count=40)
+    index = quantization.QuantizedIndex(str(tmp_path))
+    index.add([f"doc_{i}" for i in range(40)], vectors)
+    index.remove(["doc_5"])
+    index.add(["doc_5"], vectors[5:6])
+
+    reopened = quantization.QuantizedIndex(str(tmp_path))
+    assert len(reopened) == 40
+    assert reopened.search(vectors[5], 1)[0] == ["doc_5"]
+
+
+def test_interrupted_compaction_keeps_the_old_data(tmp_path, monkeypatch):
+    vectors = make_vectors(count=100)
+    index = quantization.QuantizedIndex(str(tmp_path))
+    index.add([f"doc_{i}" for i in range(100)], vectors)
+    index.remove(["doc_0", "doc_1"])
+
+    def crash():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(index, "_save_config", crash)
+    with pytest.raises(OSError):
+        index.compact()
+
+    reopened = quantization.QuantizedIndex(str(tmp_path))
+    assert len(reopened) == 98 and reopened.search(vectors[50], 1)[0] == ["doc_50"]
+    assert [name for name in os.listdir(tmp_path) if name.startswith("data-")] == [reopened.config["data"]]
+
+
+def test_index_without_data_directories_is_moved_into_one(tmp_path):
+    vectors = make_vectors(count=60)
+    index = quantization.QuantizedIndex(str(tmp_path))
+    index.add([f"doc_{i}" for i in range(60)], vectors)
+    # Lay it out like an index written before data directories, with removals recorded by id
+    data = tmp_path / index.config["data"]
+    for name in os.listdir(data):
+        os.replace(data / name, tmp_path / name)
+    os.rmdir(data)
+    (tmp_path / "deleted.txt").write_text("doc_3\n")
+    config = json.loads((tmp_path / "config.json").read_text())
+    del config["data"]
+    (tmp_path / "config.json").write_text(json.dumps(config))
+
+    reopened = quantization.QuantizedIndex(str(tmp_path))
+    assert len(reopened) == 59 and "doc_3" not in reopened.search(vectors[3], 5)[0]
+    assert sorted(os.listdir(tmp_path)) == ["config.json", reopened.config["data"]]
+    assert len(quantization.QuantizedIndex(str(tmp_path))) == 59
+
+
+def test_retraining_swaps_in_a_new_quantizer(tmp_path):
+    vectors = make_vectors(count=200)
+    index = quantization.QuantizedIndex(str(tmp_path), train_size=10)
+    index.add([str(i) for i in range(200)], vectors)
+    old_quantizer, old_codes = index.quantizer, index.codes
+    old_low = old_quantizer.low.copy()
+
+    index.retrain(sample_size=100)
+    # A search that took the old view still scores old codes with the old parameters
+    assert index.quantizer is not old_quantizer and np.array_equal(old_quantizer.low, old_low)
+    assert index.codes is not old_codes
+    assert quantization.QuantizedIndex(str(tmp_path)).search(vectors[9], 1)[0] == ["9"]
+
+
+def test_arrays_grow_geometrically(tmp_path, monkeypatch):
+    grown = []
+    real_grow = quantization._grow
+    monkeypatch.setattr(quantization, "_grow", lambda *args: grown.append(1) or real_grow(*args))
+    vectors = make_vectors(count=3000)
+    index = quantization.QuantizedIndex(str(tmp_path), train_size=1)
+    for start in range(0, 3000, 50):
+        index.add([str(i) for i in range(start, start + 50)], vectors[start:start + 50])
+    # codes, norms and the live flags at capacities 1024, 2048 and 4096
+    assert len(grown) == 9 and len(index.codes) == 3000
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import db
+from ..api import query
+from ..config import settings
+from ..services import generation, retrieval
+
+DOCS = [Document(page_content="Paris is the capital of France.",
+                 metadata={"filename": "facts.txt", "chunk_index": 0, "upload_id": "u1"})]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'kaas.db'}", connect_args={"check_same_thread": False})
+    db.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    monkeypatch.setattr(retrieval, "retrieve_relevant_chunks", lambda question, k, ef=None: list(DOCS))
+
+    app = FastAPI()
+    app.include_router(query.router)
+    return TestClient(app)
+
+
+def _events(response):
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+    return [json.loads(line[len("data:"):]) for line in response.iter_lines() if line.startswith("data:")]
+
+
+def test_answer_is_streamed_and_recorded(client, monkeypatch):
+    def generate_answer(question, docs, on_token=None):
+        for text in ("Paris", " is", " the capital."):
+            on_token(text)
+        return "Paris is the capital."
+
+    monkeypatch.setattr(generation, "generate_answer", generate_answer)
+    with client.stream("POST", "/query/stream", json={"question": "Capital of France?"}) as response:
+        events = _events(response)
+
+    assert [event["type"] for event in events] == ["sources", "token", "token", "token", "done"]
+    assert events[0]["sources"][0]["filename"] == "facts.txt"
+    assert "".join(event["text"] for event in events[1:-1]) == "Paris is the capital."
+    done = events[-1]
+    assert done["answer"] == "Paris is the capital."
+
+    session = db.SessionLocal()
+    audit_log = session.query(db.AuditLog).filter(db.AuditLog.id == done["audit_id"]).one()
+    assert audit_log.response_text == "Paris is the capital."
+    session.close()
+
+
+def test_generation_failure_ends_with_an_error_event(client, monkeypatch):
+    def generate_answer(question, docs, on_token=None):
+        on_token("Par")
+        raise RuntimeError("every provider failed")
+
+    monkeypatch.setattr(generation, "generate_answer", generate_answer)
+    with client.stream("POST", "/query/stream", json={"question": "Capital of France?"}) as response:
+        events = _events(response)
+
+    assert [event["type"] for event in events] == ["sources", "token", "error"]
+    assert events[-1]["detail"] == "every provider failed"
+    session = db.SessionLocal()
+    assert session.query(db.AuditLog).count() == 0
+    session.close()
+
+
+def test_tokens_arrive_while_the_answer_is_generated(client, monkeypatch):
+    release = threading.Event()
+
+    def generate_answer(question, docs, on_token=None):
+        on_token("Paris")
+        assert release.wait(5)
+        return "Paris"
+
+    monkeypatch.setattr(generation, "generate_answer", generate_answer)
+
+    async def main():
+        # The test client buffers whole responses, so read the body as the server sends it
+        response = await query.query_document_stream(query.QueryRequest(question="Capital of France?"), None)
+        events = []
+        async for chunk in response.body_iterator:
+            events.append(json.loads(chunk[len("data:"):]))
+            if events[-1]["type"] == "token":
+                # Generation is still blocked; the event loop is free
+                release.set()
+        return events
+
+    assert [event["type"] for event in asyncio.run(main())] == ["sources", "token", "done"]
@@ -0,0 +1,189 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import db
+from ..config import settings
+from ..services import generations, vectorstore
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def add_document(upload_id: str, chunks: int, rng):
+    session = db.SessionLocal()
+    session.add(db.Upload(id=upload_id, filename=f"{upload_id}.txt", status="ready", chunk_count=chunks))
+    session.commit()
+    session.close()
+    ids = [f"{upload_id}_{i}" for i in range(chunks)]
+    metadatas = [{"upload_id": upload_id, "chunk_index": i, "filename": f"{upload_id}.txt"} for i in range(chunks)]
+    vectorstore.bulk_load(ids, [f"text {i}" for i in ids], metadatas, rng.normal(size=(chunks, 8)).astype(np.float32))
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'kaas.db'}", connect_args={"check_same_thread": False})
+    db.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(settings, "CHROMA_DB_DIR", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(settings, "GENERATIONS_DIR", str(tmp_path / "generations"))
+    monkeypatch.setattr(settings, "GENERATIONS_KEEP", 2)
+    vectorstore.init_vectorstore()
+    return tmp_path
+
+
+@pytest.fixture
+def replica(writer):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = dict(
+        os.environ,
+        NODE_ROLE="replica",
+        GENERATIONS_DIR=str(writer / "generations"),
+        REPLICA_DATA_DIR=str(writer / "replica_data"),
+        REPLICA_POLL_SECONDS="0.2",
+        DATABASE_URL=f"sqlite:///{writer / 'replica.db'}",
+        CHROMA_DB_DIR=str(writer / "replica_chroma"),
+        PYTHONPATH=BACKEND_DIR,
+        HF_HUB_OFFLINE="1",
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=str(writer), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    client = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=10)
+    yield client
+    client.close()
+    process.terminate()
+    process.wait(timeout=10)
+
+
+def wait_for_generation(client: httpx.Client, generation_id: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if client.get("/admin/generations").json().get("active") == generation_id:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise AssertionError(f"Replica never activated generation {generation_id}")
+
+
+def test_replica_swaps_generations_without_failing_requests(writer, replica):
+    rng = np.random.default_rng(0)
+    add_document("u1", 3, rng)
+    first = generations.publish_generation()
+    wait_for_generation(replica, first["generation"])
+    assert replica.get("/vectorstore/stats").json()["chunks"] == 3
+
+    errors, served = [], [0]
+    stop = threading.Event()
+
+    def hammer():
+        while not stop.is_set():
+            for path in ("/documents", "/vectorstore/stats"):
+                try:
+                    response = replica.get(path)
+                    if response.status_code != 200:
+                        errors.append((path, response.status_code, response.text))
+                    served[0] += 1
+                except httpx.HTTPError as e:
+                    errors.append((path, repr(e)))
+
+    threads = [threading.Thread(target=hammer) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        add_document("u2", 2, rng)
+        second = generations.publish_generation()
+        wait_for_generation(replica, second["generation"])
+        time.sleep(0.5)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    assert errors == []
+    assert served[0] > 0
+    assert replica.get("/vectorstore/stats").json()["chunks"] == 5
+    assert sorted(d["id"] for d in replica.get("/documents").json()) == ["u1", "u2"]
+    # Replicas are read-only
+    assert replica.post("/reset").status_code == 403
+
+
+def test_publish_is_atomic_and_prunes_old_generations(writer):
+    rng = np.random.default_rng(1)
+    add_document("u1", 2, rng)
+    published = [generations.publish_generation()["generation"] for _ in range(3)]
+
+    assert generations.current_generation() == published[-1]
+    assert generations.list_generations() == published[-2:]
+    # No half-built directories left behind
+    assert not [name for name in os.listdir(settings.GENERATIONS_DIR) if name.startswith(".tmp")]
+
+
+def test_pinned_generations_and_replica_audit_rows_survive_swaps(writer, monkeypatch):
+    rng = np.random.default_rng(2)
+    add_document("u1", 2, rng)
+    session = db.SessionLocal()
+    session.add(db.Upload(id="u2", filename="u2.txt", status="processing"))
+    session.add(db.AuditLog(event_type="upload", upload_id="u1"))
+    session.commit()
+    session.close()
+    vectorstore.bulk_load(["u2_0"], ["partial"], [{"upload_id": "u2", "chunk_index": 0}],
+                          rng.normal(size=(1, 8)).astype(np.float32))
+    first = generations.publish_generation()
+    # The document still being ingested and the writer's audit log are left out
+    assert first["chunks"] == 2 and first["uploads"] == 1
+
+    session = db.SessionLocal()
+    session.query(db.Upload).filter(db.Upload.id == "u2").update({"status": "ready"})
+    session.commit()
+    session.close()
+    second = generations.publish_generation()
+    assert second["chunks"] == 3 and second["uploads"] == 2
+
+    # Load in-process, as a replica would; the writer's globals are restored afterwards
+    for module, names in ((db, ("engine", "SessionLocal")), (vectorstore, ("client", "collection", "index", "documents"))):
+        for name in names:
+            monkeypatch.setattr(module, name, getattr(module, name))
+    local_engine = create_engine(f"sqlite:///{writer / 'replica.db'}", connect_args={"check_same_thread": False})
+    db.Base.metadata.create_all(bind=local_engine)
+    monkeypatch.setattr(db, "engine", local_engine)
+    monkeypatch.setattr(settings, "REPLICA_DATA_DIR", str(writer / "replica_data"))
+    monkeypatch.setattr(generations, "_loaded", generations._loaded.__class__())
+    monkeypatch.setattr(generations, "_local_engine", None)
+
+    generations._set_current(first["generation"])
+    assert generations.refresh()
+    session = db.SessionLocal()
+    assert session.query(db.AuditLog).count() == 0
+    session.add(db.AuditLog(event_type="query", query_text="served by the replica"))
+    session.commit()
+    session.close()
+
+    pinned = generations.acquire()
+    generations._set_current(second["generation"])
+    assert generations.refresh()
+    assert generations.active_generation() == second["generation"]
+    # Still in use by the pinned request
+    assert os.path.isdir(pinned["directory"])
+    generations.release(pinned)
+    assert not os.path.isdir(pinned["directory"])
+
+    session = db.SessionLocal()
+    assert [row.query_text for row in session.query(db.AuditLog).all()] == ["served by the replica"]
+    assert session.query(db.Upload).count() == 2
+    session.close()
+    for loaded in list(generations._loaded):
+        generations._retire(loaded)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from ..config import settings
+from ..services import routing, vectorstore
+
+DIM = 16
+CHUNKS_PER_DOC = 10
+
+
+@pytest.fixture
+def documents(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHROMA_DB_DIR", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(settings, "DOC_ROUTING", "on")
+    monkeypatch.setattr(settings, "DOC_ROUTING_TOP_N", 2)
+    monkeypatch.setattr(settings, "DOC_ROUTING_MEDOIDS", 1)
+    vectorstore.init_vectorstore()
+
+    rng = np.random.default_rng(0)
+    centres = np.eye(DIM)[:6] * 5
+    ids, metadatas, vectors = [], [], []
+    for doc, centre in enumerate(centres):
+        for chunk in range(CHUNKS_PER_DOC):
+            ids.append(f"d{doc}_{chunk}")
+            metadatas.append({"upload_id": f"d{doc}", "filename": f"d{doc}.txt", "chunk_index": chunk})
+            vectors.append(centre + 0.3 * rng.normal(size=DIM))
+    vectorstore.bulk_load(ids, ids, metadatas, np.asarray(vectors, dtype=np.float32))
+    assert routing.rebuild() == 6
+    return centres
+
+
+def test_profile_keeps_centroid_scale_and_real_medoids():
+    rng = np.random.default_rng(1)
+    vectors = np.concatenate([rng.normal(loc=5, size=(50, 4)), rng.normal(loc=-5, size=(50, 4))]).astype(np.float32)
+    profile = routing.DocumentProfile(sample_size=30)
+    for start in range(0, 100, 25):
+        profile.add(vectors[start:start + 25])
+
+    centroid, *medoids = profile.representatives(medoids=2)
+    assert profile.count == 100 and len(profile.sample) == 30
+    assert np.linalg.norm(centroid) == pytest.approx(np.linalg.norm(vectors, axis=1).mean(), rel=1e-4)
+    # One medoid per cluster, each an actual chunk vector
+    assert sorted(np.sign(m[0]) for m in medoids) == [-1, 1]
+    assert all(any(np.array_equal(m, v) for v in vectors) for m in medoids)
+
+
+def test_search_is_restricted_to_routed_documents(documents):
+    query = (documents[3] + 0.1 * documents[4]).tolist()
+    routed = routing.route(query, 2)
+    assert list(routed) == ["d3", "d4"] and routed["d3"] == CHUNKS_PER_DOC
+
+    results = routing.search("", 5, query_embedding=query)
+    assert {m["upload_id"] for m in results["metadatas"][0]} <= {"d3", "d4"}
+
+
+def test_falls_back_to_global_search_when_routed_documents_are_too_small(documents, monkeypatch):
+    query = documents[3].tolist()
+    assert len(routing.search("", 25, query_embedding=query)["ids"][0]) == 25
+
+    monkeypatch.setattr(settings, "DOC_ROUTING_FALLBACK", False)
+    assert len(routing.search("", 25, query_embedding=query)["ids"][0]) == 2 * CHUNKS_PER_DOC
+
+
+def test_deleting_a_document_removes_it_from_routing(documents):
+    vectorstore.delete_by_upload_id("d3")
+    assert "d3" not in routing.route(documents[3].tolist(), 2)
+
+
+def test_auto_mode_routes_only_quantized_collections(documents, monkeypatch):
+    monkeypatch.setattr(settings, "DOC_ROUTING", "auto")
+    assert vectorstore.index is None
+    assert routing.route(documents[3].tolist(), 2) is None
@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from ..config import settings
+from ..services import sessions, vectorstore
+
+
+def make_doc(chunk_id, text):
+    return Document(page_content=text, metadata={"chunk_id": chunk_id, "filename": "resume.txt"})
+
+
+def test_follow_up_is_condensed_with_conversation_terms():
+    session = sessions.ChatSession("s1")
+    question = "Where did Alex Doe work before Innovatech Solutions?"
+    assert session.condense(question) == question
+
+    session.record_turn(question, question, "TechGen Corp.", [make_doc("u_1", "TechGen Corp.")])
+    standalone = session.condense("What about the second one?")
+    assert standalone.startswith("What about the second one?")
+    assert "Innovatech" in standalone and "Alex" in standalone
+
+    # Self-contained questions are left alone even mid-conversation
+    other = "Which databases does Alex Doe know well?"
+    assert session.condense(other) == other
+
+
+def test_chunks_are_cached_per_standalone_query():
+    session = sessions.ChatSession("s1")
+    docs = [make_doc("u_1", "first"), make_doc("u_2", "second")]
+    session.record_turn("Skills of Alex Doe?", "Skills of Alex Doe?", "Python", docs)
+
+    assert [d.page_content for d in session.cached_chunks("skills of alex doe")] == ["first", "second"]
+    assert session.cached_chunks("something else entirely") is None
+    assert [d.metadata["chunk_id"] for d in session.previous_chunks()] == ["u_1", "u_2"]
+
+
+def test_store_evicts_idle_sessions_and_enforces_memory_cap():
+    store = sessions.SessionStore(idle_ttl_seconds=60, max_memory_bytes=4096)
+    idle = store.create()
+    idle.last_access = time.monotonic() - 120
+    active = store.create()
+    assert store.get(idle.id) is None
+    assert store.get(active.id) is active
+
+    newest = store.create()
+    newest.record_turn("q", "q", "a", [make_doc("u_1", "x" * 5000)])
+    store.touch(newest)
+    # The least recently used session goes first when over the cap
+    assert store.get(active.id) is None
+    assert store.get(newest.id) is newest
+
+
+def test_deleting_a_document_drops_its_cached_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHROMA_DB_DIR", str(tmp_path / "chroma_db"))
+    vectorstore.init_vectorstore()
+    ids = ["u_0", "u_1"]
+    vectorstore.bulk_load(ids, ["first", "second"], [{"upload_id": "u", "chunk_index": i} for i in range(2)],
+                          np.random.default_rng(0).normal(size=(2, 8)).astype(np.float32))
+
+    session = sessions.ChatSession("s1")
+    assert session.cached_chunks("skills of alex doe") is None
+    session.record_turn("Skills of Alex Doe?", "Skills of Alex Doe?", "Python",
+                        [make_doc("u_0", "first"), make_doc("u_1", "second")])
+    assert len(session.cached_chunks("skills of alex doe")) == 2
+
+    vectorstore.delete_by_upload_id("u")
+    assert session.cached_chunks("skills of alex doe") is None
+    assert session.previous_chunks() == [] and not session.chunk_cache
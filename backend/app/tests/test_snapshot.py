@@ -0,0 +1,137 @@
+import hashlib
+import io
+import json
+import zipfile
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import db
+from ..config import settings
+from ..services import snapshot, vectorstore
+
+
+@pytest.fixture
+def knowledge_base(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'kaas.db'}", connect_args={"check_same_thread": False})
+    db.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.setattr(settings, "CHROMA_DB_DIR", str(tmp_path / "chroma_db"))
+    vectorstore.init_vectorstore()
+
+    session = db.SessionLocal()
+    session.add_all([
+        db.Upload(id="u1", filename="a.txt", status="ready", chunk_count=3),
+        db.Upload(id="u2", filename="b.txt", status="processing"),
+    ])
+    session.commit()
+    session.close()
+
+    rng = np.random.default_rng(0)
+    ids = ["u1_0", "u1_1", "u1_2", "u2_0"]
+    metadatas = [{"upload_id": i.split("_")[0], "chunk_index": int(i[-1]), "filename": "a.txt"} for i in ids]
+    metadatas[0]["section"] = "Intro"
+    vectors = rng.normal(size=(4, 8)).astype(np.float32)
+    vectorstore.bulk_load(ids, [f"text {i}" for i in ids], metadatas, vectors)
+    return vectors
+
+
+def test_snapshot_round_trip_without_reembedding(tmp_path, knowledge_base):
+    path = str(tmp_path / "snap.zip")
+    manifest = snapshot.export_snapshot(path)
+    # The document still being ingested is left out, with its partial chunks
+    assert manifest["chunks"] == 3 and manifest["uploads"] == 1
+
+    vectorstore.reset_vectorstore()
+    snapshot.import_snapshot(path)
+
+    stored = vectorstore.collection.get(ids=["u1_0"], include=["embeddings", "metadatas", "documents"])
+    assert np.allclose(stored["embeddings"][0], knowledge_base[0])
+    assert stored["metadatas"][0]["section"] == "Intro"
+    assert stored["documents"] == ["text u1_0"]
+    assert vectorstore.collection.count() == 3
+
+    session = db.SessionLocal()
+    assert [(u.id, u.chunk_count) for u in session.query(db.Upload).all()] == [("u1", 3)]
+    session.close()
+
+
+def test_corrupt_snapshot_is_rejected_before_import(tmp_path, knowledge_base):
+    path = str(tmp_path / "snap.zip")
+    snapshot.export_snapshot(path)
+    corrupt = str(tmp_path / "corrupt.zip")
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(corrupt, "w") as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            target.writestr(item, data.replace(b"text u1_1", b"text XX_1"))
+
+    with pytest.raises(snapshot.SnapshotError, match="Checksum mismatch"):
+        snapshot.import_snapshot(corrupt)
+    # Live data untouched
+    assert vectorstore.collection.count() == 4
+
+
+def test_import_streams_batches_and_keeps_live_data_on_failure(tmp_path, knowledge_base, monkeypatch):
+    path = str(tmp_path / "snap.zip")
+    snapshot.export_snapshot(path)
+    with zipfile.ZipFile(path) as archive:
+        assert "uploads/filename.bin" in archive.namelist() and "chunks/ids.bin" in archive.namelist()
+    monkeypatch.setattr(snapshot, "BATCH_ROWS", 2)
+
+    def failing_write(*args):
+        raise RuntimeError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(snapshot, "write_uploads", failing_write)
+        with pytest.raises(RuntimeError, match="disk full"):
+            snapshot.import_snapshot(path)
+    # The new collection was dropped and the live one kept
+    assert vectorstore.collection.count() == 4 and vectorstore.rebuild_target is None
+    assert {c.name for c in vectorstore.client.list_collections()} == {
+        vectorstore.COLLECTION_NAME, vectorstore.DOCUMENTS_COLLECTION_NAME}
+
+    batches = []
+    read_chunks = snapshot.read_chunks
+
+    def recording_read_chunks(*args):
+        for batch in read_chunks(*args):
+            batches.append(batch[0])
+            yield batch
+
+    monkeypatch.setattr(snapshot, "read_chunks", recording_read_chunks)
+    snapshot.import_snapshot(path)
+    assert batches == [["u1_0", "u1_1"], ["u1_2"]]
+    assert vectorstore.collection.count() == 3
+    assert vectorstore.documents.get(include=[])["ids"]
+
+
+def test_version_1_snapshots_still_import(tmp_path, knowledge_base):
+    path = str(tmp_path / "v1.zip")
+    vectors = knowledge_base[:2]
+    members = {
+        "uploads.json": {"id": ["u1"], "filename": ["a.txt"], "status": ["ready"],
+                         "created_at": ["2024-01-02T03:04:05"]},
+        "chunks/ids.json": ["u1_0", "u1_1"],
+        "chunks/texts.json": ["first", "second"],
+        "chunks/metadata.json": {"upload_id": ["u1", "u1"], "section": ["Intro", None]},
+    }
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, value in members.items():
+            archive.writestr(name, json.dumps(value))
+        buffer = io.BytesIO()
+        np.save(buffer, vectors)
+        archive.writestr("chunks/embeddings.npy", buffer.getvalue())
+        files = {name: {"sha256": hashlib.sha256(archive.read(name)).hexdigest()} for name in archive.namelist()}
+        archive.writestr("manifest.json", json.dumps({
+            "format": snapshot.FORMAT, "version": 1, "embedding_model": settings.EMBEDDING_MODEL,
+            "chunks": 2, "uploads": 1, "files": files}))
+
+    snapshot.import_snapshot(path)
+    stored = vectorstore.collection.get(ids=["u1_0", "u1_1"], include=["embeddings", "metadatas"])
+    assert np.allclose(stored["embeddings"], vectors)
+    assert stored["metadatas"] == [{"upload_id": "u1", "section": "Intro"}, {"upload_id": "u1"}]
+    session = db.SessionLocal()
+    assert [u.id for u in session.query(db.Upload).all()] == ["u1"]
+    session.close()
@@ -0,0 +1,32 @@
+from ..services import chunking, text_loader
+
+
+def test_windows_decode_exactly_across_split_characters(tmp_path):
+    text = "Résumé — naïve café 日本語 🚀\n" * 500
+    path = tmp_path / "big.txt"
+    path.write_bytes(text.encode("utf-8"))
+
+    # A tiny odd window size forces multi-byte characters to straddle windows
+    windows = list(text_loader.iter_text_windows(str(path), window_bytes=7))
+    assert "".join(w["text"] for w in windows) == text
+    for window in windows:
+        assert text[window["char_start"]:window["char_end"]] == window["text"]
+
+    chunks = list(chunking.chunk_stream((w["text"] for w in windows), 300, 50))
+    assert chunks == chunking.chunk_text(text, 300, 50)
+
+
+def test_encoding_is_detected_from_sample(tmp_path):
+    cases = {
+        "utf16.txt": ("Ünïcode text\n".encode("utf-16"), "Ünïcode text\n"),
+        "bom.txt": (b"\xef\xbb\xbfhello", "hello"),
+        "latin1.txt": ("caf\xe9 cr\xe8me".encode("latin-1"), "café crème"),
+    }
+    for name, (data, expected) in cases.items():
+        path = tmp_path / name
+        path.write_bytes(data)
+        assert "".join(w["text"] for w in text_loader.iter_text_windows(str(path), window_bytes=3)) == expected
+
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+    assert list(text_loader.iter_text_windows(str(empty))) == []
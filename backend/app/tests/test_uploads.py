@@ -0,0 +1,157 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import db
+from ..api import ingestion, uploads as uploads_api
+from ..config import settings
+from ..services import uploads
+
+PART_SIZE = 1024
+CONTENT = b"".join(f"Line {i}: resumable uploads write parts at their offsets.\n".encode() for i in range(100))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'kaas.db'}", connect_args={"check_same_thread": False})
+    db.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("storage")
+    monkeypatch.setattr(settings, "UPLOAD_PART_SIZE", PART_SIZE)
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", False)
+    ingested = []
+    monkeypatch.setattr(ingestion, "_run_admitted_ingestion",
+                        lambda ticket, file_path, filename, upload_id: (ticket.release(), ingested.append(file_path)))
+
+    app = FastAPI()
+    app.include_router(uploads_api.router)
+    test_client = TestClient(app)
+    test_client.ingested = ingested
+    return test_client
+
+
+def _put(client, upload_id, offset, data, checksum=True):
+    headers = {"X-Content-SHA256": hashlib.sha256(data).hexdigest()} if checksum else {}
+    return client.put(f"/uploads/{upload_id}/parts", params={"offset": offset}, content=data, headers=headers)
+
+
+def test_parts_in_any_order_are_assembled_and_ingested(client):
+    created = client.post("/uploads", json={"filename": "../notes.txt", "size": len(CONTENT),
+                                            "sha256": hashlib.sha256(CONTENT).hexdigest()}).json()
+    upload_id = created["upload_id"]
+    assert created["filename"] == "notes.txt" and created["part_size"] == PART_SIZE
+    offsets = list(range(0, len(CONTENT), PART_SIZE))
+    assert created["missing_offsets"] == offsets
+
+    # Drop the first part, send the rest in parallel and out of order
+    with ThreadPoolExecutor(4) as pool:
+        responses = list(pool.map(lambda o: _put(client, upload_id, o, CONTENT[o:o + PART_SIZE]), reversed(offsets[1:])))
+    assert all(r.status_code == 200 for r in responses)
+
+    status = client.get(f"/uploads/{upload_id}").json()
+    assert status["ranges"] == [[PART_SIZE, len(CONTENT)]] and status["missing_offsets"] == [0]
+    incomplete = client.post(f"/uploads/{upload_id}/complete")
+    assert incomplete.status_code == 409 and incomplete.json()["detail"]["missing_offsets"] == [0]
+
+    assert _put(client, upload_id, 0, CONTENT[:PART_SIZE]).status_code == 200
+    completed = client.post(f"/uploads/{upload_id}/complete")
+    assert completed.status_code == 202 and completed.json()["upload_id"] == upload_id
+    with open(client.ingested[0], "rb") as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(uploads.data_path(upload_id))
+
+    # A retried completion is answered without ingesting twice
+    assert client.post(f"/uploads/{upload_id}/complete").json()["upload_id"] == upload_id
+    assert len(client.ingested) == 1
+    session = db.SessionLocal()
+    assert session.query(db.Upload).filter(db.Upload.id == upload_id).one().byte_size == len(CONTENT)
+    assert session.query(db.UploadPart).count() == 0
+    session.close()
+
+
+def test_bad_parts_are_rejected_and_not_recorded(client):
+    upload_id = client.post("/uploads", json={"filename": "notes.txt", "size": len(CONTENT)}).json()["upload_id"]
+    part = CONTENT[:PART_SIZE]
+
+    assert _put(client, upload_id, 10, part).status_code == 400  # not a part boundary
+    assert _put(client, upload_id, 0, part[:-1]).status_code == 400  # short
+    assert _put(client, upload_id, 0, part + b"x").status_code == 400  # long
+    corrupted = client.put(f"/uploads/{upload_id}/parts", params={"offset": 0}, content=b"y" * PART_SIZE,
+                           headers={"X-Content-SHA256": hashlib.sha256(part).hexdigest()})
+    assert corrupted.status_code == 400
+    assert client.get(f"/uploads/{upload_id}").json()["received_bytes"] == 0
+
+    last = (len(CONTENT) // PART_SIZE) * PART_SIZE
+    assert _put(client, upload_id, last, CONTENT[last:], checksum=False).json()["size"] == len(CONTENT) - last
+    assert client.get(f"/uploads/{upload_id}").json()["ranges"] == [[last, len(CONTENT)]]
+
+
+def test_stale_sessions_expire(client, monkeypatch):
+    upload_id = client.post("/uploads", json={"filename": "notes.txt", "size": len(CONTENT)}).json()["upload_id"]
+    assert uploads.expire_sessions() == 0
+
+    monkeypatch.setattr(settings, "UPLOAD_SESSION_TTL_HOURS", 0)
+    assert uploads.expire_sessions() == 1
+    assert not os.path.exists(uploads.data_path(upload_id))
+    assert client.get(f"/uploads/{upload_id}").status_code == 404
+
+
+def test_bad_resend_keeps_the_recorded_part(client):
+    upload_id = client.post("/uploads", json={"filename": "notes.txt", "size": len(CONTENT),
+                                              "sha256": hashlib.sha256(CONTENT).hexdigest()}).json()["upload_id"]
+    part = CONTENT[:PART_SIZE]
+    assert _put(client, upload_id, 0, part).status_code == 200
+
+    # A corrupted and a truncated resend of the part that already arrived
+    corrupted = client.put(f"/uploads/{upload_id}/parts", params={"offset": 0}, content=b"y" * PART_SIZE,
+                           headers={"X-Content-SHA256": hashlib.sha256(part).hexdigest()})
+    assert corrupted.status_code == 400
+    assert _put(client, upload_id, 0, part[:-10]).status_code == 400
+    assert client.get(f"/uploads/{upload_id}").json()["ranges"] == [[0, PART_SIZE]]
+
+    for offset in range(PART_SIZE, len(CONTENT), PART_SIZE):
+        assert _put(client, upload_id, offset, CONTENT[offset:offset + PART_SIZE]).status_code == 200
+    assert client.post(f"/uploads/{upload_id}/complete").status_code == 202
+    with open(client.ingested[0], "rb") as f:
+        assert f.read() == CONTENT
+    assert os.listdir(uploads.PARTS_DIR) == []
+
+
+def test_concurrent_completions_assemble_once(client):
+    upload_id = client.post("/uploads", json={"filename": "notes.txt", "size": len(CONTENT)}).json()["upload_id"]
+    for offset in range(0, len(CONTENT), PART_SIZE):
+        assert _put(client, upload_id, offset, CONTENT[offset:offset + PART_SIZE]).status_code == 200
+
+    with ThreadPoolExecutor(4) as pool:
+        responses = list(pool.map(lambda _: client.post(f"/uploads/{upload_id}/complete"), range(4)))
+    assert {r.status_code for r in responses} <= {202, 409} and len(client.ingested) == 1
+    with open(client.ingested[0], "rb") as f:
+        assert f.read() == CONTENT
+
+
+def test_parts_and_completions_wait_for_the_session_to_be_open(client):
+    upload_id = client.post("/uploads", json={"filename": "notes.txt", "size": len(CONTENT)}).json()["upload_id"]
+    # Another request is assembling the upload
+    session = db.SessionLocal()
+    assert uploads._claim(session, uploads.get_session(session, upload_id), "assembling")
+    session.commit()
+    assert _put(client, upload_id, 0, CONTENT[:PART_SIZE]).status_code == 409
+    assert client.post(f"/uploads/{upload_id}/complete").status_code == 409
+
+    # A session whose data file went missing can't be completed
+    session.query(db.UploadSession).filter(db.UploadSession.id == upload_id).update({"status": "open"})
+    session.commit()
+    session.close()
+    for offset in range(0, len(CONTENT), PART_SIZE):
+        assert _put(client, upload_id, offset, CONTENT[offset:offset + PART_SIZE]).status_code == 200
+    os.remove(uploads.data_path(upload_id))
+    assert client.post(f"/uploads/{upload_id}/complete").status_code == 409
+    assert client.get(f"/uploads/{upload_id}").status_code == 404
+    assert client.ingested == []
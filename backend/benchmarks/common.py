@@ -0,0 +1,94 @@
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+
+def configure_environment(workdir: Optional[str] = None) -> str:
+    """
+    Points the app settings at a throwaway database and vector store and disables
+    remote generation. Must be called before anything from `app` is imported,
+    because the settings are read once at import time.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="kaas_bench_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'kaas_bench.db')}"
+    os.environ["CHROMA_DB_DIR"] = os.path.join(workdir, "chroma_db")
+    os.environ["GROQ_API_KEY"] = ""
+    os.environ["HF_HUB_OFFLINE"] = os.environ.get("HF_HUB_OFFLINE", "1")
+    return workdir
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Returns the pct-th percentile (0-100) using linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def latency_summary(latencies_s: List[float]) -> Dict[str, float]:
+    """Summarises a list of latencies (seconds) as milliseconds."""
+    return {
+        "count": len(latencies_s),
+        "p50_ms": percentile(latencies_s, 50) * 1000,
+        "p95_ms": percentile(latencies_s, 95) * 1000,
+        "p99_ms": percentile(latencies_s, 99) * 1000,
+        "mean_ms": (sum(latencies_s) / len(latencies_s) * 1000) if latencies_s else 0.0,
+    }
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of the current process."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def environment_info() -> Dict[str, str]:
+    """Host details stored with every result so runs can be compared fairly."""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": str(os.cpu_count()),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def write_json(path: str, payload: Dict):
+    """Writes results as pretty-printed JSON, creating parent directories."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+
+
+def compare_to_baseline(results: Dict[str, float], baseline: Dict[str, float],
+                        directions: Dict[str, str], tolerance: float) -> List[Dict]:
+    """
+    Compares flat metric dicts. `directions` maps each metric to "higher" or "lower"
+    (which way is better). Returns one entry per metric present in both, flagging
+    regressions that are worse than the baseline by more than `tolerance` (a fraction).
+    """
+    report = []
+    for metric, direction in directions.items():
+        if metric not in results or metric not in baseline or not baseline[metric]:
+            continue
+        current, previous = results[metric], baseline[metric]
+        change = (current - previous) / previous
+        worse = -change if direction == "higher" else change
+        report.append({
+            "metric": metric,
+            "baseline": previous,
+            "current": current,
+            "change_pct": round(change * 100, 2),
+            "regression": worse > tolerance,
+        })
+    return report
@@ -0,0 +1,119 @@
+import os
+import random
+from typing import List, Dict
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_data")
+SAMPLE_FILE = os.path.join(SAMPLE_DATA_DIR, "sample_resume.txt")
+
+FIRST_NAMES = ["Alex", "Jordan", "Sam", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn"]
+LAST_NAMES = ["Doe", "Smith", "Garcia", "Chen", "Patel", "Okafor", "Novak", "Silva", "Kim", "Larsen"]
+COMPANIES = [
+    "Innovatech Solutions", "TechGen Corp.", "Bluewave Systems", "Northstar Labs", "Cobalt Analytics",
+    "Helix Robotics", "Quantum Ledger", "Summit Cloud", "Arcadia Health", "Pioneer Logistics",
+]
+CITIES = [
+    "San Francisco, CA", "Austin, TX", "Seattle, WA", "Boston, MA", "Denver, CO",
+    "Chicago, IL", "New York, NY", "Portland, OR", "Atlanta, GA", "Raleigh, NC",
+]
+ROLES = ["Software Engineer", "Data Engineer", "Platform Engineer", "Backend Developer", "ML Engineer"]
+SKILLS = ["Python", "Java", "Go", "Rust", "SQL", "Kafka", "Docker", "Kubernetes", "React", "PostgreSQL"]
+
+
+def load_sample_text() -> str:
+    """Reads the bundled sample resume used as the template for synthetic documents."""
+    with open(SAMPLE_FILE, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _sample_bullets(template: str) -> List[str]:
+    """Returns the bullet lines of the sample resume, reused as filler content."""
+    return [line.strip() for line in template.splitlines() if line.strip().startswith("-")]
+
+
+def generate_document(index: int, rng: random.Random, bullets: List[str], target_chars: int) -> Dict:
+    """
+    Generates one synthetic resume. The returned dict contains the text plus the
+    facts that were written into it, so callers can build labelled questions.
+    """
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {index}"
+    role = rng.choice(ROLES)
+    companies = rng.sample(COMPANIES, 3)
+    cities = rng.sample(CITIES, 3)
+    skills = rng.sample(SKILLS, 5)
+    start_year = rng.randint(2005, 2016)
+
+    lines = [
+        name,
+        role,
+        f"{name.lower().replace(' ', '.')}@email.com",
+        "",
+        "Summary",
+        f"{name} is a {role} with experience across {', '.join(skills[:3])}.",
+        "",
+        "Experience",
+    ]
+    year = start_year + 3 * len(companies)
+    for company, city in zip(companies, cities):
+        lines.append(f"{role} | {company} | {city} | {year - 3} - {year}")
+        for bullet in rng.sample(bullets, min(3, len(bullets))):
+            lines.append(bullet)
+        lines.append("")
+        year -= 3
+
+    lines.append("Skills")
+    lines.append(f"- Languages and tools: {', '.join(skills)}")
+
+    # Pad with extra project history until the document reaches the requested size
+    project = 1
+    while sum(len(line) + 1 for line in lines) < target_chars:
+        lines.append("")
+        lines.append(f"Project {project} at {rng.choice(companies)}")
+        lines.extend(rng.sample(bullets, min(2, len(bullets))))
+        project += 1
+
+    return {
+        "filename": f"synthetic_resume_{index:05d}.txt",
+        "text": "\n".join(lines),
+        "facts": {
+            "name": name,
+            "role": role,
+            "current_company": companies[0],
+            "previous_company": companies[1],
+            "current_city": cities[0],
+            "skills": skills,
+        },
+    }
+
+
+def generate_corpus(num_docs: int, doc_chars: int = 4000, seed: int = 42) -> List[Dict]:
+    """
+    Generates a deterministic synthetic corpus scaled from the sample resume.
+    The same seed always produces the same documents.
+    """
+    rng = random.Random(seed)
+    bullets = _sample_bullets(load_sample_text())
+    return [generate_document(i, rng, bullets, doc_chars) for i in range(num_docs)]
+
+
+def generate_questions(corpus: List[Dict], num_questions: int, seed: int = 42) -> List[Dict]:
+    """
+    Builds questions about the synthetic corpus. Each question carries the filename
+    and the text expected to appear in a relevant chunk.
+    """
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(num_questions):
+        doc = rng.choice(corpus)
+        facts = doc["facts"]
+        kind = rng.randint(0, 2)
+        if kind == 0:
+            question = f"Where did {facts['name']} work before {facts['current_company']}?"
+            expected = facts["previous_company"]
+        elif kind == 1:
+            question = f"In which city does {facts['name']} currently work?"
+            expected = facts["current_city"]
+        else:
+            question = f"What is the role of {facts['name']}?"
+            expected = facts["name"]
+        questions.append({"question": question, "filename": doc["filename"], "expected_text": expected})
+    return questions
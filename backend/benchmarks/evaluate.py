@@ -0,0 +1,225 @@
+"""
+Offline retrieval quality-vs-latency evaluation.
+
+Sweeps chunk size, chunk overlap, k and embedding model through the real
+`chunking.chunk_text`, `vectorstore` and `retrieval` code and reports
+recall@k, MRR, ingestion cost, query latency and prompt size for every
+configuration, plus the Pareto front. Run from the `backend` directory:
+
+    python -m benchmarks.evaluate --synthetic 100
+    python -m benchmarks.evaluate --docs-dir sample_data \\
+        --labels benchmarks/data/sample_resume_eval.jsonl \\
+        --chunk-sizes 300,500,800 --overlaps 0,50,100 --ks 3,5,7
+
+Labels are JSONL lines with `question`, `expected_text` and optionally
+`filename`. The expected chunk is identified by a text span rather than a
+chunk index, because chunk boundaries move as the settings change: a
+retrieved chunk is relevant if it comes from `filename` (when given) and
+contains `expected_text` (case-insensitive).
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Dict, List
+
+from . import common, corpus
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _csv_ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _csv_strs(value: str) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def load_labels(path: str) -> List[Dict]:
+    """Reads a JSONL labelled set."""
+    labels = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                labels.append(json.loads(line))
+    return labels
+
+
+def load_documents(docs_dir: str) -> List[Dict]:
+    """Loads every supported document in a directory into {"filename", "text"} dicts."""
+    from app.services import loaders
+
+    documents = []
+    for name in sorted(os.listdir(docs_dir)):
+        path = os.path.join(docs_dir, name)
+        if not os.path.isfile(path):
+            continue
+        format_name = loaders.sniff_format(path, name)
+        if format_name is None:
+            continue
+        text = "\n".join(segment["text"] for segment in loaders.load_segments(path, format_name))
+        documents.append({"filename": name, "text": text})
+    return documents
+
+
+def is_relevant(doc, label: Dict) -> bool:
+    """True if a retrieved chunk satisfies a label."""
+    filename = label.get("filename")
+    if filename and doc.metadata.get("filename") != filename:
+        return False
+    return label["expected_text"].lower() in doc.page_content.lower()
+
+
+def ingest(documents: List[Dict], chunk_size: int, chunk_overlap: int) -> Dict:
+    """Rebuilds the collection for one chunking configuration and measures the cost."""
+    from app.services import chunking, vectorstore
+
+    vectorstore.reset_vectorstore()
+    started = time.perf_counter()
+    chunk_count = 0
+    embedded_chars = 0
+    for doc in documents:
+        chunks = chunking.chunk_text(doc["text"], chunk_size, chunk_overlap)
+        vectorstore.upsert_chunks(str(uuid.uuid4()), doc["filename"], chunks)
+        chunk_count += len(chunks)
+        embedded_chars += sum(len(c["chunk_text"]) for c in chunks)
+    return {
+        "ingest_seconds": time.perf_counter() - started,
+        "chunks": chunk_count,
+        "embedded_chars": embedded_chars,
+    }
+
+
+def evaluate_k(labels: List[Dict], k: int) -> Dict:
+    """Runs every labelled question at a given k and scores the results."""
+    from app.services import retrieval
+
+    hits = 0
+    reciprocal_ranks = 0.0
+    latencies = []
+    context_chars = 0
+    for label in labels:
+        started = time.perf_counter()
+        docs = retrieval.retrieve_relevant_chunks(label["question"], k=k)
+        latencies.append(time.perf_counter() - started)
+        context_chars += sum(len(doc.page_content) for doc in docs)
+        for rank, doc in enumerate(docs, start=1):
+            if is_relevant(doc, label):
+                hits += 1
+                reciprocal_ranks += 1.0 / rank
+                break
+
+    summary = common.latency_summary(latencies)
+    count = len(labels) or 1
+    return {
+        "recall_at_k": hits / count,
+        "mrr": reciprocal_ranks / count,
+        "query_p50_ms": summary["p50_ms"],
+        "query_p95_ms": summary["p95_ms"],
+        "avg_context_chars": context_chars / count,
+    }
+
+
+def pareto_front(rows: List[Dict]) -> List[Dict]:
+    """
+    Configurations not dominated by any other on (recall higher, p50 latency lower,
+    prompt size lower).
+    """
+    def dominates(a, b):
+        better_or_equal = (
+            a["recall_at_k"] >= b["recall_at_k"]
+            and a["query_p50_ms"] <= b["query_p50_ms"]
+            and a["avg_context_chars"] <= b["avg_context_chars"]
+        )
+        strictly_better = (
+            a["recall_at_k"] > b["recall_at_k"]
+            or a["query_p50_ms"] < b["query_p50_ms"]
+            or a["avg_context_chars"] < b["avg_context_chars"]
+        )
+        return better_or_equal and strictly_better
+
+    return [row for row in rows if not any(dominates(other, row) for other in rows if other is not row)]
+
+
+def print_table(rows: List[Dict]):
+    header = (f"{'model':<24} {'size':>5} {'ovl':>4} {'k':>3} {'recall':>7} {'mrr':>6} "
+              f"{'p50ms':>7} {'p95ms':>7} {'ctx_chars':>9} {'chunks':>7} {'ingest_s':>8} pareto")
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['model'][:24]:<24} {row['chunk_size']:>5} {row['chunk_overlap']:>4} {row['k']:>3} "
+              f"{row['recall_at_k']:>7.3f} {row['mrr']:>6.3f} {row['query_p50_ms']:>7.1f} "
+              f"{row['query_p95_ms']:>7.1f} {row['avg_context_chars']:>9.0f} {row['chunks']:>7} "
+              f"{row['ingest_seconds']:>8.2f} {'*' if row['pareto'] else ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retrieval quality-vs-latency sweep.")
+    parser.add_argument("--labels", help="JSONL labelled question set.")
+    parser.add_argument("--docs-dir", help="Directory with the PDF/TXT documents the labels refer to.")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Generate N synthetic documents (and labels) instead of --docs-dir/--labels.")
+    parser.add_argument("--questions", type=int, default=100, help="Synthetic questions to generate.")
+    parser.add_argument("--chunk-sizes", type=_csv_ints, default=[300, 500, 800])
+    parser.add_argument("--overlaps", type=_csv_ints, default=[0, 50, 100])
+    parser.add_argument("--ks", type=_csv_ints, default=[3, 5, 7])
+    parser.add_argument("--models", type=_csv_strs, default=None,
+                        help="Comma-separated embedding models (default: settings.EMBEDDING_MODEL).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "evaluation.json"))
+    args = parser.parse_args(argv)
+
+    if not args.synthetic and not (args.labels and args.docs_dir):
+        parser.error("either --synthetic N or both --labels and --docs-dir are required")
+
+    common.configure_environment()
+
+    from app.config import settings
+    from app.services import embeddings, vectorstore
+
+    vectorstore.init_vectorstore()
+
+    if args.synthetic:
+        documents = corpus.generate_corpus(args.synthetic, seed=args.seed)
+        labels = corpus.generate_questions(documents, args.questions, args.seed)
+    else:
+        documents = load_documents(args.docs_dir)
+        labels = load_labels(args.labels)
+
+    models = args.models or [settings.EMBEDDING_MODEL]
+    rows = []
+    for model_name in models:
+        if model_name != settings.EMBEDDING_MODEL or embeddings.model is None:
+            embeddings.load_model(model_name)
+        for chunk_size, overlap in itertools.product(args.chunk_sizes, args.overlaps):
+            if overlap >= chunk_size:
+                continue
+            print(f"[{model_name}] chunk_size={chunk_size} overlap={overlap}: ingesting...")
+            cost = ingest(documents, chunk_size, overlap)
+            for k in args.ks:
+                scores = evaluate_k(labels, k)
+                rows.append(dict(model=model_name, chunk_size=chunk_size, chunk_overlap=overlap, k=k,
+                                 **cost, **scores))
+
+    front = {id(row) for row in pareto_front(rows)}
+    for row in rows:
+        row["pareto"] = id(row) in front
+
+    print()
+    print_table(rows)
+    common.write_json(args.output, {
+        "environment": common.environment_info(),
+        "documents": len(documents),
+        "labels": len(labels),
+        "results": rows,
+    })
+    print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
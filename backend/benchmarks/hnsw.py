@@ -0,0 +1,140 @@
+"""
+Recall/latency curve of the HNSW index for each index setting.
+
+For each (M, construction ef) pair, builds a Chroma collection over the same
+vectors with the vector store's own code, then sweeps the per-request search
+ef and compares the top-k against exact search. Vectors are synthetic (clustered,
+unit-length) or real embeddings of the synthetic corpus. Run from the `backend`
+directory:
+
+    python -m benchmarks.hnsw --vectors 50000
+    python -m benchmarks.hnsw --configs 8:50,16:100,32:200 --efs 10,20,50,100,200,400
+    python -m benchmarks.hnsw --embed-corpus 300 --space cosine
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from . import common
+from .quantization import corpus_vectors, exact_top_k, synthetic_vectors
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_config(value: str) -> Dict:
+    m, _, construction_ef = value.partition(":")
+    return {"max_neighbors": int(m), "ef_construction": int(construction_ef or 100)}
+
+
+def evaluate(vectors: np.ndarray, queries: np.ndarray, truth: List[set], config: Dict, efs: List[int],
+             space: str, k: int, workdir: str) -> List[Dict]:
+    import chromadb
+    from app.services import vectorstore
+
+    directory = os.path.join(workdir, f"hnsw_{config['max_neighbors']}_{config['ef_construction']}")
+    store_client = chromadb.PersistentClient(path=directory)
+    # The smallest ef is the collection's ef_search; larger ones are per-request overrides
+    hnsw = dict(config, space=space, ef_search=min(efs))
+    built_collection, built_index = vectorstore.open_collection(
+        store_client, directory, config={"quantization": "none"}, hnsw=hnsw)
+    ids = [str(i) for i in range(len(vectors))]
+    batch_size = store_client.get_max_batch_size()
+    started = time.perf_counter()
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        vectorstore.add_batch(built_collection, built_index, ids[start:end], ids[start:end],
+                              [{"row": i} for i in range(start, min(end, len(ids)))], vectors[start:end])
+    build_seconds = time.perf_counter() - started
+    vectorstore.activate(store_client, built_collection, built_index)
+
+    rows = []
+    for ef in efs:
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            embedding = query.tolist()
+            started = time.perf_counter()
+            found = vectorstore.search("", k, query_embedding=embedding, ef=ef)["ids"][0]
+            latencies.append(time.perf_counter() - started)
+            hits += len({int(i) for i in found} & expected)
+        summary = common.latency_summary(latencies)
+        rows.append({
+            "m": config["max_neighbors"],
+            "construction_ef": config["ef_construction"],
+            "search_ef": ef,
+            "recall_at_k": hits / (k * len(queries)),
+            "query_p50_ms": summary["p50_ms"],
+            "query_p95_ms": summary["p95_ms"],
+            "build_seconds": build_seconds,
+        })
+    store_client.close()
+    shutil.rmtree(directory, ignore_errors=True)
+    return rows
+
+
+def print_table(rows: List[Dict]):
+    header = f"{'M':>4} {'constr_ef':>9} {'search_ef':>9} {'recall':>7} {'p50ms':>7} {'p95ms':>7} {'build_s':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['m']:>4} {row['construction_ef']:>9} {row['search_ef']:>9} {row['recall_at_k']:>7.3f} "
+              f"{row['query_p50_ms']:>7.2f} {row['query_p95_ms']:>7.2f} {row['build_seconds']:>8.1f}")
+
+
+def _csv_ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HNSW index settings: recall vs query latency.")
+    parser.add_argument("--vectors", type=int, default=50000, help="Synthetic vectors to index.")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--embed-corpus", type=int, default=0,
+                        help="Embed N synthetic documents with the real model instead of random vectors.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=7)
+    parser.add_argument("--space", default="l2", help="HNSW distance space: l2, cosine or ip.")
+    parser.add_argument("--configs", default="8:50,16:100,32:200",
+                        help="Comma-separated 'M:construction_ef' pairs.")
+    parser.add_argument("--efs", type=_csv_ints, default=[10, 20, 50, 100, 200, 400],
+                        help="Search ef values to sweep (per-request overrides).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "hnsw.json"))
+    args = parser.parse_args(argv)
+
+    workdir = common.configure_environment()
+    if args.embed_corpus:
+        vectors, queries = corpus_vectors(args.embed_corpus, args.queries, args.seed)
+    else:
+        vectors, queries = synthetic_vectors(args.vectors, args.dim, args.queries, args.seed)
+    # Unit vectors rank the same under l2, cosine and inner product
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}, space={args.space}\n")
+
+    rows = []
+    for value in args.configs.split(","):
+        config = parse_config(value.strip())
+        print(f"Building M={config['max_neighbors']} construction_ef={config['ef_construction']}...")
+        rows.extend(evaluate(vectors, queries, truth, config, sorted(args.efs), args.space, args.k, workdir))
+
+    print()
+    print_table(rows)
+    common.write_json(args.output, {
+        "environment": common.environment_info(),
+        "vectors": len(vectors),
+        "dim": int(vectors.shape[1]),
+        "k": args.k,
+        "space": args.space,
+        "results": rows,
+    })
+    print(f"\nResults written to {args.output}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Memory saved versus recall lost for the compressed vector representations.
+
+Builds a `QuantizedIndex` for each configuration over the same vectors and
+compares its top-k against exact float32 search. Vectors are either synthetic
+(clustered, unit-length, like sentence embeddings) or real embeddings of the
+synthetic corpus. Run from the `backend` directory:
+
+    python -m benchmarks.quantization --vectors 100000
+    python -m benchmarks.quantization --embed-corpus 300 --k 5
+    python -m benchmarks.quantization --configs sq8,pq:16,pq:48 --rescore-factors 1,4,10
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from . import common, corpus
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def synthetic_vectors(count: int, dim: int, queries: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Unit vectors around random topic centres, plus queries perturbed from stored vectors."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, count // 100), dim))
+    vectors = centres[rng.integers(len(centres), size=count)] + 0.7 * rng.normal(size=(count, dim))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    picked = vectors[rng.choice(count, queries, replace=False)]
+    query_vectors = picked + 0.05 * rng.normal(size=picked.shape)
+    return vectors, query_vectors.astype(np.float32)
+
+
+def corpus_vectors(num_docs: int, queries: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Embeds chunks and questions of the synthetic corpus with the configured model."""
+    from app.config import settings
+    from app.services import chunking, embeddings
+
+    documents = corpus.generate_corpus(num_docs, seed=seed)
+    texts = [chunk["chunk_text"] for doc in documents
+             for chunk in chunking.chunk_text(doc["text"], settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)]
+    questions = [q["question"] for q in corpus.generate_questions(documents, queries, seed)]
+    return (np.asarray(embeddings.embed_texts(texts), dtype=np.float32),
+            np.asarray(embeddings.embed_texts(questions), dtype=np.float32))
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    norms = (vectors ** 2).sum(axis=1)
+    truth = []
+    for query in queries:
+        distances = norms - 2 * vectors @ query
+        truth.append(set(np.argpartition(distances, k - 1)[:k].tolist()))
+    return truth
+
+
+def parse_config(value: str) -> Dict:
+    method, _, subspaces = value.partition(":")
+    return {"method": method, "subspaces": int(subspaces) if subspaces else 16}
+
+
+def evaluate(vectors: np.ndarray, queries: np.ndarray, truth: List[set], config: Dict,
+             rescore_factors: List[int], k: int, workdir: str) -> List[Dict]:
+    from app.services import quantization
+
+    directory = tempfile.mkdtemp(dir=workdir)
+    index = quantization.QuantizedIndex(directory, method=config["method"], subspaces=config["subspaces"])
+    ids = [str(i) for i in range(len(vectors))]
+    started = time.perf_counter()
+    for start in range(0, len(vectors), 1000):
+        index.add(ids[start:start + 1000], vectors[start:start + 1000])
+    build_seconds = time.perf_counter() - started
+    stats = index.stats()
+
+    rows = []
+    for factor in rescore_factors:
+        index.config["rescore_factor"] = factor
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            found, _ = index.search(query, k, rescore=factor > 1)
+            latencies.append(time.perf_counter() - started)
+            hits += len({int(i) for i in found} & expected)
+        rows.append({
+            "method": config["method"] if config["method"] == "sq8" else f"pq:{config['subspaces']}",
+            "rescore_factor": factor,
+            "recall_at_k": hits / (k * len(queries)),
+            "bytes_per_vector": stats["code_bytes_per_vector"],
+            "ram_mb": stats["ram_bytes"] / (1024 * 1024),
+            "memory_saved_pct": 100 * (1 - stats["ram_bytes"] / stats["float32_bytes"]),
+            "build_seconds": build_seconds,
+            **{f"query_{key}": value for key, value in common.latency_summary(latencies).items()
+               if key in ("p50_ms", "p95_ms")},
+        })
+    shutil.rmtree(directory, ignore_errors=True)
+    return rows
+
+
+def print_table(rows: List[Dict], float32_mb: float):
+    header = (f"{'method':<8} {'rescore':>7} {'recall':>7} {'B/vec':>6} {'ram_mb':>8} "
+              f"{'saved%':>7} {'p50ms':>7} {'p95ms':>7} {'build_s':>8}")
+    print(header)
+    print("-" * len(header))
+    print(f"{'float32':<8} {'-':>7} {1.0:>7.3f} {'':>6} {float32_mb:>8.1f} {0.0:>7.1f}")
+    for row in rows:
+        print(f"{row['method']:<8} {row['rescore_factor']:>7} {row['recall_at_k']:>7.3f} "
+              f"{row['bytes_per_vector']:>6} {row['ram_mb']:>8.1f} {row['memory_saved_pct']:>7.1f} "
+              f"{row['query_p50_ms']:>7.2f} {row['query_p95_ms']:>7.2f} {row['build_seconds']:>8.1f}")
+
+
+def _csv_ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quantized vector storage: memory vs recall.")
+    parser.add_argument("--vectors", type=int, default=50000, help="Synthetic vectors to index.")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--embed-corpus", type=int, default=0,
+                        help="Embed N synthetic documents with the real model instead of random vectors.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=7)
+    parser.add_argument("--configs", default="sq8,pq:16,pq:48",
+                        help="Comma-separated methods, 'pq:<subspaces>' for product quantization.")
+    parser.add_argument("--rescore-factors", type=_csv_ints, default=[1, 4, 10],
+                        help="Shortlist sizes as multiples of k; 1 means no exact re-scoring.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "quantization.json"))
+    args = parser.parse_args(argv)
+
+    workdir = common.configure_environment()
+    if args.embed_corpus:
+        vectors, queries = corpus_vectors(args.embed_corpus, args.queries, args.seed)
+    else:
+        vectors, queries = synthetic_vectors(args.vectors, args.dim, args.queries, args.seed)
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}\n")
+
+    rows = []
+    for value in args.configs.split(","):
+        config = parse_config(value.strip())
+        print(f"Building {value.strip()} index...")
+        rows.extend(evaluate(vectors, queries, truth, config, args.rescore_factors, args.k, workdir))
+
+    float32_mb = vectors.nbytes / (1024 * 1024)
+    print()
+    print_table(rows, float32_mb)
+    common.write_json(args.output, {
+        "environment": common.environment_info(),
+        "vectors": len(vectors),
+        "dim": int(vectors.shape[1]),
+        "k": args.k,
+        "float32_mb": float32_mb,
+        "results": rows,
+    })
+    print(f"\nResults written to {args.output}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
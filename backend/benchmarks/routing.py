@@ -0,0 +1,164 @@
+"""
+Query latency versus number of documents, with and without document routing.
+
+For each document count, builds a Chroma store of synthetic topical documents
+(chunk vectors scattered around a per-document centre, several documents per
+topic) plus its routing index, then times global chunk search against two-stage
+search (top-N documents first, then only their chunks) and reports the recall
+of the routed results against the global ones, for each vector representation.
+Run from the `backend` directory:
+
+    python -m benchmarks.routing
+    python -m benchmarks.routing --docs 100,1000,5000 --chunks-per-doc 30 --top-n 10
+    python -m benchmarks.routing --representations sq8
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from . import common
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def synthetic_documents(num_docs: int, chunks_per_doc: int, dim: int, seed: int):
+    """Unit chunk vectors: topic centre + document offset + chunk noise."""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(max(1, num_docs // 10), dim))
+    doc_centres = topics[rng.integers(len(topics), size=num_docs)] + 0.6 * rng.normal(size=(num_docs, dim))
+    vectors = np.repeat(doc_centres, chunks_per_doc, axis=0) + 0.8 * rng.normal(size=(num_docs * chunks_per_doc, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def build_store(directory: str, vectors: np.ndarray, chunks_per_doc: int):
+    import chromadb
+    from app.services import routing, vectorstore
+
+    store_client = chromadb.PersistentClient(path=directory)
+    built_collection, built_index = vectorstore.open_collection(store_client, directory)
+    built_documents = vectorstore.open_documents(store_client)
+    batch_size = store_client.get_max_batch_size()
+    num_docs = len(vectors) // chunks_per_doc
+    ids = [f"d{doc}_{chunk}" for doc in range(num_docs) for chunk in range(chunks_per_doc)]
+    metadatas = [{"upload_id": f"d{doc}", "filename": f"d{doc}.txt", "chunk_index": chunk}
+                 for doc in range(num_docs) for chunk in range(chunks_per_doc)]
+    started = time.perf_counter()
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        vectorstore.add_batch(built_collection, built_index, ids[start:end], ids[start:end],
+                              metadatas[start:end], vectors[start:end])
+    for doc in range(num_docs):
+        profile = routing.DocumentProfile()
+        profile.add(vectors[doc * chunks_per_doc:(doc + 1) * chunks_per_doc])
+        routing.index_document(f"d{doc}", f"d{doc}.txt", profile, built_documents)
+    build_seconds = time.perf_counter() - started
+    vectorstore.activate(store_client, built_collection, built_index, built_documents)
+    return store_client, build_seconds
+
+
+def measure(num_docs: int, representation: str, args, workdir: str) -> Dict:
+    from app.config import settings
+    from app.services import routing, vectorstore
+
+    settings.VECTOR_QUANTIZATION = representation
+    vectors = synthetic_documents(num_docs, args.chunks_per_doc, args.dim, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    # Paraphrase-like queries: a chunk moved by noise of norm ~0.3
+    queries = queries + (0.3 / np.sqrt(args.dim)) * rng.normal(size=queries.shape).astype(np.float32)
+
+    directory = os.path.join(workdir, f"routing_{representation}_{num_docs}")
+    store_client, build_seconds = build_store(directory, vectors, args.chunks_per_doc)
+
+    global_latencies, routed_latencies, hits = [], [], 0
+    for query in queries:
+        embedding = query.tolist()
+        started = time.perf_counter()
+        expected = vectorstore.search("", args.k, query_embedding=embedding)["ids"][0]
+        global_latencies.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        found = routing.search("", args.k, query_embedding=embedding)["ids"][0]
+        routed_latencies.append(time.perf_counter() - started)
+        hits += len(set(expected) & set(found))
+
+    store_client.close()
+    shutil.rmtree(directory, ignore_errors=True)
+    global_summary = common.latency_summary(global_latencies)
+    routed_summary = common.latency_summary(routed_latencies)
+    return {
+        "representation": representation,
+        "documents": num_docs,
+        "chunks": len(vectors),
+        "build_seconds": build_seconds,
+        "global_p50_ms": global_summary["p50_ms"],
+        "global_p95_ms": global_summary["p95_ms"],
+        "routed_p50_ms": routed_summary["p50_ms"],
+        "routed_p95_ms": routed_summary["p95_ms"],
+        "recall_vs_global": hits / (args.k * len(queries)),
+    }
+
+
+def print_table(rows: List[Dict]):
+    header = (f"{'repr':<5} {'docs':>6} {'chunks':>8} {'global p50':>10} {'global p95':>10} "
+              f"{'routed p50':>10} {'routed p95':>10} {'speedup':>8} {'recall':>7}")
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        speedup = row["global_p50_ms"] / row["routed_p50_ms"] if row["routed_p50_ms"] else 0.0
+        print(f"{row['representation']:<5} {row['documents']:>6} {row['chunks']:>8} {row['global_p50_ms']:>10.2f} {row['global_p95_ms']:>10.2f} "
+              f"{row['routed_p50_ms']:>10.2f} {row['routed_p95_ms']:>10.2f} {speedup:>7.2f}x {row['recall_vs_global']:>7.3f}")
+
+
+def _csv_ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Document routing: query latency vs number of documents.")
+    parser.add_argument("--docs", type=_csv_ints, default=[100, 500, 2000])
+    parser.add_argument("--chunks-per-doc", type=int, default=20)
+    parser.add_argument("--representations", default="none,sq8",
+                        help="Comma-separated VECTOR_QUANTIZATION values to compare.")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=7)
+    parser.add_argument("--top-n", type=int, default=None, help="Documents searched per query (DOC_ROUTING_TOP_N).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "routing.json"))
+    args = parser.parse_args(argv)
+
+    workdir = common.configure_environment()
+    from app.config import settings
+    if args.top_n:
+        settings.DOC_ROUTING_TOP_N = args.top_n
+
+    rows = []
+    for representation in args.representations.split(","):
+        for num_docs in args.docs:
+            print(f"Building {num_docs} documents x {args.chunks_per_doc} chunks ({representation.strip()})...")
+            rows.append(measure(num_docs, representation.strip(), args, workdir))
+
+    print()
+    print_table(rows)
+    common.write_json(args.output, {
+        "environment": common.environment_info(),
+        "chunks_per_doc": args.chunks_per_doc,
+        "dim": args.dim,
+        "k": args.k,
+        "top_n": settings.DOC_ROUTING_TOP_N,
+        "medoids": settings.DOC_ROUTING_MEDOIDS,
+        "results": rows,
+    })
+    print(f"\nResults written to {args.output}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Offline performance benchmark for the KaaS RAG pipeline.
+
+Runs the real chunker, embedding model and Chroma vector store against a
+synthetic corpus, with a stub LLM in place of Groq / flan-t5. Run it from the
+`backend` directory:
+
+    python -m benchmarks.run --docs 200 --queries 200 --concurrency 8
+    python -m benchmarks.run --save-baseline      # record benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.15
+
+The embedding model must already be in the local Hugging Face cache.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from . import common, corpus
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# Which way is "better" for each metric compared against the baseline
+METRIC_DIRECTIONS = {
+    "ingest_docs_per_sec": "higher",
+    "ingest_chunks_per_sec": "higher",
+    "query_p50_ms": "lower",
+    "query_p95_ms": "lower",
+    "query_p99_ms": "lower",
+    "peak_rss_mb": "lower",
+    "startup_seconds": "lower",
+}
+
+STARTUP_SCRIPT = (
+    "from app.main import app\n"
+    "from app.services import vectorstore\n"
+    "vectorstore.init_vectorstore()\n"
+)
+
+
+def measure_startup(workdir: str) -> float:
+    """Wall-clock time for a fresh interpreter to import the app and open the vector store."""
+    env = dict(os.environ)
+    env["CHROMA_DB_DIR"] = os.path.join(workdir, "startup_chroma_db")
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=BACKEND_DIR, env=env, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - started
+
+
+def run_ingestion(docs, workdir: str):
+    """Ingests the corpus through the real pipeline and returns (elapsed_seconds, chunk_count)."""
+    from app import db
+    from app.api import ingestion
+    from app.services import vectorstore
+
+    staging = os.path.join(workdir, "staging")
+    os.makedirs(staging, exist_ok=True)
+
+    started = time.perf_counter()
+    session = db.SessionLocal()
+    try:
+        for doc in docs:
+            upload_id = str(uuid.uuid4())
+            file_path = os.path.join(staging, f"{upload_id}_{doc['filename']}")
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write(doc["text"])
+            session.add(db.Upload(id=upload_id, filename=doc["filename"]))
+            session.commit()
+            ingestion.ingest_document(file_path, doc["filename"], upload_id)
+    finally:
+        session.close()
+    elapsed = time.perf_counter() - started
+    return elapsed, vectorstore.collection.count()
+
+
+def run_queries(questions, concurrency: int, k: int):
+    """Runs retrieval + (stub) generation for every question at fixed concurrency."""
+    from app.services import retrieval, generation
+
+    def one(question: str) -> float:
+        started = time.perf_counter()
+        docs = retrieval.retrieve_relevant_chunks(question, k=k)
+        generation.generate_answer(question, docs)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, [q["question"] for q in questions]))
+    return latencies, time.perf_counter() - started
+
+
+def flatten(results):
+    """Flat metric view of the results, used for baseline comparison."""
+    return {
+        "ingest_docs_per_sec": results["ingestion"]["docs_per_sec"],
+        "ingest_chunks_per_sec": results["ingestion"]["chunks_per_sec"],
+        "query_p50_ms": results["query"]["p50_ms"],
+        "query_p95_ms": results["query"]["p95_ms"],
+        "query_p99_ms": results["query"]["p99_ms"],
+        "peak_rss_mb": results["peak_rss_mb"],
+        "startup_seconds": results["startup_seconds"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline KaaS pipeline benchmark.")
+    parser.add_argument("--docs", type=int, default=200, help="Number of synthetic documents to ingest.")
+    parser.add_argument("--doc-chars", type=int, default=4000, help="Approximate size of each document.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries to run.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent query workers.")
+    parser.add_argument("--k", type=int, default=7, help="Chunks retrieved per query.")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated LLM latency.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "latest.json"))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed regression as a fraction.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline.")
+    parser.add_argument("--skip-startup", action="store_true", help="Skip the startup-time measurement.")
+    args = parser.parse_args(argv)
+
+    workdir = common.configure_environment()
+
+    from app import db
+    from app.services import vectorstore
+    from . import stub_llm
+
+    db.init_db()
+    vectorstore.init_vectorstore()
+    stub_llm.install(args.llm_latency_ms)
+
+    docs = corpus.generate_corpus(args.docs, args.doc_chars, args.seed)
+    questions = corpus.generate_questions(docs, args.queries, args.seed)
+
+    print(f"Ingesting {len(docs)} synthetic documents...")
+    ingest_seconds, chunk_count = run_ingestion(docs, workdir)
+
+    print(f"Running {len(questions)} queries at concurrency {args.concurrency}...")
+    latencies, query_seconds = run_queries(questions, args.concurrency, args.k)
+
+    startup_seconds = 0.0 if args.skip_startup else measure_startup(workdir)
+
+    summary = common.latency_summary(latencies)
+    results = {
+        "config": vars(args),
+        "environment": common.environment_info(),
+        "ingestion": {
+            "docs": len(docs),
+            "chunks": chunk_count,
+            "seconds": ingest_seconds,
+            "docs_per_sec": len(docs) / ingest_seconds if ingest_seconds else 0.0,
+            "chunks_per_sec": chunk_count / ingest_seconds if ingest_seconds else 0.0,
+        },
+        "query": dict(summary, concurrency=args.concurrency,
+                      throughput_qps=len(latencies) / query_seconds if query_seconds else 0.0),
+        "peak_rss_mb": common.peak_rss_bytes() / (1024 * 1024),
+        "startup_seconds": startup_seconds,
+    }
+    results["metrics"] = flatten(results)
+
+    exit_code = 0
+    if args.save_baseline:
+        common.write_json(args.baseline, results)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        comparison = common.compare_to_baseline(
+            results["metrics"], baseline.get("metrics", {}), METRIC_DIRECTIONS, args.tolerance
+        )
+        results["comparison"] = comparison
+        for row in comparison:
+            flag = "REGRESSION" if row["regression"] else "ok"
+            print(f"{row['metric']:<24} {row['baseline']:>12.2f} -> {row['current']:>12.2f} "
+                  f"({row['change_pct']:+.1f}%) {flag}")
+        if any(row["regression"] for row in comparison):
+            exit_code = 1
+    else:
+        print(f"No baseline found at {args.baseline}; run with --save-baseline to create one.")
+
+    common.write_json(args.output, results)
+    print(json.dumps(results["metrics"], indent=2))
+    print(f"Results written to {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
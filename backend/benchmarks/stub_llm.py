@@ -0,0 +1,38 @@
+import time
+from typing import List
+from langchain_core.documents import Document
+
+
+class StubLLM:
+    """
+    Deterministic stand-in for the generation backend. It sleeps for a fixed
+    latency (to model a remote LLM round trip) and answers with the first line of
+    the top retrieved chunk, so benchmarks never touch the network.
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def __call__(self, question: str, retrieved_docs: List[Document], on_token=None) -> str:
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        if not retrieved_docs:
+            answer = "I'm sorry, but I couldn't find enough information in the documents to answer that question."
+        else:
+            lines = retrieved_docs[0].page_content.strip().splitlines()
+            answer = lines[0] if lines else ""
+        if on_token is not None:
+            for word in answer.split(" "):
+                on_token(word + " ")
+        return answer
+
+
+def install(latency_ms: float = 0.0) -> StubLLM:
+    """Replaces `generation.generate_answer` with a StubLLM and returns it."""
+    from app.services import generation
+
+    stub = StubLLM(latency_ms)
+    generation.generate_answer = stub
+    return stub
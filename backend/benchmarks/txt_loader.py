@@ -0,0 +1,144 @@
+"""
+Benchmark for the streaming TXT loader on a very large synthetic file.
+
+Generates a text file (1 GB by default, mixing ASCII with multi-byte UTF-8) and
+chunks it with the memory-mapped, incrementally decoded loader. Each loader runs
+in its own subprocess so peak RSS is measured in isolation. Run it from the
+`backend` directory:
+
+    python -m benchmarks.txt_loader                      # 1 GB, streaming loader only
+    python -m benchmarks.txt_loader --size-mb 200 --legacy   # also the old read-and-decode path
+
+The legacy path holds the raw bytes, the decoded text and every chunk in memory
+at once, so only enable it for sizes that fit in RAM.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import common
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+WORDS = [
+    "invoice", "shipment", "latency", "request", "database", "replica", "café", "naïve",
+    "résumé", "Zürich", "東京", "データ", "пример", "error", "warning", "timeout", "🚀",
+]
+
+
+def generate_file(path: str, size_mb: int, seed: int = 42):
+    """Writes about `size_mb` MB of log-like lines without holding them in memory."""
+    rng = random.Random(seed)
+    # A pool of lines reused in random order keeps generation fast for 1 GB files
+    lines = []
+    for number in range(2000):
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 25)))
+        lines.append(f"2024-01-01T00:00:{number % 60:02d} [{rng.choice(['INFO', 'WARN'])}] {words}\n")
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            block = "".join(rng.choice(lines) for _ in range(5000))
+            f.write(block)
+            written += len(block.encode("utf-8"))
+
+
+def _legacy_chunks(path: str, chunk_size: int, chunk_overlap: int) -> int:
+    """The previous pipeline: read everything, decode (latin-1 on failure), chunk in memory."""
+    from app.services import chunking
+
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        text = data.decode("latin-1")
+    return len(chunking.chunk_text(text, chunk_size, chunk_overlap))
+
+
+def _streaming_chunks(path: str, chunk_size: int, chunk_overlap: int) -> int:
+    from app.services import chunking, text_loader
+
+    windows = (window["text"] for window in text_loader.iter_text_windows(path))
+    return sum(1 for _ in chunking.chunk_stream(windows, chunk_size, chunk_overlap))
+
+
+LOADERS = {"legacy": _legacy_chunks, "streaming": _streaming_chunks}
+
+
+def run_worker(loader: str, path: str, chunk_size: int, chunk_overlap: int):
+    """Runs one loader in this process and prints its metrics as JSON."""
+    started = time.perf_counter()
+    chunks = LOADERS[loader](path, chunk_size, chunk_overlap)
+    elapsed = time.perf_counter() - started
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    print(json.dumps({
+        "loader": loader,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "mb_per_sec": round(size_mb / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(common.peak_rss_bytes() / (1024 * 1024), 1),
+    }))
+
+
+def measure(loader: str, path: str, chunk_size: int, chunk_overlap: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.txt_loader", "--worker", loader, "--path", path,
+         "--chunk-size", str(chunk_size), "--chunk-overlap", str(chunk_overlap)],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Large TXT file loading benchmark.")
+    parser.add_argument("--size-mb", type=int, default=1024, help="Size of the synthetic file.")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--legacy", action="store_true", help="Also measure the old read-and-decode loader.")
+    parser.add_argument("--path", help="Use an existing file instead of generating one.")
+    parser.add_argument("--worker", choices=sorted(LOADERS), help=argparse.SUPPRESS)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "txt_loader.json"))
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args.worker, args.path, args.chunk_size, args.chunk_overlap)
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="kaas_txt_bench_")
+    path = args.path
+    if path is None:
+        path = os.path.join(workdir, "synthetic.txt")
+        print(f"Generating {args.size_mb} MB synthetic file...")
+        generate_file(path, args.size_mb)
+
+    try:
+        results = {"environment": common.environment_info(),
+                   "file_mb": round(os.path.getsize(path) / (1024 * 1024), 1),
+                   "runs": []}
+        for loader in (["legacy"] if args.legacy else []) + ["streaming"]:
+            print(f"Running {loader} loader...")
+            run = measure(loader, path, args.chunk_size, args.chunk_overlap)
+            results["runs"].append(run)
+            print(f"  {run['chunks']} chunks in {run['seconds']:.1f}s "
+                  f"({run['mb_per_sec']:.1f} MB/s), peak RSS {run['peak_rss_mb']:.0f} MB")
+        counts = {run["chunks"] for run in results["runs"]}
+        if len(counts) > 1:
+            print("WARNING: loaders produced different chunk counts.")
+        common.write_json(args.output, results)
+        print(f"Results written to {args.output}")
+    finally:
+        if args.path is None:
+            os.remove(path)
+            os.rmdir(workdir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
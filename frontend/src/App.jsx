@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import Upload from './pages/Upload';
 import Chat from './pages/Chat';
-import { listDocuments, resetAllData } from './api'; // Import resetAllData
+import { listAllDocuments, resetAllData } from './api'; // Import resetAllData
 
 function App() {
   const [activeTab, setActiveTab] = useState('chat');
@@ -14,8 +14,7 @@ function App() {
       setLoadingDocs(true);
       setDocError('');
       try {
-          const response = await listDocuments();
-          setDocs(response.data);
+          setDocs(await listAllDocuments());
       } catch (error) {
           console.error("Failed to fetch documents:", error);
           setDocError("Could not load document list.");
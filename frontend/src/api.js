@@ -20,12 +20,96 @@ export const uploadFile = (file) => {
   });
 };
 
-export const postQuery = (question, filename = null, k = 7) => {
-  return apiClient.post('/query', { question, filename, k });
+// --- Resumable uploads ---
+// The file is sent in parts, several at a time. A session id is remembered per
+// file, so calling this again after a network failure (or a page reload) only
+// sends the parts the server is missing.
+const UPLOAD_CONCURRENCY = 4;
+const PART_RETRIES = 3;
+
+const sha256Hex = async (buffer) => {
+  // crypto.subtle is only available in secure contexts (https, localhost)
+  if (!window.crypto?.subtle) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+const openUploadSession = async (file, storageKey) => {
+  const savedId = localStorage.getItem(storageKey);
+  if (savedId) {
+    try {
+      const { data } = await apiClient.get(`/uploads/${savedId}`);
+      if (data.status === 'open') return data;
+    } catch (error) {
+      if (error.response?.status !== 404) throw error;
+    }
+  }
+  const { data } = await apiClient.post('/uploads', { filename: file.name, size: file.size });
+  localStorage.setItem(storageKey, data.upload_id);
+  return data;
+};
+
+const putPart = async (uploadId, file, offset, partSize) => {
+  const buffer = await file.slice(offset, offset + partSize).arrayBuffer();
+  const checksum = await sha256Hex(buffer);
+  const headers = { 'Content-Type': 'application/octet-stream' };
+  if (checksum) headers['X-Content-SHA256'] = checksum;
+  for (let attempt = 1; ; attempt++) {
+    try {
+      await apiClient.put(`/uploads/${uploadId}/parts`, buffer, { params: { offset }, headers });
+      return buffer.byteLength;
+    } catch (error) {
+      if (attempt >= PART_RETRIES || (error.response && error.response.status < 500)) throw error;
+      await new Promise((resolve) => setTimeout(resolve, 1000 * attempt));
+    }
+  }
+};
+
+export const uploadFileResumable = async (file, onProgress = () => {}) => {
+  const storageKey = `kaas-upload:${file.name}:${file.size}:${file.lastModified}`;
+  const session = await openUploadSession(file, storageKey);
+  const pending = [...session.missing_offsets];
+  let sent = session.received_bytes;
+  onProgress(sent, file.size);
+
+  const worker = async () => {
+    while (pending.length) {
+      const offset = pending.shift();
+      sent += await putPart(session.upload_id, file, offset, session.part_size);
+      onProgress(sent, file.size);
+    }
+  };
+  await Promise.all(Array.from({ length: UPLOAD_CONCURRENCY }, worker));
+
+  const response = await apiClient.post(`/uploads/${session.upload_id}/complete`);
+  localStorage.removeItem(storageKey);
+  return response;
+};
+
+export const postQuery = (question, filename = null, k = 7, sessionId = null) => {
+  return apiClient.post('/query', { question, filename, k, session_id: sessionId });
+};
+
+export const createSession = () => {
+  return apiClient.post('/sessions');
+};
+
+// The browser revalidates with the ETag, so an unchanged list costs a 304.
+// Pass the X-Next-Cursor header of a response as `cursor` to get the next page.
+export const listDocuments = ({ cursor = null, limit = 100, prefix = null } = {}) => {
+  return apiClient.get('/documents', { params: { cursor, limit, prefix } });
 };
 
-export const listDocuments = () => {
-  return apiClient.get('/documents');
+// Every document, following the cursor page by page
+export const listAllDocuments = async ({ prefix = null } = {}) => {
+  const documents = [];
+  let cursor = null;
+  do {
+    const response = await listDocuments({ cursor, limit: 500, prefix });
+    documents.push(...response.data);
+    cursor = response.headers['x-next-cursor'] || null;
+  } while (cursor);
+  return documents;
 };
 
 
@@ -65,12 +65,26 @@ function DocList({ docs, loading, error, onRefresh }) {
             )}
             <ul>
                 {docs.map(doc => (
-                    <li key={doc.id}>{doc.filename}</li>
+                    <li key={doc.id}>
+                        {doc.filename}
+                        <span className="doc-stats">{formatStats(doc)}</span>
+                    </li>
                 ))}
             </ul>
         </div>
     );
 }
 
+function formatStats(doc) {
+    if (doc.status && doc.status !== 'ready') {
+        return ` (${doc.status})`;
+    }
+    const parts = [];
+    if (doc.chunk_count != null) parts.push(`${doc.chunk_count} chunks`);
+    if (doc.page_count != null) parts.push(`${doc.page_count} pages`);
+    if (doc.byte_size != null) parts.push(`${(doc.byte_size / 1024).toFixed(1)} KB`);
+    return parts.length ? ` (${parts.join(', ')})` : '';
+}
+
 export default DocList;
 
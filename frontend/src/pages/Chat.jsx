@@ -1,5 +1,5 @@
-import React, { useState } from 'react';
-import { postQuery } from '../api';
+import React, { useState, useEffect } from 'react';
+import { postQuery, createSession } from '../api';
 import DocList from '../components/DocList'; // Import DocList
 
 function Chat({ docs, loadingDocs, docError, onRefreshDocs }) { // Receive props from App.jsx
@@ -7,6 +7,22 @@ function Chat({ docs, loadingDocs, docError, onRefreshDocs }) { // Receive props
   const [messages, setMessages] = useState([]);
   const [loading, setLoading] = useState(false);
   const [selectedDoc, setSelectedDoc] = useState(''); // State for the filter dropdown
+  const [sessionId, setSessionId] = useState(null); // Server-side conversation for follow-ups
+
+  const startSession = async () => {
+    try {
+      const response = await createSession();
+      setSessionId(response.data.session_id);
+      return response.data.session_id;
+    } catch (error) {
+      console.error('Failed to create chat session:', error);
+      return null;
+    }
+  };
+
+  useEffect(() => {
+    startSession();
+  }, []);
 
   const handleQuerySubmit = async (e) => {
     e.preventDefault();
@@ -20,7 +36,15 @@ function Chat({ docs, loadingDocs, docError, onRefreshDocs }) { // Receive props
     try {
       // Pass the selected document filename to the API call
       const filename = selectedDoc === 'all' ? null : selectedDoc;
-      const response = await postQuery(query, filename);
+      let response;
+      try {
+        response = await postQuery(query, filename, 7, sessionId);
+      } catch (error) {
+        // Sessions expire after being idle; start a new one and retry once
+        if (error.response?.status !== 404 || !sessionId) throw error;
+        const newSessionId = await startSession();
+        response = await postQuery(query, filename, 7, newSessionId);
+      }
       const { answer, sources } = response.data;
       const assistantMessage = { sender: 'assistant', text: answer, sources };
       setMessages(prev => [...prev, assistantMessage]);
@@ -69,6 +93,11 @@ function Chat({ docs, loadingDocs, docError, onRefreshDocs }) { // Receive props
                 {msg.sources.map((source, idx) => (
                   <div key={idx} className="source">
                     <strong>{source.filename} (chunk: {source.chunk_index})</strong>
+                    {source.duplicates && source.duplicates.length > 0 && (
+                      <div className="source-duplicates">
+                        Also in: {source.duplicates.map((d) => `${d.filename} (chunk: ${d.chunk_index})`).join(', ')}
+                      </div>
+                    )}
                     <pre>{source.snippet}</pre>
                   </div>
                 ))}
@@ -1,5 +1,5 @@
 import React, { useState } from 'react';
-import { uploadFile } from '../api';
+import { uploadFileResumable } from '../api';
 
 function Upload({ onUploadSuccess }) { // Receive the callback function as a prop
   const [selectedFile, setSelectedFile] = useState(null);
@@ -21,7 +21,10 @@ function Upload({ onUploadSuccess }) { // Receive the callback function as a pro
     setMessage(`Uploading ${selectedFile.name}...`);
 
     try {
-      const response = await uploadFile(selectedFile);
+      // Uploading the same file again resumes where a failed attempt stopped
+      const response = await uploadFileResumable(selectedFile, (sent, total) => {
+        setMessage(`Uploading ${selectedFile.name}... ${Math.floor((100 * sent) / total)}%`);
+      });
       setMessage(`✅ Success: ${response.data.filename} is being processed. (ID: ${response.data.upload_id})`);
       
       // Call the success handler passed from the parent App component
@@ -41,9 +44,9 @@ function Upload({ onUploadSuccess }) { // Receive the callback function as a pro
 
   return (
     <div className="upload-container">
-      <h2>Upload a PDF or TXT Document</h2>
+      <h2>Upload a Document</h2>
       <p>The content will be chunked, embedded, and stored for querying.</p>
-      <input type="file" onChange={handleFileChange} accept=".pdf,.txt" disabled={uploading} />
+      <input type="file" onChange={handleFileChange} accept=".pdf,.docx,.html,.htm,.md,.markdown,.csv,.tsv,.jsonl,.ndjson,.txt" disabled={uploading} />
       <button onClick={handleUpload} disabled={uploading || !selectedFile}>
         {uploading ? 'Uploading...' : 'Upload'}
       </button>
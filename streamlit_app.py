@@ -1,18 +1,22 @@
-import streamlit as st
+import json
 import os
 import uuid
-import time
-from backend.app.services import (
-    pdf_loader,
-    text_loader,
-    chunking,
-    vectorstore,
-    retrieval,
-    generation
-)
-from backend.app import db
-from backend.app.config import settings
-from sqlalchemy.orm import Session
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# The Streamlit app is a thin client of the FastAPI service: ingestion, retrieval
+# and generation (and the models they load) stay in the API process.
+API_URL = os.environ.get("KAAS_API_URL", "http://localhost:8000").rstrip("/")
+# Every user of this process shares its IP; with a key from the API's
+# RATE_LIMIT_API_KEYS, each user gets their own rate limit via X-Client-Id
+API_KEY = os.environ.get("KAAS_API_KEY")
+REQUEST_TIMEOUT = (5, 60)  # connect, read
+DOCUMENT_LIST_TTL_SECONDS = 10
+STATUS_POLL_SECONDS = 2
+SUPPORTED_TYPES = ["pdf", "docx", "html", "htm", "md", "markdown", "csv", "tsv", "jsonl", "ndjson", "txt"]
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -21,121 +25,191 @@ st.set_page_config(
     layout="wide",
 )
 
-# --- Database Session ---
-# Create a session for the Streamlit app to use
+# --- HTTP Session ---
+# One pooled session for all users of this Streamlit process; idempotent
+# requests are retried on connection errors and 502/503/504
 @st.cache_resource
-def get_db_session():
-    return next(db.get_db())
-
-DB_SESSION = get_db_session()
-
-# Initilalize vector store at the start
-vectorstore.init_vectorstore()
+def get_http() -> requests.Session:
+    http = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                  allowed_methods=("GET",), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    http.mount("http://", adapter)
+    http.mount("https://", adapter)
+    return http
+
+def api_headers() -> dict:
+    headers = {"X-Client-Id": st.session_state.client_id}
+    if API_KEY:
+        headers["X-API-Key"] = API_KEY
+    return headers
+
+def api(method: str, path: str, **kwargs) -> requests.Response:
+    response = get_http().request(method, f"{API_URL}{path}", timeout=kwargs.pop("timeout", REQUEST_TIMEOUT),
+                                  headers=api_headers(), **kwargs)
+    response.raise_for_status()
+    return response
+
+def error_detail(error: Exception) -> str:
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return str(response.json().get("detail", response.text))
+        except ValueError:
+            return response.text or str(error)
+    return str(error)
 
 # --- Session State Initialization ---
+if "client_id" not in st.session_state:
+    st.session_state.client_id = str(uuid.uuid4())
 if "messages" not in st.session_state:
     st.session_state.messages = []
-if "uploaded_files" not in st.session_state:
-    st.session_state.uploaded_files = []
+if "pending_uploads" not in st.session_state:
+    st.session_state.pending_uploads = {}  # upload_id -> filename
+if "pending_jobs" not in st.session_state:
+    st.session_state.pending_jobs = {}  # job_id -> filename
+if "submitted_files" not in st.session_state:
+    st.session_state.submitted_files = set()
 
 # --- Helper Functions ---
-def get_all_uploads():
-    """Fetches the list of all uploaded documents from the database."""
-    return DB_SESSION.query(db.Upload).all()
-
-def refresh_uploads():
-    """Refreshes the list of uploaded files in the session state."""
-    st.session_state.uploaded_files = get_all_uploads()
+# Shared by every user for a few seconds, so reruns don't each hit the API
+@st.cache_data(ttl=DOCUMENT_LIST_TTL_SECONDS, show_spinner=False)
+def list_documents() -> list:
+    """Fetches every uploaded document, following the listing's pagination cursor."""
+    documents, cursor = [], None
+    while True:
+        response = api("GET", "/documents", params={"limit": 500, "cursor": cursor})
+        documents.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return documents
+
+def upload_document(uploaded_file):
+    """Hands the file to the API, which ingests it in the background."""
+    try:
+        response = api("POST", "/upload", files={"file": (uploaded_file.name, uploaded_file, uploaded_file.type)})
+        st.session_state.pending_uploads[response.json()["upload_id"]] = uploaded_file.name
+        list_documents.clear()
+    except requests.RequestException as e:
+        st.error(f"Failed to upload '{uploaded_file.name}': {error_detail(e)}")
 
 def delete_document(upload_id: str, filename: str):
-    """Deletes a document from the vector store and the database."""
+    """Deletes a document; the API does it in a background job."""
     try:
-        # 1. Delete from vector store
-        vectorstore.delete_by_upload_id(upload_id)
-
-        # 2. Delete from SQL database
-        upload_to_delete = DB_SESSION.query(db.Upload).filter(db.Upload.id == upload_id).first()
-        if upload_to_delete:
-            DB_SESSION.delete(upload_to_delete)
-            DB_SESSION.commit()
-
-        st.toast(f"Successfully deleted '{filename}'")
-        refresh_uploads()
-    except Exception as e:
-        st.error(f"Failed to delete '{filename}': {e}")
+        job = api("DELETE", f"/documents/{upload_id}").json()
+        st.session_state.pending_jobs[job["job_id"]] = filename
+        st.toast(f"Deleting '{filename}'...")
+    except requests.RequestException as e:
+        st.error(f"Failed to delete '{filename}': {error_detail(e)}")
+
+@st.fragment(run_every=STATUS_POLL_SECONDS)
+def background_work_status():
+    """Polls the uploads and deletes this user started until they finish."""
+    finished = False
+    for upload_id, filename in list(st.session_state.pending_uploads.items()):
+        try:
+            document = api("GET", f"/documents/{upload_id}").json()
+        except requests.RequestException:
+            continue
+        if document["status"] == "ready":
+            st.toast(f"Successfully ingested '{filename}' ({document['chunk_count']} chunks)")
+        elif document["status"] == "failed":
+            st.error(f"Ingestion of '{filename}' failed: {document['error']}")
+        else:
+            st.caption(f"⏳ {filename}: {document['status']}...")
+            continue
+        del st.session_state.pending_uploads[upload_id]
+        finished = True
+
+    for job_id, filename in list(st.session_state.pending_jobs.items()):
+        try:
+            job = api("GET", f"/jobs/{job_id}").json()
+        except requests.RequestException:
+            continue
+        if job["status"] == "succeeded":
+            st.toast(f"Successfully deleted '{filename}'")
+        elif job["status"] == "failed":
+            st.error(f"Failed to delete '{filename}': {job['error']}")
+        else:
+            st.caption(f"🗑️ Deleting {filename}...")
+            continue
+        del st.session_state.pending_jobs[job_id]
+        finished = True
+
+    if finished:
+        list_documents.clear()
+        st.rerun()
+
+def stream_answer(question: str, answer: dict):
+    """
+    Yields the answer from `/query/stream` as it is generated. Fills `answer`
+    with the sources and the final text.
+    """
+    response = get_http().post(f"{API_URL}/query/stream", json={"question": question, "k": 7},
+                               headers=api_headers(), stream=True, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            event = json.loads(line[len("data:"):])
+            if event["type"] == "sources":
+                answer["sources"] = event["sources"]
+            elif event["type"] == "token":
+                yield event["text"]
+            elif event["type"] == "done":
+                answer["text"] = event["answer"]
+            elif event["type"] == "error":
+                raise RuntimeError(event["detail"])
+
+def format_sources(sources: list) -> str:
+    text = "\n\n**Sources:**\n"
+    for source in sources:
+        text += f"\n- **{source.get('filename', 'N/A')}** (chunk{source.get('chunk_index', 'N/A')})\n"
+        for duplicate in source.get("duplicates", []):
+            text += f"  - also in **{duplicate['filename']}** (chunk{duplicate['chunk_index']})\n"
+    return text
 
 with st.sidebar:
     st.title("📄 Document Management")
     st.markdown("Upload new documents and manage existing ones.")
 
-    # File Uploader 
+    # File Uploader
     uploaded_file = st.file_uploader(
-        "Upload a PDF or TXT document", type=['pdf', 'txt'], accept_multiple_files=False
+        "Upload a document",
+        type=SUPPORTED_TYPES,
+        accept_multiple_files=False
     )
-    if uploaded_file is not None:
-        with st.spinner(f"Processing '{uploaded_file.name}'..."):
-            upload_id = str(uuid.uuid4())
-
-            # Save file temporarily to disk for processing
-            storage_path = "./storage"
-            if not os.path.exists(storage_path):
-                os.makedirs(storage_path)
-            file_path = os.path.join(storage_path, f"{upload_id}_{uploaded_file.name}")
-
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-
-
-            # --- Ingestion Pipeline ---
-            try:
-                # 1. Record the upload in the database
-                new_upload = db.Upload(id=upload_id, filename =uploaded_file.name)
-                DB_SESSION.add(new_upload)
-                DB_SESSION.commit()
-
-                # 2. Extract text
-                if uploaded_file.name.lower().endswith(".pdf"):
-                    text = pdf_loader.extract_text_from_pdf(open(file_path, "rb").read())
-                else:
-                    text = text_loader.extract_text_from_txt(open(file_path, "rb").read())
-
-                # 3. Chunk text
-                chunks = chunking.chunk_text(text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
-
-                # 4. Embed and upsert chunks
-                if chunks:
-                    vectorstore.upsert_chunks(upload_id, uploaded_file.name, chunks)
-                    st.toast(f" Successfully ingested '{uploaded_file.name}")
-                else:
-                    st.warnings(f"No text chunks were extracted from '{uploaded_file.name}'.")
-                
-                refresh_uploads()
-            
-            except Exception as e:
-                st.error(f'An error occured during ingestion: {e}')
-            finally:
-                # Clean up the temporary file
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+    # The uploader keeps its file across reruns; send each file once
+    if uploaded_file is not None and uploaded_file.file_id not in st.session_state.submitted_files:
+        st.session_state.submitted_files.add(uploaded_file.file_id)
+        upload_document(uploaded_file)
+
+    background_work_status()
 
     st.divider()
 
     # Document List
     st.subheader("Uploaded Documents")
-    refresh_uploads_button = st.button("Refresh List 🔄")
-    if refresh_uploads_button:
-        refresh_uploads()
+    if st.button("Refresh List 🔄"):
+        list_documents.clear()
 
-    if not st.session_state.uploaded_files:
+    try:
+        documents = list_documents()
+    except requests.RequestException as e:
+        documents = []
+        st.error(f"Could not reach the KaaS API at {API_URL}: {error_detail(e)}")
+
+    if not documents:
         st.info("No documents uploaded yet.")
     else:
-        for upload in st.session_state.uploaded_files:
+        for document in documents:
             col1, col2 = st.columns([0.8, 0.2])
             with col1:
-                st.write(f"📄 {upload.filename}")
+                st.write(f"📄 {document['filename']}")
             with col2:
-                if st.button("🗑️", key=f"del_{upload.id}", help=f"Delete {upload.filename}"):
-                    delete_document(upload.id, upload.filename)
+                if st.button("🗑️", key=f"del_{document['id']}", help=f"Delete {document['filename']}"):
+                    delete_document(document["id"], document["filename"])
 
 #  --- Main Chat Interface ---
 st.title(" Knowledge as a Service (KaaS)")
@@ -154,42 +228,21 @@ if prompt := st.chat_input("What would you like to know?"):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Display assistant response in chat message container
+    # Display assistant response in chat message container, as it streams in
     with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        with st.spinner("Thinking..."):
-            try:
-                # 1. Retrieve relevant chunks
-                retrieved_docs = retrieval.retrieve_relevant_chunks(prompt, k=7)
-
-                if not retrieved_docs:
-                    full_response = "I couldn't find any relevant information in your documents to answer that question."
-                else:
-                    # 2. Generate an answer
-                    answer = generation.generate_answer(prompt, retrieved_docs)
-
-                    # 3. Format the response with sources
-                    full_response = answer
-                    full_response += "\n\n**Sources:**\n"
-
-                    # Only show top 3 sources in the UI
-                    sources_to_show = retrieved_docs[:3]
-
-                    for doc in sources_to_show:
-                        filename = doc.metadata.get("filename", "N/A")
-                        chunk_index = doc.metadata.get("chunk_index", "N/A")
-                        full_response += f"\n- **{filename}** (chunk{chunk_index})\n"
-                    
-                message_placeholder.markdown(full_response)
-
-            except Exception as e:
-                full_response = f"An error occured: {e}"
-                message_placeholder.error(full_response)
+        answer = {"sources": [], "text": None}
+        try:
+            streamed = st.write_stream(stream_answer(prompt, answer))
+            # History keeps the final answer, which differs from the streamed text only if
+            # the API switched generation providers midway
+            full_response = answer["text"] if answer["text"] is not None else streamed
+            if answer["sources"]:
+                full_response += format_sources(answer["sources"])
+                st.markdown(format_sources(answer["sources"]))
+
+        except (requests.RequestException, RuntimeError) as e:
+            full_response = f"An error occured: {error_detail(e)}"
+            st.error(full_response)
 
     # Add assistant response to chat history
     st.session_state.messages.append({"role": "assistant", "content": full_response})
-
-# Initial page load - refresh document list 
-if not st.session_state.uploaded_files:
-    refresh_uploads()
-